@@ -1,49 +1,76 @@
+import datetime
+import html
+
 from aiogram import types, Dispatcher
+from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
+from aiogram.utils.exceptions import MessageNotModified
 
+import export
 from config import ADMIN_ID
-from database import (
+import outbox
+from broadcast import get_engine
+from states import BroadcastState, SearchState
+from database import fts_query, SEARCH_CANDIDATES, SNIPPET_OPEN, SNIPPET_CLOSE
+from async_db import (
+    DBSession,
     get_orders_page,
     get_order_by_id,
     update_order_status,
-    get_connection,
+    get_orders_stats,
+    get_order_rollups,
+    get_unban_request,
     get_banned_users,
     get_unban_requests,
     update_unban_request_status,
     unban_user,
+    count_clients,
+    finish_broadcast,
+    export_orders,
+    search_orders,
 )
 from keyboards import (
     get_orders_list_kb,
+    parse_orders_page_callback,
     get_order_actions_kb,
     get_admin_menu,
     get_admin_client_menu,
     get_unban_requests_kb,
     get_unban_actions_kb,
+    get_stats_periods_kb,
+    get_broadcast_cancel_kb,
+    get_broadcast_confirm_kb,
+    get_export_periods_kb,
+    get_export_statuses_kb,
+    get_export_formats_kb,
+    EXPORT_PERIOD_LABELS,
+    EXPORT_STATUS_LABELS,
+    get_search_cancel_kb,
+    get_search_results_kb,
 )
+from services import get_service_by_code
 
 PER_PAGE = 3
 
 
-# ====== ФИЛЬТР: показываем только активные заказы ======
-
-def filter_active_orders(rows):
-    return [o for o in rows if o["status"] in ("new", "in_progress")]
+# ====== СПИСОК ЗАКАЗОВ ======
+# показываем только активные заказы; фильтр по статусу — в SQL
 
+def orders_page_title(page: int, total: int) -> str:
+    pages = max(1, (total + PER_PAGE - 1) // PER_PAGE)
+    return f"📥 <b>Активные заказы</b>\nСтраница {min(page, pages)} из {pages}"
 
-# ====== СПИСОК ЗАКАЗОВ ======
 
 async def admin_all_orders(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
     page = 1
-    rows, total = get_orders_page(page, PER_PAGE)
-
-    active = filter_active_orders(rows)
+    rows, total = await get_orders_page(PER_PAGE)
 
     await message.answer(
-        f"📥 <b>Активные заказы</b>\nСтраница {page}",
-        reply_markup=get_orders_list_kb(active, page, len(active), PER_PAGE),
+        orders_page_title(page, total),
+        reply_markup=get_orders_list_kb(rows, page, total, PER_PAGE),
     )
 
 
@@ -51,14 +78,17 @@ async def admin_orders_page(callback: types.CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         return
 
-    page = int(callback.data.replace("admin_orders_page_", ""))
-    rows, total = get_orders_page(page, PER_PAGE)
+    page, after_id, before_id = parse_orders_page_callback(callback.data)
+    rows, total = await get_orders_page(PER_PAGE, after_id=after_id, before_id=before_id)
 
-    active = filter_active_orders(rows)
+    # список сдвинулся (заказы закрыты) — начинаем с первой страницы
+    if not rows and page > 1:
+        page = 1
+        rows, total = await get_orders_page(PER_PAGE)
 
     await callback.message.edit_text(
-        f"📥 <b>Активные заказы</b>\nСтраница {page}",
-        reply_markup=get_orders_list_kb(active, page, len(active), PER_PAGE),
+        orders_page_title(page, total),
+        reply_markup=get_orders_list_kb(rows, page, total, PER_PAGE),
     )
     await callback.answer()
 
@@ -70,7 +100,7 @@ async def admin_open_order(callback: types.CallbackQuery):
         return
 
     order_id = int(callback.data.replace("admin_order_", ""))
-    order = get_order_by_id(order_id)
+    order = await get_order_by_id(order_id)
 
     if not order:
         await callback.answer("Заказ не найден", show_alert=True)
@@ -100,7 +130,7 @@ async def admin_open_order(callback: types.CallbackQuery):
 
 # ====== ИЗМЕНЕНИЕ СТАТУСА ======
 
-async def admin_change_status(callback: types.CallbackQuery):
+async def admin_change_status(callback: types.CallbackQuery, db: DBSession):
     if callback.from_user.id != ADMIN_ID:
         return
 
@@ -108,14 +138,14 @@ async def admin_change_status(callback: types.CallbackQuery):
     order_id_str, _, status = rest.partition("_")
     order_id = int(order_id_str)
 
-    order = get_order_by_id(order_id)
+    order = await get_order_by_id(order_id)
     if not order:
         await callback.answer("Заказ не найден", show_alert=True)
         return
 
-    update_order_status(order_id, status)
+    await update_order_status(order_id, status)
 
-    # уведомление клиенту
+    # уведомление клиенту — в одной транзакции со сменой статуса
     if order["client_tg_id"]:
         status_text = {
             "in_progress": "В работе 🔧",
@@ -123,10 +153,11 @@ async def admin_change_status(callback: types.CallbackQuery):
             "cancelled": "Отменён ❌",
         }.get(status, status)
 
-        await callback.bot.send_message(
+        await outbox.add(
             order["client_tg_id"],
             f"Ваш заказ #{order_id} обновлён.\nНовый статус: {status_text}",
         )
+    await db.commit()
 
     # если заказ завершён — удаляем карточку и возвращаем в меню
     if status == "done":
@@ -135,8 +166,8 @@ async def admin_change_status(callback: types.CallbackQuery):
         await callback.answer()
         return
 
-    # иначе — перерисовываем карточку
-    order = get_order_by_id(order_id)
+    # иначе — перерисовываем карточку; заказ уже прочитан, меняется только статус
+    order = dict(order, status=status)
     title = order["title"] if order["type"] == "custom" else order["service_code"]
 
     text = (
@@ -165,33 +196,355 @@ async def admin_change_status(callback: types.CallbackQuery):
 
 # ====== СТАТИСТИКА ======
 
+STATUS_NAMES = {
+    "new": "Новые",
+    "in_progress": "В работе",
+    "done": "Завершённые",
+    "cancelled": "Отменённые",
+}
+
+PERIOD_TITLES = {
+    "day": "за сегодня",
+    "week": "за эту неделю",
+    "month": "за этот месяц",
+}
+
+
+def service_title(code: str) -> str:
+    if code == "custom":
+        return "Свой заказ"
+    service = get_service_by_code(code)
+    return service["name"] if service else code
+
+
 async def admin_stats(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    conn = get_connection()
-    cur = conn.cursor()
+    total, rows = await get_orders_stats()
+
+    text = f"📊 <b>Статистика заказов</b>\n\nВсего заказов: <b>{total}</b>\n\n"
+
+    for status, count in rows:
+        text += f"{STATUS_NAMES.get(status, status)}: <b>{count}</b>\n"
+
+    await message.answer(text, reply_markup=get_stats_periods_kb())
+
+
+async def admin_stats_period(callback: types.CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    period = callback.data.replace("admin_stats_", "")
+    if period not in PERIOD_TITLES:
+        await callback.answer()
+        return
+
+    rows = await get_order_rollups(period)
+    by_status = [(key, count) for dimension, key, count in rows if dimension == "status"]
+    by_service = [(key, count) for dimension, key, count in rows if dimension == "service"]
+
+    text = (
+        f"📊 <b>Заказы {PERIOD_TITLES[period]}</b>\n\n"
+        f"Создано: <b>{sum(count for _, count in by_status)}</b>\n\n"
+    )
+    for status, count in by_status:
+        text += f"{STATUS_NAMES.get(status, status)}: <b>{count}</b>\n"
+
+    if by_service:
+        text += "\n<b>По услугам:</b>\n"
+        for code, count in by_service:
+            text += f"{service_title(code)}: <b>{count}</b>\n"
+
+    try:
+        await callback.message.edit_text(text, reply_markup=get_stats_periods_kb())
+    except MessageNotModified:
+        # тот же период нажат повторно
+        pass
+    await callback.answer()
+
+
+# ====== ПОИСК ======
+# запрос и курсоры страниц (score, id) хранятся в данных FSM админа:
+# search_stack — курсоры начала показанных страниц, search_last — конец текущей
+
+SEARCH_PER_PAGE = 5
+
+
+def snippet_html(snippet: str) -> str:
+    # текст в БД частично уже экранирован, а сниппет может разрезать сущность
+    text = html.escape(html.unescape(snippet or ""))
+    return text.replace(SNIPPET_OPEN, "<b>").replace(SNIPPET_CLOSE, "</b>")
+
+
+async def render_search_page(data: dict):
+    """Текст и клавиатура страницы; в data обновляется search_last."""
+    stack = data["search_stack"]
+    after = tuple(stack[-1]) if stack[-1] else None
+
+    rows = await search_orders(data["search_match"], SEARCH_PER_PAGE + 1, after)
+    has_next = len(rows) > SEARCH_PER_PAGE
+    rows = rows[:SEARCH_PER_PAGE]
+    data["search_last"] = [rows[-1]["score"], rows[-1]["id"]] if rows else None
+
+    text = f"🔎 <b>Поиск:</b> {html.escape(data['search_query'])}\nСтраница {len(stack)}\n\n"
+    if not rows:
+        text += "Ничего не найдено."
+    for row in rows:
+        title = row["title"] if row["type"] == "custom" else row["service_code"]
+        text += (
+            f"<b>#{row['id']}</b> — {html.escape(html.unescape(title or ''))} ({row['status']})\n"
+            f"{snippet_html(row['snippet'])}\n\n"
+        )
+    # ранжируются только SEARCH_CANDIDATES самых новых совпадений
+    if rows and not has_next and len(stack) * SEARCH_PER_PAGE >= SEARCH_CANDIDATES:
+        text += "Показаны самые новые совпадения — уточните запрос, чтобы найти более старые."
+
+    return text, get_search_results_kb(rows, len(stack) > 1, has_next)
+
+
+async def admin_search(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    await SearchState.query.set()
+    await message.answer(
+        "🔎 Введите запрос: слова из названия или описания, телефон, имя или username клиента.",
+        reply_markup=get_search_cancel_kb(),
+    )
+
 
-    cur.execute("SELECT COUNT(*) FROM orders")
-    total = cur.fetchone()[0]
+async def admin_search_query(message: types.Message, state: FSMContext):
+    if message.from_user.id != ADMIN_ID:
+        return
 
-    cur.execute("SELECT status, COUNT(*) FROM orders GROUP BY status")
-    rows = cur.fetchall()
-    conn.close()
+    match = fts_query(message.text or "")
+    if not match:
+        await message.answer("Запрос пустой — введите хотя бы одно слово.", reply_markup=get_search_cancel_kb())
+        return
 
-    status_names = {
-        "new": "Новые",
-        "in_progress": "В работе",
-        "done": "Завершённые",
-        "cancelled": "Отменённые",
+    data = {
+        "search_query": message.text,
+        "search_match": match,
+        "search_stack": [None],
     }
+    text, kb = await render_search_page(data)
+    # состояние снимаем, а запрос и курсоры оставляем для листания
+    await state.reset_state(with_data=False)
+    await state.update_data(data)
+    await message.answer(text, reply_markup=kb)
 
-    text = f"📊 <b>Статистика заказов</b>\n\nВсего заказов: <b>{total}</b>\n\n"
 
-    for status, count in rows:
-        text += f"{status_names.get(status, status)}: <b>{count}</b>\n"
+async def admin_search_page(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id != ADMIN_ID:
+        return
 
-    await message.answer(text, reply_markup=get_admin_menu())
+    data = await state.get_data()
+    if "search_match" not in data:
+        await callback.answer("Поиск устарел, начните заново.", show_alert=True)
+        return
+
+    stack = data["search_stack"]
+    if callback.data == "admin_search_next" and data.get("search_last"):
+        stack.append(data["search_last"])
+    elif callback.data == "admin_search_prev" and len(stack) > 1:
+        stack.pop()
+
+    text, kb = await render_search_page(data)
+    await state.update_data(search_stack=stack, search_last=data["search_last"])
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except MessageNotModified:
+        pass
+    await callback.answer()
+
+
+async def admin_search_cancel(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    await state.finish()
+    await callback.message.edit_reply_markup()
+    await callback.message.answer("Поиск отменён.", reply_markup=get_admin_menu())
+    await callback.answer()
+
+
+# ====== РАССЫЛКА ======
+
+async def admin_broadcast(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    total = await count_clients()
+    await BroadcastState.text.set()
+    await message.answer(
+        f"📢 <b>Рассылка</b>\n\nПолучателей: <b>{total}</b>\n"
+        "Отправьте текст сообщения (форматирование сохранится).",
+        reply_markup=get_broadcast_cancel_kb(),
+    )
+
+
+async def admin_broadcast_text(message: types.Message, state: FSMContext):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    if not message.text:
+        await message.answer("Нужен текст сообщения.", reply_markup=get_broadcast_cancel_kb())
+        return
+
+    await state.update_data(broadcast_text=message.html_text)
+    await BroadcastState.confirm.set()
+    await message.answer("Так сообщение увидят клиенты:")
+    await message.answer(message.html_text, reply_markup=get_broadcast_confirm_kb())
+
+
+async def admin_broadcast_start(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    data = await state.get_data()
+    await state.finish()
+
+    text = data.get("broadcast_text")
+    if not text:
+        await callback.answer("Текст рассылки потерян, начните заново.", show_alert=True)
+        return
+
+    # рассылка идёт в фоне, прогресс придёт отдельным сообщением
+    get_engine().start(text, callback.message.chat.id)
+    await callback.message.edit_reply_markup()
+    await callback.message.answer("🚀 Рассылка запущена.", reply_markup=get_admin_menu())
+    await callback.answer()
+
+
+async def admin_broadcast_cancel(callback: types.CallbackQuery, state: FSMContext):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    await state.finish()
+    await callback.message.edit_reply_markup()
+    await callback.message.answer("Рассылка отменена.", reply_markup=get_admin_menu())
+    await callback.answer()
+
+
+async def admin_broadcast_stop(callback: types.CallbackQuery, db: DBSession):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    broadcast_id = int(callback.data.replace("admin_broadcast_stop_", ""))
+    if not get_engine().stop(broadcast_id):
+        # задачи нет (например, упала) — просто закрываем запись
+        await finish_broadcast(broadcast_id, "cancelled")
+        await db.commit()
+        await callback.message.edit_reply_markup()
+    await callback.answer("Рассылка остановится после текущей пачки.")
+
+
+# ====== ВЫГРУЗКА ЗАКАЗОВ ======
+
+EXPORT_USAGE = (
+    "Выгрузка за произвольный период:\n"
+    "<code>/export 2024-01-01 2024-02-01 [статус] [csv|xlsx]</code>\n"
+    f"Статусы: {', '.join(export.STATUS_FILTERS)}"
+)
+
+
+async def send_export(message: types.Message, fmt: str, date_from, date_to, status: str):
+    if fmt == "xlsx" and not export.xlsx_available():
+        await message.answer("XLSX недоступен: не установлен openpyxl. Выберите CSV.")
+        return
+
+    path, count = await export_orders(fmt, date_from, date_to, export.STATUS_FILTERS[status])
+    try:
+        if not count:
+            await message.answer("Заказов с такими условиями нет.")
+        elif path.stat().st_size > export.MAX_DOCUMENT_SIZE:
+            await message.answer("Файл больше 50 МБ — Telegram его не примет. Сузьте период.")
+        else:
+            await message.answer_document(
+                types.InputFile(path, filename=f"orders_{status}.{fmt}"),
+                caption=f"📤 Заказов: <b>{count}</b>",
+            )
+    finally:
+        path.unlink(missing_ok=True)
+
+
+async def admin_export(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    await message.answer(
+        f"📤 <b>Выгрузка заказов</b>\n\nЗа какой период?\n\n{EXPORT_USAGE}",
+        reply_markup=get_export_periods_kb(),
+    )
+
+
+async def admin_export_period(callback: types.CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    period = callback.data.replace("admin_export_p_", "")
+    if period not in export.PERIODS:
+        await callback.answer()
+        return
+
+    await callback.message.edit_text(
+        f"📤 Период: <b>{EXPORT_PERIOD_LABELS[period]}</b>\nКакие заказы?",
+        reply_markup=get_export_statuses_kb(period),
+    )
+    await callback.answer()
+
+
+async def admin_export_status(callback: types.CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    period, _, status = callback.data.replace("admin_export_s_", "").partition("_")
+    if period not in export.PERIODS or status not in export.STATUS_FILTERS:
+        await callback.answer()
+        return
+
+    await callback.message.edit_text(
+        f"📤 Период: <b>{EXPORT_PERIOD_LABELS[period]}</b>, "
+        f"заказы: <b>{EXPORT_STATUS_LABELS[status]}</b>\nФормат файла?",
+        reply_markup=get_export_formats_kb(period, status, export.xlsx_available()),
+    )
+    await callback.answer()
+
+
+async def admin_export_format(callback: types.CallbackQuery):
+    if callback.from_user.id != ADMIN_ID:
+        return
+
+    period, status, fmt = callback.data.replace("admin_export_f_", "").split("_", 2)
+    if period not in export.PERIODS or status not in export.STATUS_FILTERS or fmt not in export.FORMATS:
+        await callback.answer()
+        return
+
+    await callback.answer("Готовлю файл…")
+    await callback.message.edit_reply_markup()
+    await send_export(callback.message, fmt, export.period_start(period), None, status)
+
+
+async def cmd_export(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    args = message.get_args().split()
+    fmt = "csv"
+    status = "all"
+    if args and args[-1] in export.FORMATS:
+        fmt = args.pop()
+    if len(args) == 3 and args[2] in export.STATUS_FILTERS:
+        status = args.pop()
+
+    try:
+        date_from, date_to = (datetime.date.fromisoformat(arg).isoformat() for arg in args)
+    except ValueError:
+        await message.answer(EXPORT_USAGE)
+        return
+
+    await send_export(message, fmt, date_from, date_to, status)
 
 
 # ====== ЧЁРНЫЙ СПИСОК (АДМИН) ======
@@ -200,7 +553,7 @@ async def admin_blacklist(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    banned = get_banned_users()
+    banned = await get_banned_users()
     if not banned:
         await message.answer("🚫 Чёрный список пуст.", reply_markup=get_admin_menu())
         return
@@ -222,7 +575,7 @@ async def admin_unban_requests(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    requests = get_unban_requests(status="pending")
+    requests = await get_unban_requests(status="pending")
     kb = get_unban_requests_kb(requests)
     await message.answer("📨 <b>Заявки на разбан</b>", reply_markup=kb)
 
@@ -241,11 +594,7 @@ async def admin_unban_open(callback: types.CallbackQuery):
 
     req_id = int(callback.data.replace("admin_unban_", ""))
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM unban_requests WHERE id = ?", (req_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = await get_unban_request(req_id)
 
     if not row:
         await callback.answer("Заявка не найдена", show_alert=True)
@@ -265,64 +614,53 @@ async def admin_unban_open(callback: types.CallbackQuery):
     await callback.answer()
 
 
-async def admin_unban_approve(callback: types.CallbackQuery):
+async def admin_unban_approve(callback: types.CallbackQuery, db: DBSession):
     if callback.from_user.id != ADMIN_ID:
         return
 
     req_id = int(callback.data.replace("admin_unban_approve_", ""))
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM unban_requests WHERE id = ?", (req_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = await get_unban_request(req_id)
 
     if not row:
         await callback.answer("Заявка не найдена", show_alert=True)
         return
 
     tg_id = row["tg_id"]
-    unban_user(tg_id)
-    update_unban_request_status(req_id, "approved")
+    await unban_user(tg_id)
+    await update_unban_request_status(req_id, "approved")
 
-    try:
-        await callback.bot.send_message(
-            tg_id,
-            "✅ Ваша заявка на разбан одобрена. Доступ к боту восстановлен.",
-        )
-    except:
-        pass
+    # разбан, заявка и уведомление — одной транзакцией, до запросов к Telegram
+    await outbox.add(
+        tg_id,
+        "✅ Ваша заявка на разбан одобрена. Доступ к боту восстановлен.",
+    )
+    await db.commit()
 
     await callback.message.edit_text("✅ Пользователь разбанен.")
     await callback.answer("Разбан выполнен")
 
 
-async def admin_unban_reject(callback: types.CallbackQuery):
+async def admin_unban_reject(callback: types.CallbackQuery, db: DBSession):
     if callback.from_user.id != ADMIN_ID:
         return
 
     req_id = int(callback.data.replace("admin_unban_reject_", ""))
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM unban_requests WHERE id = ?", (req_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = await get_unban_request(req_id)
 
     if not row:
         await callback.answer("Заявка не найдена", show_alert=True)
         return
 
     tg_id = row["tg_id"]
-    update_unban_request_status(req_id, "rejected")
+    await update_unban_request_status(req_id, "rejected")
 
-    try:
-        await callback.bot.send_message(
-            tg_id,
-            "❌ Ваша заявка на разбан отклонена.",
-        )
-    except:
-        pass
+    await outbox.add(
+        tg_id,
+        "❌ Ваша заявка на разбан отклонена.",
+    )
+    await db.commit()
 
     await callback.message.edit_text("❌ Заявка отклонена.")
     await callback.answer("Отклонено")
@@ -362,11 +700,52 @@ async def admin_back_menu(callback: types.CallbackQuery):
     await callback.answer()
 
 
+# ====== КНОПКИ МЕНЮ ВО ВРЕМЯ ВВОДА ======
+
+# кнопки reply-меню админа и их хендлеры
+ADMIN_MENU_HANDLERS = {
+    "📥 Все заказы": admin_all_orders,
+    "📊 Статистика": admin_stats,
+    "📢 Рассылка": admin_broadcast,
+    "📤 Выгрузка": admin_export,
+    "🔎 Поиск": admin_search,
+    "🚫 Черный список": admin_blacklist,
+    "📨 Заявки на разбан": admin_unban_requests,
+    "👁 Перейти в режим клиента": admin_switch_to_client,
+    "⚙️ Вернуться в админку": admin_back_to_admin,
+}
+
+
+async def admin_menu_during_input(message: types.Message, state: FSMContext):
+    """
+    Кнопка меню, нажатая вместо поискового запроса или текста рассылки:
+    ввод отменяется, кнопка срабатывает как обычно. Иначе её текст ушёл
+    бы в поиск или, после подтверждения, всем клиентам.
+    """
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    await state.finish()
+    await ADMIN_MENU_HANDLERS[message.text](message)
+
+
 # ====== РЕГИСТРАЦИЯ ======
 
 def register_admin_handlers(dp: Dispatcher):
     dp.register_message_handler(admin_all_orders, Text(equals="📥 Все заказы"))
     dp.register_message_handler(admin_stats, Text(equals="📊 Статистика"))
+    dp.register_message_handler(admin_broadcast, Text(equals="📢 Рассылка"))
+    dp.register_message_handler(admin_export, Text(equals="📤 Выгрузка"))
+    dp.register_message_handler(admin_search, Text(equals="🔎 Поиск"))
+    # до хендлеров ввода: кнопка меню — не запрос и не текст рассылки
+    dp.register_message_handler(
+        admin_menu_during_input,
+        Text(equals=list(ADMIN_MENU_HANDLERS)),
+        state=[SearchState.query, BroadcastState.text],
+    )
+    dp.register_message_handler(admin_search_query, state=SearchState.query)
+    dp.register_message_handler(cmd_export, commands=["export"])
+    dp.register_message_handler(admin_broadcast_text, state=BroadcastState.text)
     dp.register_message_handler(admin_blacklist, Text(equals="🚫 Черный список"))
     dp.register_message_handler(admin_unban_requests, Text(equals="📨 Заявки на разбан"))
     dp.register_message_handler(admin_switch_to_client, Text(equals="👁 Перейти в режим клиента"))
@@ -375,9 +754,23 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_callback_query_handler(admin_orders_page, Text(startswith="admin_orders_page_"))
     dp.register_callback_query_handler(admin_open_order, Text(startswith="admin_order_"))
     dp.register_callback_query_handler(admin_change_status, Text(startswith="admin_status_"))
+    dp.register_callback_query_handler(admin_stats_period, Text(startswith="admin_stats_"))
 
     dp.register_callback_query_handler(admin_back_menu, Text(equals="admin_back_menu"))
 
+    dp.register_callback_query_handler(
+        admin_broadcast_start, Text(equals="admin_broadcast_start"), state=BroadcastState.confirm
+    )
+    dp.register_callback_query_handler(admin_broadcast_cancel, Text(equals="admin_broadcast_cancel"), state="*")
+    dp.register_callback_query_handler(admin_broadcast_stop, Text(startswith="admin_broadcast_stop_"))
+
+    dp.register_callback_query_handler(admin_search_page, Text(equals=["admin_search_next", "admin_search_prev"]))
+    dp.register_callback_query_handler(admin_search_cancel, Text(equals="admin_search_cancel"), state="*")
+
+    dp.register_callback_query_handler(admin_export_period, Text(startswith="admin_export_p_"))
+    dp.register_callback_query_handler(admin_export_status, Text(startswith="admin_export_s_"))
+    dp.register_callback_query_handler(admin_export_format, Text(startswith="admin_export_f_"))
+
     # ВАЖНО: сначала approve/reject
     dp.register_callback_query_handler(admin_unban_approve, Text(startswith="admin_unban_approve_"))
     dp.register_callback_query_handler(admin_unban_reject, Text(startswith="admin_unban_reject_"))
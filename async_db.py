@@ -0,0 +1,440 @@
+# async_db.py
+"""
+Асинхронная обёртка над database.py.
+
+sqlite3 — блокирующий драйвер, поэтому вся работа с БД уходит в потоки:
+записи выполняются строго по очереди в одном потоке-писателе, чтения —
+в небольшом пуле читателей. Event loop при этом не ждёт fsync.
+
+Внутри апдейта вызовы идут через DBSession (см. middleware/db_session.py):
+одно соединение на весь апдейт и одна транзакция на все его записи.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import ban_registry
+import database
+import export
+from config import DB_READER_THREADS
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_readers = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="db-reader")
+
+# Очередь к писателю: сессия держит блокировку от первой записи до commit,
+# чтобы чужие записи не упёрлись в её открытую транзакцию в потоке-писателе.
+_write_lock: Optional[asyncio.Lock] = None
+_write_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_write_lock() -> asyncio.Lock:
+    global _write_lock, _write_lock_loop
+    loop = asyncio.get_running_loop()
+    if _write_lock is None or _write_lock_loop is not loop:
+        _write_lock, _write_lock_loop = asyncio.Lock(), loop
+    return _write_lock
+
+
+async def _run(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_read(func, *args, **kwargs):
+    session = current_session()
+    if session is not None:
+        return await session.run_read(func, *args, **kwargs)
+    return await _run(_readers, func, *args, **kwargs)
+
+
+async def run_write(func, *args, **kwargs):
+    session = current_session()
+    if session is not None:
+        return await session.run_write(func, *args, **kwargs)
+    async with _get_write_lock():
+        return await _run(_writer, func, *args, **kwargs)
+
+
+def shutdown(wait: bool = True):
+    _writer.shutdown(wait=wait)
+    _readers.shutdown(wait=wait)
+
+
+# ====== СЕССИЯ АПДЕЙТА ======
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("db_session", default=None)
+
+# служебные выражения транзакции и шаги триггеров ("-- TRIGGER ...")
+# не считаются запросами
+_NOT_QUERIES = ("BEGIN", "COMMIT", "ROLLBACK", "--")
+
+
+class DBSession:
+    """
+    Единица работы на один апдейт.
+
+    Соединение берётся из пула при первом обращении и держится до close().
+    Первая запись открывает BEGIN IMMEDIATE и занимает очередь к писателю;
+    все записи апдейта попадают в одну транзакцию, которая коммитится в
+    close() или раньше — через commit(). Хендлеру стоит вызвать commit()
+    перед долгими запросами к Telegram, чтобы не задерживать чужие записи.
+
+    Пока сессия открыта, run_read/run_write из той же задачи автоматически
+    идут через неё; фоновые задачи (сброс FSM и т.п.) её не видят.
+
+    after_commit(callback) — вызвать callback после коммита транзакции
+    (например, разбудить outbox); при откате callback отбрасывается.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.calls = 0
+        self._last_statement = None
+        self._owner = asyncio.current_task()
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._writing = False
+        self._closed = False
+        self._token = None
+        self._after_commit = []
+
+    # ====== В ПОТОКЕ БД ======
+
+    def _trace(self, statement: str):
+        # шаги триггера приходят с текстом внешнего выражения — подряд
+        # одинаковые строки считаем одним запросом
+        if statement == self._last_statement:
+            return
+        self._last_statement = statement
+        if not statement.lstrip().upper().startswith(_NOT_QUERIES):
+            self.queries += 1
+
+    def _call(self, func, args, kwargs):
+        if self._conn is None:
+            self._conn = database.get_pool().acquire()
+            self._conn.set_trace_callback(self._trace)
+        with database.bind_connection(self._conn):
+            return func(*args, **kwargs)
+
+    def _begin(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def _release(self):
+        self._conn.set_trace_callback(None)
+        database.get_pool().release(self._conn)
+        self._conn = None
+
+    # ====== ЗАПРОСЫ ======
+
+    async def run_read(self, func, *args, **kwargs):
+        async with self._lock:
+            self.calls += 1
+            return await _run(_readers, self._call, func, args, kwargs)
+
+    async def run_write(self, func, *args, **kwargs):
+        async with self._lock:
+            self.calls += 1
+            if not self._writing:
+                await _get_write_lock().acquire()
+                self._writing = True
+                try:
+                    await _run(_writer, self._call, self._begin, (), {})
+                except BaseException:
+                    self._writing = False
+                    _get_write_lock().release()
+                    raise
+            return await _run(_writer, self._call, func, args, kwargs)
+
+    # ====== ТРАНЗАКЦИЯ ======
+
+    def after_commit(self, callback):
+        self._after_commit.append(callback)
+
+    async def _finish(self, commit: bool):
+        try:
+            await self._end_transaction(commit)
+        except BaseException:
+            self._after_commit.clear()
+            raise
+        callbacks, self._after_commit = self._after_commit, []
+        if commit:
+            for callback in callbacks:
+                callback()
+
+    async def _end_transaction(self, commit: bool):
+        if not self._writing:
+            return
+        try:
+            if commit:
+                try:
+                    await _run(_writer, self._conn.commit)
+                    return
+                except Exception:
+                    await _run(_writer, self._conn.rollback)
+                    raise
+            await _run(_writer, self._conn.rollback)
+        finally:
+            self._writing = False
+            _get_write_lock().release()
+
+    async def commit(self):
+        async with self._lock:
+            await self._finish(commit=True)
+
+    async def rollback(self):
+        async with self._lock:
+            await self._finish(commit=False)
+
+    async def close(self, commit: bool = True):
+        if self._closed:
+            return
+        self._closed = True
+        if self._token is not None:
+            _current_session.reset(self._token)
+            self._token = None
+        async with self._lock:
+            try:
+                await self._finish(commit)
+            finally:
+                if self._conn is not None:
+                    await _run(_readers, self._release)
+
+
+def open_session() -> DBSession:
+    """Создаёт сессию и делает её текущей для вызывающей задачи."""
+    session = DBSession()
+    session._token = _current_session.set(session)
+    return session
+
+
+def current_session() -> Optional[DBSession]:
+    session = _current_session.get()
+    if session is None or session._closed or session._owner is not asyncio.current_task():
+        return None
+    return session
+
+
+def after_commit(callback):
+    """
+    Вызывает callback после коммита текущей DBSession (при откате — никогда);
+    вне сессии запись уже закоммичена, и callback вызывается сразу.
+    """
+    session = current_session()
+    if session is not None:
+        session.after_commit(callback)
+    else:
+        callback()
+
+
+# ====== КЛИЕНТЫ / ЗАКАЗЫ ======
+
+async def get_or_create_client(tg_id: int, username: Optional[str], name: Optional[str]) -> int:
+    return await run_write(database.get_or_create_client, tg_id, username, name)
+
+
+async def add_order(
+    client_id: int,
+    type_: str,
+    service_code: Optional[str],
+    title: Optional[str],
+    description: str,
+    budget: Optional[str],
+    deadline: Optional[str],
+    contact_method: str,
+    contact_value: str,
+    idempotency_key: Optional[str] = None,
+) -> int:
+    return await run_write(
+        database.add_order,
+        client_id=client_id,
+        type_=type_,
+        service_code=service_code,
+        title=title,
+        description=description,
+        budget=budget,
+        deadline=deadline,
+        contact_method=contact_method,
+        contact_value=contact_value,
+        idempotency_key=idempotency_key,
+    )
+
+
+async def get_order_id_by_key(idempotency_key: Optional[str]) -> Optional[int]:
+    return await run_read(database.get_order_id_by_key, idempotency_key)
+
+
+async def get_orders_page(per_page: int = 3, after_id: Optional[int] = None, before_id: Optional[int] = None):
+    return await run_read(database.get_orders_page, per_page, after_id, before_id)
+
+
+async def get_order_by_id(order_id: int):
+    return await run_read(database.get_order_by_id, order_id)
+
+
+async def update_order_status(order_id: int, status: str):
+    return await run_write(database.update_order_status, order_id, status)
+
+
+async def get_orders_stats():
+    return await run_read(database.get_orders_stats)
+
+
+async def get_order_rollups(period: str):
+    return await run_read(database.get_order_rollups, period)
+
+
+# ====== ПОИСК ======
+
+async def search_orders(match: str, limit: int, after: Optional[tuple] = None):
+    return await run_read(database.search_orders, match, limit, after)
+
+
+# ====== ВЫГРУЗКА ЗАКАЗОВ ======
+
+async def export_orders(
+    fmt: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    statuses: Optional[tuple] = None,
+):
+    return await run_read(export.export_orders, fmt, date_from, date_to, statuses)
+
+
+# ====== ЧЁРНЫЙ СПИСОК / БАН ======
+
+# проверки бана идут через ban_registry (память); он меняется только после
+# коммита записи, чтобы откат транзакции не разводил память и БД
+
+async def ban_user(tg_id: int, reason: str):
+    await run_write(database.ban_user, tg_id, reason)
+    after_commit(functools.partial(ban_registry.ban, tg_id, reason))
+
+
+async def unban_user(tg_id: int):
+    await run_write(database.unban_user, tg_id)
+    after_commit(functools.partial(ban_registry.unban, tg_id))
+
+
+async def get_banned_users():
+    return await run_read(database.get_banned_users)
+
+
+async def get_ban_events(after_id: int, limit: int = 1000):
+    return await run_read(database.get_ban_events, after_id, limit)
+
+
+async def prune_ban_events(older_than_days: int = 1) -> int:
+    return await run_write(database.prune_ban_events, older_than_days)
+
+
+# ====== ПОПЫТКИ КАПЧИ ======
+
+async def save_captcha_attempts(upserts, deletes):
+    return await run_write(database.save_captcha_attempts, upserts, deletes)
+
+
+async def ban_for_captcha(tg_id: int, reason: str):
+    await run_write(database.ban_for_captcha, tg_id, reason)
+    after_commit(functools.partial(ban_registry.ban, tg_id, reason))
+
+
+# ====== ЗАЯВКИ НА РАЗБАН ======
+
+async def add_unban_request(tg_id: int, reason: str):
+    return await run_write(database.add_unban_request, tg_id, reason)
+
+
+async def get_unban_requests(status: str = "pending"):
+    return await run_read(database.get_unban_requests, status)
+
+
+async def get_unban_request(request_id: int):
+    return await run_read(database.get_unban_request, request_id)
+
+
+async def update_unban_request_status(request_id: int, status: str):
+    return await run_write(database.update_unban_request_status, request_id, status)
+
+
+# ====== РАССЫЛКИ ======
+
+async def count_clients() -> int:
+    return await run_read(database.count_clients)
+
+
+async def create_broadcast(text: str, admin_chat_id: int) -> int:
+    return await run_write(database.create_broadcast, text, admin_chat_id)
+
+
+async def get_broadcast(broadcast_id: int):
+    return await run_read(database.get_broadcast, broadcast_id)
+
+
+async def get_running_broadcasts():
+    return await run_read(database.get_running_broadcasts)
+
+
+async def get_broadcast_recipients(after_client_id: int, max_client_id: int, limit: int):
+    return await run_read(database.get_broadcast_recipients, after_client_id, max_client_id, limit)
+
+
+async def set_broadcast_message(broadcast_id: int, message_id: int):
+    return await run_write(database.set_broadcast_message, broadcast_id, message_id)
+
+
+async def save_broadcast_progress(
+    broadcast_id: int,
+    last_client_id: int,
+    sent: int,
+    blocked: int,
+    failed: int,
+    skipped: int,
+):
+    return await run_write(
+        database.save_broadcast_progress,
+        broadcast_id, last_client_id, sent, blocked, failed, skipped,
+    )
+
+
+async def finish_broadcast(broadcast_id: int, status: str):
+    return await run_write(database.finish_broadcast, broadcast_id, status)
+
+
+# ====== OUTBOX УВЕДОМЛЕНИЙ ======
+
+async def add_outbox_message(chat_id: int, text: str, priority: int):
+    return await run_write(database.add_outbox_message, chat_id, text, priority)
+
+
+async def claim_outbox(limit: int, lease: float):
+    return await run_write(database.claim_outbox, limit, lease)
+
+
+async def finish_outbox(delivered, retries, released):
+    return await run_write(database.finish_outbox, delivered, retries, released)
+
+
+# ====== ОБСЛУЖИВАНИЕ ======
+
+async def archive_orders(older_than_days: int, limit: int) -> int:
+    return await run_write(database.archive_orders, older_than_days, limit)
+
+
+async def incremental_vacuum(pages: int) -> int:
+    return await run_write(database.incremental_vacuum, pages)
+
+
+async def optimize_db(analysis_limit: int = 1000):
+    return await run_write(database.optimize_db, analysis_limit)
+
+
+# ====== FSM-ХРАНИЛИЩЕ ======
+
+async def get_fsm_record(chat_id: int, user_id: int):
+    return await run_read(database.get_fsm_record, chat_id, user_id)
+
+
+async def save_fsm_records(upserts, deletes):
+    return await run_write(database.save_fsm_records, upserts, deletes)
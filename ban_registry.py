@@ -0,0 +1,42 @@
+# ban_registry.py
+"""
+Чёрный список в памяти процесса.
+
+Заполняется из banned_users при старте (database.load_ban_registry) и
+обновляется из async_db.ban_user / unban_user / ban_for_captcha после
+коммита их транзакции (при откате — не обновляется), поэтому проверка
+бана на каждом апдейте — это один поиск в словаре без обращения к диску.
+
+При нескольких воркерах (supervisor.py) каждый процесс держит свою копию и
+раз в BAN_SYNC_INTERVAL секунд применяет чужие изменения из ban_events.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+# tg_id -> причина бана ("" если причина не указана)
+_bans: Dict[int, str] = {}
+
+
+def load(rows: Iterable[Tuple[int, Optional[str]]]):
+    global _bans
+    _bans = {tg_id: reason or "" for tg_id, reason in rows}
+
+
+def ban(tg_id: int, reason: Optional[str]):
+    _bans[tg_id] = reason or ""
+
+
+def unban(tg_id: int):
+    _bans.pop(tg_id, None)
+
+
+def lookup_ban(tg_id: int) -> Optional[str]:
+    """Причина бана ("" если не указана) или None, если пользователь не забанен."""
+    return _bans.get(tg_id)
+
+
+def is_user_banned(tg_id: int) -> bool:
+    return tg_id in _bans
+
+
+def get_ban_reason(tg_id: int) -> Optional[str]:
+    return _bans.get(tg_id) or None
@@ -0,0 +1,137 @@
+# benchmarks/captcha_flood.py
+"""
+Стресс-тест учёта попыток капчи: тысячи клиентов одновременно отвечают
+неверно.
+
+Запуск из корня репозитория:
+    python -m benchmarks.captcha_flood --clients 5000
+
+Две трети клиентов ошибаются до бана, причём последний неверный ответ
+приходит дважды одновременно (двойной клик); остальные ошибаются пару раз
+и останавливаются.
+
+Сравниваются два режима:
+  legacy  — как было раньше: на каждую ошибку UPSERT + SELECT, бан —
+            отдельной записью;
+  tracker — captcha_tracker: счётчики в памяти, пакетная запись, бан и
+            сброс счётчика одной транзакцией.
+
+После прогона проверяется содержимое БД: все, кто дошёл до лимита,
+забанены, у остальных сохранено точное число попыток.
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import async_db
+import ban_registry
+import database
+from captcha_tracker import CaptchaTracker
+
+MAX_ATTEMPTS = 5
+SHORT_RUN = 2
+
+
+def legacy_increment(tg_id: int) -> int:
+    with database.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO captcha_attempts (tg_id, attempts)
+            VALUES (?, 1)
+            ON CONFLICT(tg_id) DO UPDATE SET attempts = attempts + 1
+            """,
+            (tg_id,),
+        )
+        cur.execute("SELECT attempts FROM captcha_attempts WHERE tg_id = ?", (tg_id,))
+        return cur.fetchone()["attempts"]
+
+
+async def legacy_fail(tg_id: int) -> int:
+    attempts = await async_db.run_write(legacy_increment, tg_id)
+    if attempts >= MAX_ATTEMPTS:
+        await async_db.ban_user(tg_id, "Не прошёл капчу 5 раз.")
+    return attempts
+
+
+async def client(fail, tg_id: int, to_ban: bool):
+    if not to_ban:
+        for _ in range(SHORT_RUN):
+            await fail(tg_id)
+            await asyncio.sleep(0)
+        return
+
+    for _ in range(MAX_ATTEMPTS - 1):
+        await fail(tg_id)
+        await asyncio.sleep(0)
+    # двойной клик по последнему неверному ответу
+    await asyncio.gather(fail(tg_id), fail(tg_id))
+
+
+async def run(mode: str, clients: int) -> dict:
+    writes = {"total": 0}
+    run_write = async_db.run_write
+
+    async def counting_run_write(func, *args):
+        writes["total"] += 1
+        writes[func.__name__] = writes.get(func.__name__, 0) + 1
+        return await run_write(func, *args)
+
+    async_db.run_write = counting_run_write
+    tracker = CaptchaTracker(max_attempts=MAX_ATTEMPTS, ttl=3600.0, flush_interval=0.05)
+    fail = legacy_fail if mode == "legacy" else tracker.fail
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            client(fail, 100000 + n, n % 3 != 0) for n in range(clients)
+        ))
+        await tracker.close()
+    finally:
+        async_db.run_write = run_write
+    elapsed = time.perf_counter() - started
+
+    details = ", ".join(f"{name} {count}" for name, count in sorted(writes.items()) if name != "total")
+    print(f"{mode:>7}: {clients} клиентов за {elapsed:.2f} c | записей в БД: {writes['total']} ({details})")
+    return writes
+
+
+def verify(clients: int):
+    with database.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT tg_id FROM banned_users WHERE active = 1")
+        banned = {row["tg_id"] for row in cur}
+        cur.execute("SELECT tg_id, attempts FROM captcha_attempts")
+        attempts = {row["tg_id"]: row["attempts"] for row in cur}
+
+    errors = 0
+    for n in range(clients):
+        tg_id = 100000 + n
+        if n % 3 != 0:
+            errors += tg_id not in banned
+        else:
+            errors += tg_id in banned or attempts.get(tg_id) != SHORT_RUN
+    print(f"         проверка БД: забанено {len(banned)}, ошибок {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("legacy", "tracker"):
+            database.DB_PATH = Path(tmp) / f"bench_{mode}.sqlite3"
+            database.init_db()
+            ban_registry.load([])
+            asyncio.run(run(mode, args.clients))
+            verify(args.clients)
+
+    async_db.shutdown()
+    database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/db_event_loop.py
+"""
+Насколько работа с SQLite блокирует event loop при одновременных заказах.
+
+Запуск из корня репозитория:
+    python -m benchmarks.db_event_loop --clients 200 --orders 5
+
+Сравниваются два режима:
+  sync  — прямые вызовы database.* из корутин (как было раньше);
+  async — те же операции через async_db (поток-писатель + пул читателей),
+          проверка бана — через ban_registry в памяти.
+
+Параллельно работает "пульс" — корутина, которая каждые 5 мс засыпает и
+замеряет, насколько позже она проснулась. Максимальная задержка пульса —
+это худший простой event loop, который видят остальные пользователи.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import database
+import async_db
+import ban_registry
+
+TICK = 0.005
+
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - started - TICK)
+
+
+def legacy_is_user_banned(tg_id: int) -> bool:
+    with database.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT active FROM banned_users WHERE tg_id = ?", (tg_id,))
+        row = cur.fetchone()
+        return bool(row and row["active"] == 1)
+
+
+async def submit_sync(tg_id: int, orders: int):
+    for i in range(orders):
+        client_id = database.get_or_create_client(tg_id, f"user{tg_id}", "Bench")
+        database.add_order(
+            client_id, "service", "beam_decor", None, f"order {i}",
+            None, None, "phone", "+70000000000",
+        )
+        legacy_is_user_banned(tg_id)
+        await asyncio.sleep(0)
+
+
+async def submit_async(tg_id: int, orders: int):
+    for i in range(orders):
+        client_id = await async_db.get_or_create_client(tg_id, f"user{tg_id}", "Bench")
+        await async_db.add_order(
+            client_id, "service", "beam_decor", None, f"order {i}",
+            None, None, "phone", "+70000000000",
+        )
+        ban_registry.is_user_banned(tg_id)
+
+
+async def run(mode: str, clients: int, orders: int):
+    submit = submit_sync if mode == "sync" else submit_async
+    lags = []
+    stop = asyncio.Event()
+    pulse = asyncio.create_task(heartbeat(lags, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(100000 + n, orders) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await pulse
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(
+        f"{mode:>5}: {clients * orders} заказов за {elapsed:.2f} c | "
+        f"пульс: {len(lags)} тиков, медиана {statistics.median(lags_ms):.1f} мс, "
+        f"p99 {p99:.1f} мс, максимум {lags_ms[-1]:.1f} мс"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "async"):
+            database.DB_PATH = Path(tmp) / f"bench_{mode}.sqlite3"
+            database.init_db()
+            asyncio.run(run(mode, args.clients, args.orders))
+
+    async_db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+# benchmarks/e2e.py
+"""
+Сквозной бенчмарк бота: пропускная способность, задержки хендлеров и число
+SQL-запросов на сценарий.
+
+Диспетчер собирается настоящим main.create_dispatcher (все middleware,
+register_order_handlers, register_admin_handlers), Bot API подменяется
+FakeBotAPI, а апдейты подаются прямо в dp.process_updates — без HTTP, чтобы
+мерить сам бот.
+
+Сценарии:
+  order — синтетический клиент: /start -> капча -> "Сделать заказ" ->
+          услуга -> описание -> способ связи -> контакт -> капча -> имя ->
+          подтверждение. Кнопки берутся из клавиатур, которые бот
+          действительно отправил; верный ответ капчи — из FSM. Часть
+          клиентов (--captcha-fail) сначала ошибается в капче.
+  admin — админ, пока идут заказы, листает "Все заказы", открывает заказ
+          и меняет ему статус.
+
+Клиенты стартуют равномерно в течение --ramp секунд и думают между шагами
+около --think секунд: RateLimitMiddleware из main.py тоже работает, и
+отсечённые им апдейты попадают в отчёт отдельной строкой. Апдейтов в
+секунду получается столько, сколько создают клиенты; предел бота ищется
+прогоном с --think 0 --no-rate-limit.
+
+SQL-запросы считает DBSession апдейта; фоновые записи (сброс FSM, счётчики
+капчи, очередь уведомлений) в сценарии не входят.
+
+Запуск из корня репозитория:
+    python -m benchmarks.e2e --users 500 --report e2e.json
+    python -m benchmarks.e2e --users 500 --baseline e2e.json
+
+Отчёт — JSON с отсортированными ключами, чтобы сравнивать релизы обычным
+diff; --baseline печатает изменения ключевых метрик относительно прошлого
+отчёта.
+"""
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import logging
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import aiogram
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+import database
+import main as bot_main
+from benchmarks.fake_bot_api import FakeBotAPI, message_update, callback_update
+from config import ADMIN_ID
+from middleware.rate_limit import RateLimitMiddleware
+
+TOKEN = "123456:BENCH"
+USER_ID_BASE = 2_000_000
+
+# апдейт, до хендлера которого дело не дошло (лимит, бан, права)
+REJECTED = "(отсечён middleware)"
+
+_probe = contextvars.ContextVar("bench_probe")
+
+
+class ProbeMiddleware(BaseMiddleware):
+    """
+    Подключается последним и запоминает, какой хендлер обработал апдейт и
+    какая DBSession была у апдейта. on_process_* вызывается после фильтров,
+    когда current_handler уже выставлен.
+    """
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._record(data)
+
+    async def on_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        self._record(data)
+
+    @staticmethod
+    def _record(data: dict):
+        probe = _probe.get(None)
+        if probe is not None:
+            probe["handler"] = current_handler.get().__name__
+            probe["db"] = data.get("db")
+
+
+def percentile(values, q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summary_ms(seconds: list) -> dict:
+    values = sorted(s * 1000 for s in seconds)
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 0.50), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "p99": round(percentile(values, 0.99), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+class Recorder:
+    def __init__(self, dp: Dispatcher):
+        self.dp = dp
+        self.latencies = []
+        self.handlers = defaultdict(list)
+        self.handler_queries = defaultdict(int)
+        self.flows = defaultdict(list)
+
+    async def send(self, update: dict):
+        """Обрабатывает апдейт; возвращает (имя хендлера, число SQL-запросов)."""
+        probe = {}
+        token = _probe.set(probe)
+        started = time.perf_counter()
+        try:
+            # через process_updates: так вызываются и update-middleware
+            await self.dp.process_updates([types.Update(**update)])
+        finally:
+            _probe.reset(token)
+        elapsed = time.perf_counter() - started
+
+        name = probe.get("handler", REJECTED)
+        session = probe.get("db")
+        queries = session.queries if session is not None else 0
+        self.latencies.append(elapsed)
+        self.handlers[name].append(elapsed)
+        self.handler_queries[name] += queries
+        return name, queries
+
+
+class Flow:
+    """Один проход сценария от лица пользователя: шаги, SQL-запросы, время."""
+
+    def __init__(self, recorder: Recorder, api: FakeBotAPI, user_id: int, think: float):
+        self.recorder = recorder
+        self.api = api
+        self.user_id = user_id
+        self.think = think
+        self.steps = 0
+        self.queries = 0
+        self.handler = None
+        self.started = time.perf_counter()
+
+    async def message(self, text: str) -> str:
+        return await self._send(message_update(self.user_id, text))
+
+    async def press(self, data: str) -> str:
+        return await self._send(callback_update(self.user_id, data))
+
+    async def press_first(self, prefix: str, choose=None) -> str:
+        """Нажимает кнопку последней клавиатуры, callback_data которой начинается с prefix."""
+        buttons = [data for data in self.api.buttons(self.user_id) if data.startswith(prefix)]
+        if not buttons:
+            return None
+        return await self.press(choose(buttons) if choose else buttons[0])
+
+    async def _send(self, update: dict) -> str:
+        if self.steps and self.think:
+            await asyncio.sleep(self.think * random.uniform(0.5, 1.5))
+        self.steps += 1
+        self.handler, queries = await self.recorder.send(update)
+        self.queries += queries
+        return self.handler
+
+    def finish(self, name: str, completed: bool):
+        self.recorder.flows[name].append({
+            "completed": completed,
+            "steps": self.steps,
+            "queries": self.queries,
+            "seconds": time.perf_counter() - self.started,
+        })
+
+
+# ====== СЦЕНАРИИ ======
+
+async def answer_captcha(flow: Flow, dp: Dispatcher, wrong: bool = False):
+    data = await dp.storage.get_data(chat=flow.user_id, user=flow.user_id)
+    correct = data.get("captcha_correct", 0)
+    if wrong:
+        await flow.press(f"captcha_{(correct + 1) % 4}")
+        data = await dp.storage.get_data(chat=flow.user_id, user=flow.user_id)
+        correct = data.get("captcha_correct", 0)
+    await flow.press(f"captcha_{correct}")
+
+
+async def order_flow(recorder: Recorder, api: FakeBotAPI, user_id: int, think: float, captcha_fail: float):
+    flow = Flow(recorder, api, user_id, think)
+    dp = recorder.dp
+
+    await flow.message("/start")
+    await answer_captcha(flow, dp, wrong=random.random() < captcha_fail)
+    await flow.message("🔨 Сделать заказ")
+    await flow.press_first("service_", random.choice)
+    await flow.message(f"Кованая калитка для пользователя {user_id}, 1x2 м, с завитками")
+    await flow.press("contact_phone")
+    await flow.message(f"+7 900 {user_id % 1000:03d}-00-00")
+    await answer_captcha(flow, dp)
+    await flow.message(f"Клиент {user_id}")
+    await flow.press("confirm_yes")
+
+    flow.finish("order", flow.handler == "confirm_order")
+
+
+async def admin_flow(recorder: Recorder, api: FakeBotAPI, think: float, pages: int):
+    """Один обход админа: список, несколько страниц, карточка, смена статуса."""
+    flow = Flow(recorder, api, ADMIN_ID, think)
+
+    await flow.message("📥 Все заказы")
+    for _ in range(pages):
+        if await flow.press_first("admin_orders_page_", lambda buttons: buttons[-1]) is None:
+            break
+    await flow.press_first("admin_order_", random.choice)
+    handler = await flow.press_first("admin_status_", random.choice)
+
+    flow.finish("admin", handler == "admin_change_status")
+
+
+async def admin_loop(recorder: Recorder, api: FakeBotAPI, think: float, pages: int, stop: asyncio.Event):
+    while not stop.is_set():
+        await admin_flow(recorder, api, think, pages)
+
+
+# ====== ПОДГОТОВКА ======
+
+def seed(orders: int, clients: int = 200):
+    """Заказы в БД, чтобы админу было что листать."""
+    with database.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO clients (tg_id, username, name) VALUES (?, ?, ?)",
+            ((100 + n, f"seed{n}", f"Клиент {n}") for n in range(clients)),
+        )
+        conn.executemany(
+            """
+            INSERT INTO orders (
+                client_id, type, service_code, title, description,
+                budget, deadline, contact_method, contact_value, status
+            )
+            VALUES (?, 'custom', NULL, ?, ?, NULL, NULL, 'phone', ?, 'new')
+            """,
+            (
+                (1 + n % clients, f"Заказ {n}", f"Описание заказа {n}", f"+7 900 000-{n % 100:02d}-00")
+                for n in range(orders)
+            ),
+        )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+# ====== ПРОГОН ======
+
+async def run(args) -> dict:
+    dp = bot_main.create_dispatcher(TOKEN)
+    if args.no_rate_limit:
+        dp.middleware.applications = [
+            m for m in dp.middleware.applications if not isinstance(m, RateLimitMiddleware)
+        ]
+    dp.middleware.setup(ProbeMiddleware())
+    api = FakeBotAPI(latency=args.api_latency).install(dp.bot)
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+
+    recorder = Recorder(dp)
+    stop = asyncio.Event()
+
+    async def user(n: int):
+        await asyncio.sleep(args.ramp * n / args.users)
+        await order_flow(recorder, api, USER_ID_BASE + n, args.think, args.captcha_fail)
+
+    started = time.perf_counter()
+    admin = asyncio.get_running_loop().create_task(
+        admin_loop(recorder, api, args.think, args.admin_pages, stop)
+    )
+    await asyncio.gather(*(user(n) for n in range(args.users)))
+    stop.set()
+    await admin
+    elapsed = time.perf_counter() - started
+
+    with database.get_connection() as conn:
+        orders_created = conn.execute(
+            "SELECT COUNT(*) FROM orders WHERE client_id IN (SELECT id FROM clients WHERE tg_id >= ?)",
+            (USER_ID_BASE,),
+        ).fetchone()[0]
+
+    await bot_main.on_shutdown(dp)
+
+    handlers = {}
+    for name, values in sorted(recorder.handlers.items()):
+        handlers[name] = {
+            "count": len(values),
+            "latency_ms": summary_ms(values),
+            "queries_avg": round(recorder.handler_queries[name] / len(values), 2),
+        }
+
+    flows = {}
+    for name, runs in sorted(recorder.flows.items()):
+        completed = [r for r in runs if r["completed"]]
+        flows[name] = {
+            "runs": len(runs),
+            "completed": len(completed),
+            "steps_avg": round(sum(r["steps"] for r in runs) / len(runs), 2),
+            "queries_avg": round(sum(r["queries"] for r in completed) / len(completed), 2) if completed else None,
+            "duration_ms": summary_ms([r["seconds"] for r in completed]),
+        }
+
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "aiogram": aiogram.__version__,
+            "params": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "totals": {
+            "updates": len(recorder.latencies),
+            "seconds": round(elapsed, 3),
+            "updates_per_sec": round(len(recorder.latencies) / elapsed, 1),
+            "latency_ms": summary_ms(recorder.latencies),
+            "rejected": len(recorder.handlers.get(REJECTED, ())),
+            "orders_created": orders_created,
+        },
+        "handlers": handlers,
+        "flows": flows,
+        "bot_api_calls": dict(sorted(api.calls.items())),
+    }
+
+
+# ====== ОТЧЁТ ======
+
+def print_report(report: dict):
+    totals = report["totals"]
+    latency = totals["latency_ms"]
+    print(
+        f"апдейтов: {totals['updates']} за {totals['seconds']:.2f} с — "
+        f"{totals['updates_per_sec']:.0f} апдейтов/с, отсечено: {totals['rejected']}, "
+        f"заказов создано: {totals['orders_created']}"
+    )
+    print(f"задержка: p50 {latency['p50']:.2f} мс, p95 {latency['p95']:.2f} мс, p99 {latency['p99']:.2f} мс")
+    print()
+    print(f"{'хендлер':<36} {'вызовов':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL':>6}")
+    for name, row in report["handlers"].items():
+        lat = row["latency_ms"]
+        print(
+            f"{name:<36} {row['count']:>8} {lat['p50']:>8.2f} {lat['p95']:>8.2f} "
+            f"{lat['p99']:>8.2f} {row['queries_avg']:>6.1f}"
+        )
+    print()
+    for name, row in report["flows"].items():
+        queries = "-" if row["queries_avg"] is None else f"{row['queries_avg']:.1f}"
+        print(
+            f"сценарий {name}: {row['completed']}/{row['runs']} завершено, "
+            f"{row['steps_avg']:.1f} шагов, SQL на сценарий: {queries}"
+        )
+
+
+def _change(old, new) -> str:
+    if not old:
+        return f"{old} -> {new}"
+    return f"{old} -> {new} ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_comparison(baseline: dict, report: dict):
+    print()
+    print(f"сравнение с {baseline['meta'].get('git') or baseline['meta']['date']}:")
+    old, new = baseline["totals"], report["totals"]
+    print(f"  апдейтов/с: {_change(old['updates_per_sec'], new['updates_per_sec'])}")
+    print(f"  p95, мс: {_change(old['latency_ms']['p95'], new['latency_ms']['p95'])}")
+    for name, row in report["handlers"].items():
+        before = baseline["handlers"].get(name)
+        if before is None:
+            continue
+        print(
+            f"  {name}: p95 {_change(before['latency_ms']['p95'], row['latency_ms']['p95'])}, "
+            f"SQL {_change(before['queries_avg'], row['queries_avg'])}"
+        )
+    for name, row in report["flows"].items():
+        before = baseline["flows"].get(name)
+        if before is not None:
+            print(f"  сценарий {name}: SQL {_change(before['queries_avg'], row['queries_avg'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300, help="клиентов, каждый делает один заказ")
+    parser.add_argument("--ramp", type=float, default=10.0, help="за сколько секунд стартуют все клиенты")
+    parser.add_argument("--think", type=float, default=0.5, help="пауза пользователя между шагами, с")
+    parser.add_argument("--captcha-fail", type=float, default=0.1, help="доля клиентов, ошибающихся в капче")
+    parser.add_argument("--admin-pages", type=int, default=3, help="страниц списка за обход админа")
+    parser.add_argument("--seed-orders", type=int, default=2000, help="заказов в БД до старта")
+    parser.add_argument("--no-rate-limit", action="store_true", help="без RateLimitMiddleware")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    parser.add_argument("--seed", type=int, default=1, help="seed для random")
+    parser.add_argument("--report", type=Path, help="куда записать JSON-отчёт")
+    parser.add_argument("--baseline", type=Path, help="JSON-отчёт прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    # main.py включает INFO-логи; в замерах они только мешают
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / "bench_e2e.sqlite3"
+        database.init_db()
+        database.load_ban_registry()
+        seed(args.seed_orders)
+        report = asyncio.run(run(args))
+
+    print_report(report)
+    if args.baseline:
+        print_comparison(json.loads(args.baseline.read_text(encoding="utf-8")), report)
+    if args.report:
+        args.report.write_text(
+            json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/fake_bot_api.py
+"""
+Подмена Telegram Bot API внутри процесса для бенчмарков.
+
+install(bot) заменяет bot.request: вместо HTTP-запроса возвращается
+правдоподобный ответ (объект Message для send*/edit*, True для остального),
+а каждый вызов считается по имени метода. latency — искусственная задержка
+"сети" на каждый вызов.
+
+Последняя inline-клавиатура каждого чата запоминается: сценарии
+бенчмарков "нажимают" кнопки, которые бот действительно показал.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiogram import Bot
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+MESSAGE_METHODS = {
+    "sendMessage",
+    "sendDocument",
+    "editMessageText",
+    "editMessageReplyMarkup",
+}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.keyboards = {}
+        self._message_ids = itertools.count(1)
+
+    def install(self, bot: Bot) -> "FakeBotAPI":
+        bot.request = self.request
+        return self
+
+    def message(self, data: dict) -> dict:
+        chat_id = int(data.get("chat_id") or 0)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": data.get("text") or "",
+        }
+
+    def buttons(self, chat_id: int) -> list:
+        """callback_data кнопок последней inline-клавиатуры чата."""
+        markup = self.keyboards.get(chat_id) or {}
+        return [
+            button["callback_data"]
+            for row in markup.get("inline_keyboard", ())
+            for button in row
+            if "callback_data" in button
+        ]
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in MESSAGE_METHODS:
+            data = data or {}
+            markup = data.get("reply_markup")
+            if markup:
+                markup = json.loads(markup) if isinstance(markup, str) else markup
+                if "inline_keyboard" in markup:
+                    self.keyboards[int(data.get("chat_id") or 0)] = markup
+            return self.message(data)
+        if method == "getMe":
+            return BOT_USER
+        return True
+
+
+# ====== СИНТЕТИЧЕСКИЕ АПДЕЙТЫ ======
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def message_update(user_id: int, text: str) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]}
+               if text.startswith("/") else {}),
+        },
+    }
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "",
+            },
+        },
+    }
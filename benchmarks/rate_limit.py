@@ -0,0 +1,91 @@
+# benchmarks/rate_limit.py
+"""
+Микробенчмарк решения "пропустить / отклонить" в RateLimitMiddleware.
+
+Сравнивает прежний алгоритм (список отметок времени на пользователя,
+пересобираемый на каждом сообщении, без очистки) с GCRA-лимитером из
+middleware/rate_limit.py: время на проверку и память на состояние
+пользователей.
+
+Запуск из корня репозитория:
+    python -m benchmarks.rate_limit --users 100000 --hits 1000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+
+from middleware.rate_limit import Limiter, ALLOWED
+
+
+class LegacyLimiter:
+    """Прежняя логика RateLimitMiddleware.on_pre_process_message."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.users = defaultdict(list)
+
+    def hit(self, user_id: int, now: float) -> bool:
+        history = self.users[user_id]
+        history = [t for t in history if now - t < self.rate * self.burst]
+        history.append(now)
+        self.users[user_id] = history
+        return len(history) <= self.burst
+
+
+def make_trace(users: int, hits: int, duration: float):
+    """Последовательность (user_id, время): 10% пользователей шлют половину апдейтов."""
+    rng = random.Random(42)
+    hot = max(1, users // 10)
+    step = duration / hits
+    trace = []
+    for n in range(hits):
+        if rng.random() < 0.5:
+            user_id = rng.randrange(hot)
+        else:
+            user_id = rng.randrange(users)
+        trace.append((user_id, n * step))
+    return trace
+
+
+def measure(name: str, limiter, trace, is_allowed):
+    tracemalloc.start()
+    started = time.perf_counter()
+    allowed = 0
+    for user_id, now in trace:
+        if is_allowed(limiter.hit(user_id, now)):
+            allowed += 1
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # tracemalloc замедляет оба варианта одинаково; абсолютное время — без него
+    started = time.perf_counter()
+    fresh = type(limiter)(1.5, 5)
+    for user_id, now in trace:
+        fresh.hit(user_id, now)
+    clean = time.perf_counter() - started
+
+    print(
+        f"{name:>7}: {clean / len(trace) * 1e9:6.0f} нс/проверка "
+        f"(под tracemalloc {elapsed:.2f} с), пропущено {allowed}, "
+        f"пользователей в памяти {len(limiter.users)}, пик памяти {peak / 1024 / 1024:.1f} МиБ"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--hits", type=int, default=1_000_000)
+    parser.add_argument("--duration", type=float, default=3600.0, help="длительность трассы, с")
+    args = parser.parse_args()
+
+    trace = make_trace(args.users, args.hits, args.duration)
+    measure("legacy", LegacyLimiter(1.5, 5), trace, bool)
+    measure("gcra", Limiter(1.5, 5), trace, lambda verdict: verdict == ALLOWED)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/render_cache.py
+"""
+Сколько стоит отрисовка каталога и статических клавиатур на один апдейт —
+со сборкой заново (как раньше) и из кэша.
+
+Запуск из корня репозитория:
+    python -m benchmarks.render_cache --calls 20000
+
+Для каждого варианта: время на вызов и число выделенных блоков памяти
+на вызов (по tracemalloc, включая сериализацию клавиатуры в JSON, как
+это делает aiogram при отправке).
+"""
+import argparse
+import time
+import tracemalloc
+
+from aiogram.utils import json
+
+import keyboards
+import services
+
+CASES = [
+    ("каталог: текст", services.get_services_list_text.build, services.get_services_list_text),
+    ("каталог: клавиатура", services.get_services_inline_keyboard.build, services.get_services_inline_keyboard),
+    ("меню клиента", keyboards.get_client_menu.__wrapped__, keyboards.get_client_menu),
+    ("меню админа", keyboards.get_admin_menu.__wrapped__, keyboards.get_admin_menu),
+    ("способ связи", keyboards.get_contact_method_kb.__wrapped__, keyboards.get_contact_method_kb),
+]
+
+
+def render(func):
+    value = func()
+    if not isinstance(value, str):
+        # aiogram сериализует reply_markup при каждой отправке
+        json.dumps(value.to_python())
+    return value
+
+
+def measure(func, calls: int):
+    started = time.perf_counter()
+    for _ in range(calls):
+        render(func)
+    per_call = (time.perf_counter() - started) / calls
+
+    tracemalloc.start()
+    tracemalloc.clear_traces()
+    before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    keep = [render(func) for _ in range(100)]
+    after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del keep
+    return per_call, (after - before) / 100
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'':<22}{'заново, мкс':>13}{'кэш, мкс':>11}{'блоков заново':>16}{'блоков кэш':>12}")
+    for name, build, cached in CASES:
+        cold_time, cold_blocks = measure(build, args.calls)
+        warm_time, warm_blocks = measure(cached, args.calls)
+        print(
+            f"{name:<22}{cold_time * 1e6:>13.1f}{warm_time * 1e6:>11.1f}"
+            f"{cold_blocks:>16.0f}{warm_blocks:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/webhook_load.py
+"""
+Нагрузочный тест webhook-режима на локальной машине.
+
+Поднимает настоящий aiohttp-сервер из webhook.build_app с диспетчером из
+main.create_dispatcher (все middleware и хендлеры), подменяет Bot API на
+FakeBotAPI и шлёт синтетические апдейты по HTTP, как это делал бы Telegram.
+
+Запуск из корня репозитория:
+    python -m benchmarks.webhook_load --updates 5000 --concurrency 100
+
+Выводит пропускную способность и p50/p95/p99 задержки ответа webhook.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+import database
+from benchmarks.fake_bot_api import FakeBotAPI, message_update, callback_update
+from main import create_dispatcher
+from webhook import build_app, SECRET_HEADER
+
+SECRET = "bench-secret"
+PATH = "/webhook"
+
+TEXTS = ["/start", "📋 Наши услуги", "ℹ️ О нас", "📞 Контакты", "🔨 Сделать заказ"]
+
+
+def make_update(n: int, users: int) -> dict:
+    user_id = 1_000_000 + n % users
+    if n % 5 == 4:
+        return callback_update(user_id, f"captcha_{random.randrange(4)}")
+    return message_update(user_id, random.choice(TEXTS))
+
+
+def percentile(values, q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(updates: int, concurrency: int, users: int, latency: float):
+    dp = create_dispatcher("123456:BENCH")
+    api = FakeBotAPI(latency=latency).install(dp.bot)
+
+    app = build_app(dp, SECRET, PATH)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{PATH}"
+
+    queue = asyncio.Queue()
+    for n in range(updates):
+        queue.put_nowait(make_update(n, users))
+
+    latencies = []
+    statuses = {}
+
+    async with ClientSession(headers={SECRET_HEADER: SECRET}) as session:
+        # запрос без секрета должен быть отклонён
+        async with session.post(url, json=make_update(0, users), headers={SECRET_HEADER: "wrong"}) as resp:
+            rejected = resp.status
+
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                started = time.perf_counter()
+                async with session.post(url, json=update) as resp:
+                    await resp.read()
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await dp.storage.close()
+    await runner.cleanup()
+
+    latencies_ms = sorted(lat * 1000 for lat in latencies)
+    print(f"апдейтов: {updates}, параллельно: {concurrency}, пользователей: {users}")
+    print(f"HTTP-статусы: {statuses}, неверный секрет -> {rejected}")
+    print(f"пропускная способность: {updates / elapsed:.0f} апдейтов/с за {elapsed:.2f} с")
+    print(
+        f"задержка: p50 {percentile(latencies_ms, 0.50):.1f} мс, "
+        f"p95 {percentile(latencies_ms, 0.95):.1f} мс, "
+        f"p99 {percentile(latencies_ms, 0.99):.1f} мс, "
+        f"max {latencies_ms[-1]:.1f} мс"
+    )
+    print(f"вызовы Bot API: {dict(api.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    args = parser.parse_args()
+
+    # main.py включает INFO-логи; в замерах они только мешают
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / "bench_webhook.sqlite3"
+        database.init_db()
+        database.load_ban_registry()
+        asyncio.run(run(args.updates, args.concurrency, args.users, args.api_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# benchmarks/workers_scaling.py
+"""
+Как пропускная способность растёт с числом воркеров супервизора.
+
+Для каждого числа воркеров из --workers поднимается настоящий Supervisor
+(supervisor.py) с процессами-воркерами; в воркерах Bot API подменён
+FakeBotAPI. Супервизор раскладывает по воркерам синтетические апдейты
+(/start, пункты меню, ответы капчи) от --users пользователей — как это
+делал бы poll. Каждый воркер записывает, сколько апдейтов обработал и
+когда начал и закончил; пропускная способность — все апдейты за время от
+первого начатого до последнего законченного.
+
+Запуск из корня репозитория:
+    python -m benchmarks.workers_scaling --workers 1 2 4 --updates 20000
+
+Рост ограничен числом ядер: на одном ядре воркеры только делят его.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import database
+from benchmarks.fake_bot_api import FakeBotAPI, message_update, callback_update
+from supervisor import ROOT, Supervisor, run_worker
+
+TEXTS = ["/start", "📋 Наши услуги", "ℹ️ О нас", "📞 Контакты", "🔨 Сделать заказ"]
+
+# переменные окружения, через которые воркер узнаёт БД и куда писать итоги
+DB_ENV = "BENCH_WORKERS_DB"
+RESULTS_ENV = "BENCH_WORKERS_RESULTS"
+# config воркера читает их из окружения; load_dotenv не перезаписывает
+WORKER_ENV = {"BOT_TOKEN": "123456:BENCH", "METRICS_PORT": "0"}
+
+
+def make_update(n: int, users: int) -> dict:
+    user_id = 1_000_000 + n % users
+    if n % 5 == 4:
+        return callback_update(user_id, f"captcha_{random.randrange(4)}")
+    return message_update(user_id, random.choice(TEXTS))
+
+
+# ====== ВОРКЕР ======
+
+class _Timing:
+    """Оборачивает dp.process_updates: учитываются и апдейты, отброшенные middleware."""
+
+    def __init__(self, dp):
+        self.first = None
+        self.last = None
+        self.count = 0
+        self._process = dp.process_updates
+        dp.process_updates = self.process_updates
+
+    async def process_updates(self, updates, fast=True):
+        if self.first is None:
+            self.first = time.time()
+        try:
+            return await self._process(updates, fast)
+        finally:
+            self.count += len(updates)
+            self.last = time.time()
+
+
+def bench_worker():
+    """Точка входа процесса-воркера бенчмарка."""
+    index, count = int(sys.argv[1]), int(sys.argv[2])
+    database.DB_PATH = Path(os.environ[DB_ENV])
+    logging.basicConfig(level=logging.WARNING)
+    timing = None
+
+    def prepare(dp):
+        nonlocal timing
+        FakeBotAPI().install(dp.bot)
+        timing = _Timing(dp)
+
+    asyncio.run(run_worker(index, count, prepare))
+    result = {"first": timing.first, "last": timing.last, "count": timing.count}
+    Path(os.environ[RESULTS_ENV], f"worker_{index}.json").write_text(json.dumps(result))
+
+
+def bench_command(index: int, count: int) -> list:
+    code = (
+        f"import sys; sys.path.insert(0, {str(ROOT)!r}); "
+        "from benchmarks.workers_scaling import bench_worker; bench_worker()"
+    )
+    return [sys.executable, "-c", code, str(index), str(count)]
+
+
+# ====== ПРОГОН ======
+
+async def run(workers: int, updates: list, results: Path) -> dict:
+    supervisor = Supervisor(workers, command=bench_command)
+    await supervisor.start()
+    for update in updates:
+        await supervisor.route(update)
+    await supervisor.stop(timeout=300)
+
+    reports = [json.loads(path.read_text()) for path in results.glob("worker_*.json")]
+    started = min(r["first"] for r in reports if r["first"])
+    finished = max(r["last"] for r in reports if r["last"])
+    return {
+        "workers": workers,
+        "processed": sum(r["count"] for r in reports),
+        "per_worker": [r["count"] for r in sorted(reports, key=lambda r: r["first"] or 0)],
+        "seconds": finished - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.update(WORKER_ENV)
+    random.seed(1)
+    updates = [make_update(n, args.users) for n in range(args.updates)]
+    print(f"ядер: {os.cpu_count()}, апдейтов: {args.updates}, пользователей: {args.users}")
+
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = Path(tmp) / "bench_workers.sqlite3"
+            database.init_db()
+            database.close_pool()
+            os.environ[DB_ENV] = str(database.DB_PATH)
+            os.environ[RESULTS_ENV] = tmp
+
+            report = asyncio.run(run(workers, updates, Path(tmp)))
+
+        rate = report["processed"] / report["seconds"]
+        baseline = baseline or rate
+        print(
+            f"воркеров: {workers} — {rate:.0f} апдейтов/с (x{rate / baseline:.2f}), "
+            f"обработано {report['processed']}, по воркерам {report['per_worker']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
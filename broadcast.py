@@ -0,0 +1,242 @@
+# broadcast.py
+"""
+Рассылки админа всем клиентам.
+
+Каждая рассылка — строка в таблице broadcasts и фоновая задача. Задача
+идёт по clients пачками по batch_size (курсор — clients.id), кладёт
+сообщения пачки в outbound с PRIORITY_BULK и ждёт их отправки: темп и
+параллельность задаёт outbound, а уведомления о заказах обгоняют рассылку.
+После каждой пачки курсор и счётчики сохраняются, поэтому после
+перезапуска рассылка продолжается с места остановки (resume) — повторно
+может уйти только недосланная пачка.
+
+Забаненные пропускаются, заблокировавшие бота и удалённые чаты
+считаются отдельно и не повторяются. Прогресс админ видит в одном
+сообщении, которое редактируется не чаще раза в progress_interval секунд.
+"""
+import asyncio
+import logging
+import time
+import typing
+
+from aiogram import Bot
+from aiogram.utils.exceptions import (
+    ChatNotFound,
+    MessageNotModified,
+    TelegramAPIError,
+    Unauthorized,
+)
+
+import async_db
+import ban_registry
+from keyboards import get_broadcast_progress_kb
+from outbound import enqueue_message, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+STATUS_TITLES = {
+    "running": "идёт",
+    "done": "завершена",
+    "cancelled": "остановлена",
+}
+
+
+class _Broadcast:
+    __slots__ = (
+        "id", "text", "admin_chat_id", "message_id", "last_client_id", "max_client_id",
+        "total", "sent", "blocked", "failed", "skipped", "status", "stop_requested",
+    )
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.text = row["text"]
+        self.admin_chat_id = row["admin_chat_id"]
+        self.message_id = row["progress_message_id"]
+        self.last_client_id = row["last_client_id"]
+        self.max_client_id = row["max_client_id"]
+        self.total = row["total"]
+        self.sent = row["sent"]
+        self.blocked = row["blocked"]
+        self.failed = row["failed"]
+        self.skipped = row["skipped"]
+        self.status = row["status"]
+        self.stop_requested = False
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed + self.skipped
+
+
+def progress_text(job: _Broadcast) -> str:
+    return (
+        f"📢 <b>Рассылка #{job.id}</b> — {STATUS_TITLES.get(job.status, job.status)}\n\n"
+        f"Обработано: <b>{job.processed}</b> из {job.total}\n"
+        f"Доставлено: <b>{job.sent}</b>\n"
+        f"Бот заблокирован / чат удалён: <b>{job.blocked}</b>\n"
+        f"Ошибки: <b>{job.failed}</b>\n"
+        f"Пропущено (бан): <b>{job.skipped}</b>"
+    )
+
+
+class BroadcastEngine:
+    def __init__(self, bot: Bot, batch_size: int = 50, progress_interval: float = 3.0):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._jobs: typing.Dict[int, _Broadcast] = {}
+        self._tasks: typing.Dict[int, asyncio.Task] = {}
+        self._closing = False
+
+    # ====== УПРАВЛЕНИЕ ======
+
+    def start(self, text: str, admin_chat_id: int) -> asyncio.Task:
+        """Запускает новую рассылку в фоне; хендлер не ждёт ни записи в БД, ни отправки."""
+        return asyncio.get_running_loop().create_task(self._create_and_run(text, admin_chat_id))
+
+    async def resume(self):
+        """Продолжает рассылки, прерванные перезапуском."""
+        for row in await async_db.get_running_broadcasts():
+            if row["id"] not in self._tasks:
+                logger.info("Продолжаем рассылку #%s с клиента id > %s", row["id"], row["last_client_id"])
+                self._spawn(_Broadcast(row))
+
+    def stop(self, broadcast_id: int) -> bool:
+        """Останавливает рассылку после текущей пачки. False — такой активной нет."""
+        job = self._jobs.get(broadcast_id)
+        if job is None:
+            return False
+        job.stop_requested = True
+        return True
+
+    async def close(self, timeout: float = 10.0):
+        """Даёт задачам дослать текущую пачку (не дольше timeout), затем отменяет их."""
+        self._closing = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    # ====== ВЫПОЛНЕНИЕ ======
+
+    def _spawn(self, job: _Broadcast):
+        self._jobs[job.id] = job
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks[job.id] = task
+
+        def forget(_):
+            self._jobs.pop(job.id, None)
+            self._tasks.pop(job.id, None)
+
+        task.add_done_callback(forget)
+
+    async def _create_and_run(self, text: str, admin_chat_id: int):
+        try:
+            broadcast_id = await async_db.create_broadcast(text, admin_chat_id)
+            job = _Broadcast(await async_db.get_broadcast(broadcast_id))
+        except Exception:
+            logger.exception("Не удалось создать рассылку")
+            return
+        self._spawn(job)
+
+    async def _run(self, job: _Broadcast):
+        try:
+            if job.message_id is None:
+                message = await self.bot.send_message(
+                    job.admin_chat_id,
+                    progress_text(job),
+                    reply_markup=get_broadcast_progress_kb(job.id),
+                )
+                job.message_id = message.message_id
+                await async_db.set_broadcast_message(job.id, job.message_id)
+
+            reported_at = time.monotonic()
+            while not (job.stop_requested or self._closing):
+                rows = await async_db.get_broadcast_recipients(
+                    job.last_client_id, job.max_client_id, self.batch_size,
+                )
+                if not rows:
+                    job.status = "done"
+                    break
+
+                await self._send_batch(job, rows)
+
+                if time.monotonic() - reported_at >= self.progress_interval:
+                    reported_at = time.monotonic()
+                    await self._report(job)
+
+            if job.stop_requested:
+                job.status = "cancelled"
+            if job.status != "running":
+                await async_db.finish_broadcast(job.id, job.status)
+                await self._report(job)
+                logger.info(
+                    "Рассылка #%s %s: доставлено %s, заблокировано %s, ошибок %s, пропущено %s",
+                    job.id, STATUS_TITLES[job.status], job.sent, job.blocked, job.failed, job.skipped,
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # строка остаётся running — рассылка продолжится после перезапуска
+            logger.exception("Рассылка #%s прервана", job.id)
+
+    async def _send_batch(self, job: _Broadcast, rows):
+        futures = []
+        for row in rows:
+            if ban_registry.is_user_banned(row["tg_id"]):
+                job.skipped += 1
+                continue
+            futures.append(enqueue_message(row["tg_id"], job.text, priority=PRIORITY_BULK))
+
+        for result in await asyncio.gather(*futures, return_exceptions=True):
+            if isinstance(result, (Unauthorized, ChatNotFound)):
+                job.blocked += 1
+            elif isinstance(result, asyncio.CancelledError):
+                # outbound остановился раньше рассылки — пачка не дослана
+                raise result
+            elif isinstance(result, BaseException):
+                job.failed += 1
+            else:
+                job.sent += 1
+
+        job.last_client_id = rows[-1]["id"]
+        await async_db.save_broadcast_progress(
+            job.id, job.last_client_id, job.sent, job.blocked, job.failed, job.skipped,
+        )
+
+    async def _report(self, job: _Broadcast):
+        try:
+            await self.bot.edit_message_text(
+                progress_text(job),
+                chat_id=job.admin_chat_id,
+                message_id=job.message_id,
+                reply_markup=get_broadcast_progress_kb(job.id) if job.status == "running" else None,
+            )
+        except MessageNotModified:
+            pass
+        except TelegramAPIError as e:
+            # прогресс — не повод останавливать рассылку
+            logger.warning("Не удалось обновить прогресс рассылки #%s: %s", job.id, e)
+
+
+_engine: typing.Optional[BroadcastEngine] = None
+
+
+def setup(bot: Bot, **kwargs) -> BroadcastEngine:
+    global _engine
+    _engine = BroadcastEngine(bot, **kwargs)
+    return _engine
+
+
+def get_engine() -> BroadcastEngine:
+    if _engine is None:
+        raise RuntimeError("broadcast.setup() не вызван")
+    return _engine
+
+
+async def shutdown(timeout: float = 10.0):
+    if _engine is not None:
+        await _engine.close(timeout)
@@ -0,0 +1,192 @@
+# captcha_tracker.py
+"""
+Счётчики неверных ответов на капчу.
+
+Счётчики живут в памяти процесса: при старте загружаются непросроченные
+записи captcha_attempts, дальше неверный ответ — инкремент в словаре без
+обращения к БД. Изменения копятся и раз в flush_interval секунд пишутся
+одной транзакцией. Счётчик, не менявшийся ttl секунд, обнуляется.
+
+Лимит проверяется синхронно, в том же шаге event loop, что и инкремент:
+пока бан пишется, повторные ответы того же пользователя не засчитываются.
+Бан и сброс счётчика пишутся в БД одной транзакцией; в ban_registry
+пользователь попадает после её коммита, дальше его отсекает BanGuard.
+"""
+import asyncio
+import logging
+import time
+import typing
+
+import async_db
+import ban_registry
+
+logger = logging.getLogger(__name__)
+
+# раз в столько секунд из памяти выбрасываются просроченные счётчики
+SWEEP_INTERVAL = 60.0
+
+
+class _Attempts:
+    __slots__ = ("count", "last_at")
+
+    def __init__(self, count: int, last_at: float):
+        self.count = count
+        self.last_at = last_at
+
+
+class CaptchaTracker:
+    def __init__(self, max_attempts: int = 5, ttl: float = 3600.0, flush_interval: float = 1.0,
+                 clock: typing.Callable[[], float] = time.time):
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # unix-время: счётчики сохраняются в БД и переживают перезапуск
+        self.clock = clock
+        self._entries: typing.Dict[int, _Attempts] = {}
+        # изменённые с последнего сброса; нет в _entries — удалить из БД
+        self._dirty: typing.Set[int] = set()
+        # бан уже пишется в БД
+        self._banning: typing.Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: typing.Optional[asyncio.Task] = None
+        self._next_sweep = 0.0
+        self._closed = False
+
+    @property
+    def ban_reason(self) -> str:
+        return f"Не прошёл капчу {self.max_attempts} раз."
+
+    def load(self, rows: typing.Iterable[typing.Tuple[int, int, typing.Optional[int]]]):
+        """Заполняет счётчики строками (tg_id, attempts, last_attempt_ts) из БД."""
+        now = self.clock()
+        self._entries = {
+            tg_id: _Attempts(attempts, last_ts if last_ts is not None else now)
+            for tg_id, attempts, last_ts in rows
+        }
+        self._dirty.clear()
+
+    def _live(self, tg_id: int, now: float) -> typing.Optional[_Attempts]:
+        entry = self._entries.get(tg_id)
+        if entry is not None and now - entry.last_at > self.ttl:
+            return None
+        return entry
+
+    def attempts(self, tg_id: int) -> int:
+        entry = self._live(tg_id, self.clock())
+        return entry.count if entry else 0
+
+    async def fail(self, tg_id: int) -> int:
+        """
+        Засчитывает неверный ответ и возвращает число попыток. Достигнут
+        max_attempts — пользователь забанен, возвращается max_attempts.
+        """
+        if tg_id in self._banning or ban_registry.is_user_banned(tg_id):
+            # повторный клик, пока бан пишется в БД
+            return self.max_attempts
+
+        now = self.clock()
+        entry = self._live(tg_id, now)
+        if entry is None:
+            entry = self._entries[tg_id] = _Attempts(0, now)
+        entry.count += 1
+        entry.last_at = now
+
+        if entry.count < self.max_attempts:
+            self._mark_dirty(tg_id)
+            return entry.count
+
+        # до первого await: следующие ответы пользователя уже не считаются
+        del self._entries[tg_id]
+        self._dirty.discard(tg_id)
+        self._banning.add(tg_id)
+        try:
+            # ban_registry обновится после коммита (async_db.ban_for_captcha)
+            await async_db.ban_for_captcha(tg_id, self.ban_reason)
+        finally:
+            self._banning.discard(tg_id)
+        return self.max_attempts
+
+    def reset(self, tg_id: int):
+        """Верный ответ — счётчик сбрасывается."""
+        if self._entries.pop(tg_id, None) is not None:
+            self._mark_dirty(tg_id)
+
+    def _mark_dirty(self, tg_id: int):
+        self._dirty.add(tg_id)
+        if self._flusher is None and not self._closed:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    def _sweep(self, now: float):
+        expired = [tg_id for tg_id, entry in self._entries.items() if now - entry.last_at > self.ttl]
+        for tg_id in expired:
+            del self._entries[tg_id]
+        # просроченные строки в БД тоже больше не нужны
+        self._dirty.update(expired)
+
+    # ====== ЗАПИСЬ В БД ======
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить счётчики капчи")
+
+    async def flush(self):
+        async with self._flush_lock:
+            now = self.clock()
+            if now >= self._next_sweep:
+                self._next_sweep = now + SWEEP_INTERVAL
+                self._sweep(now)
+
+            if not self._dirty:
+                return
+
+            keys, self._dirty = self._dirty, set()
+            upserts = []
+            deletes = []
+            for tg_id in keys:
+                entry = self._entries.get(tg_id)
+                if entry is None:
+                    deletes.append((tg_id,))
+                else:
+                    upserts.append((tg_id, entry.count, entry.last_at))
+
+            try:
+                await async_db.save_captcha_attempts(upserts, deletes)
+            except BaseException:
+                # и при отмене (close() посреди записи): ключи вернутся
+                # и уйдут последним flush()
+                self._dirty |= keys
+                raise
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.wait({self._flusher})
+            self._flusher = None
+        await self.flush()
+
+
+_tracker: typing.Optional[CaptchaTracker] = None
+
+
+def setup(**kwargs) -> CaptchaTracker:
+    global _tracker
+    _tracker = CaptchaTracker(**kwargs)
+    return _tracker
+
+
+def get_tracker() -> CaptchaTracker:
+    if _tracker is None:
+        raise RuntimeError("captcha_tracker.setup() не вызван")
+    return _tracker
+
+
+async def shutdown():
+    if _tracker is not None:
+        await _tracker.close()
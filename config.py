@@ -1,5 +1,6 @@
 # config.py
 import os
+from pathlib import Path
 
 from dotenv import load_dotenv
 
@@ -7,3 +8,104 @@ load_dotenv()
 
 TOKEN = os.getenv("BOT_TOKEN")  # токен из .env
 ADMIN_ID = int(os.getenv("ADMIN_ID", "1114403361"))
+
+# ====== КАТАЛОГ ======
+# JSON-файл с услугами; изменения подхватываются без перезапуска
+CATALOG_PATH = Path(os.getenv("CATALOG_PATH", Path(__file__).with_name("catalog.json")))
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "10"))
+
+# ====== РЕЖИМ ЗАПУСКА ======
+# polling — long polling; webhook — aiohttp-сервер (см. webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# больше 1 — polling через супервизор и столько процессов-воркеров
+# (см. supervisor.py); пользователь всегда обрабатывается одним воркером
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# как часто воркер подтягивает баны, выданные другими воркерами (секунды)
+BAN_SYNC_INTERVAL = float(os.getenv("BAN_SYNC_INTERVAL", "1.0"))
+
+# публичный адрес, который регистрируется в Telegram: WEBHOOK_HOST + WEBHOOK_PATH
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# значение заголовка X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# где слушает локальный сервер (за балансировщиком)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# ====== ПЛАНИРОВЩИК АПДЕЙТОВ ======
+# апдейтов разных пользователей, обрабатываемых одновременно
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+# больше стольких ждущих апдейтов — новые отбрасываются
+UPDATE_MAX_BACKLOG = int(os.getenv("UPDATE_MAX_BACKLOG", "1000"))
+# необработанных апдейтов одного пользователя, сверх — отбрасываются
+UPDATE_USER_BACKLOG = int(os.getenv("UPDATE_USER_BACKLOG", "5"))
+# сколько секунд помнить update_id и id callback_query, чтобы отбросить повтор
+UPDATE_DEDUPE_TTL = float(os.getenv("UPDATE_DEDUPE_TTL", "600"))
+
+# ====== МЕТРИКИ ======
+# GET /metrics в формате Prometheus; METRICS_PORT=0 — не поднимать сервер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+# ====== SQLITE ======
+# потоки-читатели SQLite (запись всегда идёт в одном отдельном потоке)
+DB_READER_THREADS = int(os.getenv("DB_READER_THREADS", "4"))
+
+# журнал всегда WAL; остальное настраивается через окружение
+# свободных соединений в пуле: каждая DBSession держит своё соединение весь
+# апдейт, плюс потоки-читатели и писатель вне сессий — иначе под нагрузкой
+# лишние соединения закрываются при возврате и тут же открываются снова
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(UPDATE_CONCURRENCY + DB_READER_THREADS + 1)))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000"))  # отрицательное — в КиБ
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+# больше стольких SQL-запросов за апдейт — предупреждение в лог (поиск N+1)
+DB_SESSION_WARN_QUERIES = int(os.getenv("DB_SESSION_WARN_QUERIES", "20"))
+
+# ====== ОБСЛУЖИВАНИЕ БД ======
+# done/cancelled заказы старше стольких дней переносятся в orders_archive; 0 — не переносить
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+# заказов в одной транзакции переноса
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+# раз в столько секунд: архив, очистка журналов, incremental vacuum, ANALYZE
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+
+# ====== FSM ======
+# как часто сбрасывать накопленные изменения состояний на диск (секунды)
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+
+# ====== КАПЧА ======
+# неверных ответов до бана; счётчик забывается через TTL без ошибок (секунды)
+CAPTCHA_MAX_ATTEMPTS = int(os.getenv("CAPTCHA_MAX_ATTEMPTS", "5"))
+CAPTCHA_ATTEMPT_TTL = float(os.getenv("CAPTCHA_ATTEMPT_TTL", "3600"))
+CAPTCHA_FLUSH_INTERVAL = float(os.getenv("CAPTCHA_FLUSH_INTERVAL", "1.0"))
+
+# ====== РАССЫЛКИ ======
+# получателей в одной пачке: прогресс сохраняется после каждой пачки,
+# после перезапуска повторно может уйти только недосланная пачка
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "50"))
+# не чаще раза в столько секунд обновлять сообщение с прогрессом
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3.0"))
+
+# ====== ИСХОДЯЩИЕ СООБЩЕНИЯ ======
+# Telegram допускает ~30 сообщений/с на бота и ~1 сообщение/с в один чат;
+# часть бюджета оставлена под прямые ответы хендлеров
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "20"))
+OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", "20"))
+OUTBOUND_CHAT_INTERVAL = float(os.getenv("OUTBOUND_CHAT_INTERVAL", "1.0"))
+OUTBOUND_CONCURRENCY = int(os.getenv("OUTBOUND_CONCURRENCY", "8"))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+
+# ====== OUTBOX УВЕДОМЛЕНИЙ ======
+# уведомлений, забираемых из БД за раз
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+# проверка outbox без сигнала о коммите, секунды
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5.0"))
+# на сколько секунд пачка закрепляется за процессом; упал — её отправит другой
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "120"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
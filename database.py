@@ -1,111 +1,209 @@
+import logging
+import queue
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Optional, List
 
+import ban_registry
+import migrations
+from config import (
+    DB_POOL_SIZE,
+    DB_SYNCHRONOUS,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE,
+    DB_MMAP_SIZE,
+    DB_STATEMENT_CACHE,
+)
+
+logger = logging.getLogger(__name__)
+
 DB_PATH = Path("database.sqlite3")
 
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+MAX_ROWID = 2 ** 63 - 1
 
+# значение PRAGMA auto_vacuum
+AUTO_VACUUM_INCREMENTAL = 2
 
-def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS clients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER UNIQUE,
-            username TEXT,
-            name TEXT
-        )
-        """
-    )
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            client_id INTEGER,
-            type TEXT,
-            service_code TEXT,
-            title TEXT,
-            description TEXT,
-            budget TEXT,
-            deadline TEXT,
-            contact_method TEXT,
-            contact_value TEXT,
-            status TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (client_id) REFERENCES clients(id)
-        )
-        """
-    )
+# ====== ПУЛ СОЕДИНЕНИЙ ======
 
-    # ====== ЧЁРНЫЙ СПИСОК ======
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS banned_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER UNIQUE,
-            reason TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            active INTEGER DEFAULT 1
-        )
-        """
-    )
+class ConnectionPool:
+    """
+    Держит открытые соединения с SQLite и раздаёт их потокам.
+
+    Соединение создаётся один раз: схема разбирается однажды, PRAGMA
+    применяются однажды, а кэш подготовленных выражений (cached_statements)
+    живёт вместе с соединением. В пуле остаётся не больше size свободных
+    соединений, лишние закрываются при возврате.
+    """
 
-    # ====== ПОПЫТКИ КАПЧИ ======
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS captcha_attempts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER UNIQUE,
-            attempts INTEGER DEFAULT 0,
-            last_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    def __init__(self, path: Path, size: int = DB_POOL_SIZE):
+        if DB_SYNCHRONOUS not in SYNCHRONOUS_MODES:
+            raise ValueError(f"DB_SYNCHRONOUS должен быть одним из {SYNCHRONOUS_MODES}")
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
         )
-        """
-    )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size = {int(DB_CACHE_SIZE)}")
+        conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed or self._idle.qsize() >= self.size:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
 
-    # ====== ЗАЯВКИ НА РАЗБАН ======
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS unban_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER,
-            reason TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-    )
 
-    conn.commit()
-    conn.close()
+def get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    if pool is None or pool.path != DB_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.path != DB_PATH:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_PATH)
+            pool = _pool
+    return pool
+
+
+# соединение сессии апдейта, привязанное к текущему потоку (async_db.DBSession)
+_bound = threading.local()
+
+
+@contextmanager
+def bind_connection(conn: sqlite3.Connection):
+    _bound.conn = conn
+    try:
+        yield conn
+    finally:
+        _bound.conn = None
+
+
+@contextmanager
+def _session_connection(conn: sqlite3.Connection):
+    # транзакцией управляет сессия
+    yield conn
+
+
+def get_connection():
+    """
+    Соединение из пула на время блока with.
+
+    При выходе без исключения транзакция коммитится, при исключении —
+    откатывается; соединение в любом случае возвращается в пул. Внутри
+    сессии апдейта отдаётся её соединение, коммит делает сессия.
+    """
+    conn = getattr(_bound, "conn", None)
+    if conn is not None:
+        return _session_connection(conn)
+    return get_pool().connection()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def init_db():
+    with get_connection() as conn:
+        _enable_incremental_vacuum(conn)
+        migrations.migrate(conn)
+
+
+def _enable_incremental_vacuum(conn: sqlite3.Connection):
+    """
+    auto_vacuum = INCREMENTAL: освобождённые страницы возвращает
+    maintenance.py через incremental_vacuum. Файл к этому моменту уже
+    создан (journal_mode = WAL), поэтому режим включает однократный VACUUM —
+    для новой базы он мгновенный.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        logger.info("Перевод базы в auto_vacuum = INCREMENTAL (однократный VACUUM)")
+    conn.execute("VACUUM")
 
 
 def get_or_create_client(tg_id: int, username: Optional[str], name: Optional[str]) -> int:
-    conn = get_connection()
-    cur = conn.cursor()
+    with get_connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute("SELECT * FROM clients WHERE tg_id = ?", (tg_id,))
-    row = cur.fetchone()
-    if row:
-        conn.close()
-        return row["id"]
+        cur.execute("SELECT * FROM clients WHERE tg_id = ?", (tg_id,))
+        row = cur.fetchone()
+        if row:
+            return row["id"]
 
-    cur.execute(
-        "INSERT INTO clients (tg_id, username, name) VALUES (?, ?, ?)",
-        (tg_id, username, name),
-    )
-    conn.commit()
-    client_id = cur.lastrowid
-    conn.close()
-    return client_id
+        cur.execute(
+            "INSERT INTO clients (tg_id, username, name) VALUES (?, ?, ?)",
+            (tg_id, username, name),
+        )
+        client_id = cur.lastrowid
+        return client_id
 
 
 def add_order(
@@ -118,226 +216,708 @@ def add_order(
     deadline: Optional[str],
     contact_method: str,
     contact_value: str,
+    idempotency_key: Optional[str] = None,
 ) -> int:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO orders (
-            client_id, type, service_code, title, description,
-            budget, deadline, contact_method, contact_value, status
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'new')
-        """,
-        (
-            client_id,
-            type_,
-            service_code,
-            title,
-            description,
-            budget,
-            deadline,
-            contact_method,
-            contact_value,
-        ),
-    )
-    conn.commit()
-    order_id = cur.lastrowid
-    conn.close()
-    return order_id
+    """
+    Создаёт заказ. Заказ с тем же idempotency_key уже есть — новая строка
+    не пишется (уникальный индекс), возвращается id существующего.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO orders (
+                client_id, type, service_code, title, description,
+                budget, deadline, contact_method, contact_value, status,
+                idempotency_key
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'new', ?)
+            ON CONFLICT(idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            """,
+            (
+                client_id,
+                type_,
+                service_code,
+                title,
+                description,
+                budget,
+                deadline,
+                contact_method,
+                contact_value,
+                idempotency_key,
+            ),
+        )
+        if cur.rowcount:
+            return cur.lastrowid
+        cur.execute("SELECT id FROM orders WHERE idempotency_key = ?", (idempotency_key,))
+        return cur.fetchone()[0]
+
+
+def get_order_id_by_key(idempotency_key: Optional[str]) -> Optional[int]:
+    if idempotency_key is None:
+        return None
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT id FROM orders WHERE idempotency_key = ?",
+            (idempotency_key,),
+        ).fetchone()
+        return row[0] if row else None
+
+
+def get_orders_page(per_page: int = 3, after_id: Optional[int] = None, before_id: Optional[int] = None):
+    """
+    Страница активных заказов (new / in_progress), новые сверху.
+
+    Пагинация по ключу: after_id — следующая страница (заказы старше
+    after_id), before_id — предыдущая (заказы новее before_id). Условие
+    по статусу совпадает с частичным индексом idx_orders_active
+    (migrations.py), поэтому и страница, и счётчик читаются из индекса,
+    а не из всей таблицы.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute(
+            "SELECT COUNT(*) AS cnt FROM orders WHERE status IN ('new', 'in_progress')"
+        )
+        total = cur.fetchone()["cnt"]
+
+        if before_id is not None:
+            cur.execute(
+                """
+                SELECT o.*, c.name AS client_name
+                FROM orders o
+                LEFT JOIN clients c ON c.id = o.client_id
+                WHERE o.status IN ('new', 'in_progress') AND o.id > ?
+                ORDER BY o.id ASC
+                LIMIT ?
+                """,
+                (before_id, per_page),
+            )
+            rows = cur.fetchall()[::-1]
+        else:
+            cur.execute(
+                """
+                SELECT o.*, c.name AS client_name
+                FROM orders o
+                LEFT JOIN clients c ON c.id = o.client_id
+                WHERE o.status IN ('new', 'in_progress') AND o.id < ?
+                ORDER BY o.id DESC
+                LIMIT ?
+                """,
+                (after_id if after_id is not None else MAX_ROWID, per_page),
+            )
+            rows = cur.fetchall()
+        return rows, total
 
 
-def get_orders_page(page: int, per_page: int = 3):
-    offset = (page - 1) * per_page
-    conn = get_connection()
-    cur = conn.cursor()
+def get_order_by_id(order_id: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT o.*, c.name AS client_name, c.tg_id AS client_tg_id
+            FROM orders o
+            LEFT JOIN clients c ON c.id = o.client_id
+            WHERE o.id = ?
+            """,
+            (order_id,),
+        )
+        row = cur.fetchone()
+        return row
 
-    cur.execute("SELECT COUNT(*) AS cnt FROM orders")
-    total = cur.fetchone()["cnt"]
 
-    cur.execute(
-        """
-        SELECT o.*, c.name AS client_name
-        FROM orders o
-        LEFT JOIN clients c ON c.id = o.client_id
-        ORDER BY o.id DESC
-        LIMIT ? OFFSET ?
-        """,
-        (per_page, offset),
+def update_order_status(order_id: int, status: str):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
+
+
+def get_orders_stats():
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        # счётчики ведут триггеры миграции 4, полного прохода по orders нет
+        cur.execute("SELECT status, count FROM order_stats WHERE count > 0")
+        rows = cur.fetchall()
+        total = sum(row[1] for row in rows)
+        return total, rows
+
+
+def get_order_rollups(period: str):
+    """Свёртки заказов, созданных в текущем дне/неделе/месяце: (dimension, key, count)."""
+    fmt = dict(migrations.ROLLUP_PERIODS)[period]
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT dimension, key, count
+            FROM order_rollups
+            WHERE period = ? AND bucket = strftime(?, 'now') AND count > 0
+            ORDER BY dimension, count DESC
+            """,
+            (period, fmt),
+        )
+        return cur.fetchall()
+
+
+# ====== ПОИСК ======
+
+# Релевантность — сумма весов колонок orders_fts, в которых есть совпадение
+# (title, description, contact_value, client_name, client_username); при
+# равенстве выше более новый заказ. bm25 не подходит: на каждый запрос он
+# проходит весь список документов термина ради IDF, и частые слова на
+# миллионе заказов стоят десятки миллисекунд. Ранжируются только
+# SEARCH_CANDIDATES самых новых совпадений — их FTS5 отдаёт без сортировки.
+SEARCH_WEIGHTS = (3, 1, 4, 2, 2)
+SEARCH_CANDIDATES = 200
+_SEARCH_SCORE = " + ".join(
+    f"(instr(highlight(orders_fts, {column}, char(2), char(3)), char(2)) > 0) * {weight}"
+    for column, weight in enumerate(SEARCH_WEIGHTS)
+)
+
+# маркеры совпадений в сниппете (char(2) и char(3) в SQL);
+# экранирует и заменяет их вызывающий
+SNIPPET_OPEN = "\x02"
+SNIPPET_CLOSE = "\x03"
+
+# как режет текст токенайзер unicode61: "_" — разделитель
+_SEARCH_TOKEN = re.compile(r"[^\W_]+")
+# длиннее индексируемых префиксов слово обрезается: грубый стемминг
+# (металлоконструкции -> металл*) без перебора терминов
+_SEARCH_PREFIX = 6
+
+
+def fts_query(text: str, max_terms: int = 8) -> str:
+    """
+    Запрос пользователя -> выражение MATCH: все слова обязательны, слова
+    от двух символов ищутся как префиксы (балк -> балка, балки).
+    Синтаксис FTS5 из ввода не пропускается.
+    """
+    tokens = _SEARCH_TOKEN.findall(text.lower())[:max_terms]
+    return " ".join(
+        # префиксы из одного символа не индексируются — такое слово ищется целиком
+        f'"{token[:_SEARCH_PREFIX]}"*' if len(token) > 1 else f'"{token}"'
+        for token in tokens
     )
-    rows = cur.fetchall()
-    conn.close()
-    return rows, total
 
 
-def get_order_by_id(order_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT o.*, c.name AS client_name, c.tg_id AS client_tg_id
-        FROM orders o
+def search_orders(match: str, limit: int, after: Optional[tuple] = None):
+    """
+    Заказы по релевантности: (id, score, snippet, status, type, title, service_code).
+    after — (score, id) последней строки предыдущей страницы.
+    """
+    keyset = "WHERE (score, id) < (?, ?)" if after else ""
+    params = [match, SEARCH_CANDIDATES, *(after or ()), limit, match]
+    with get_connection() as conn:
+        cur = conn.cursor()
+        # сниппет считается только для строк страницы, а не для всех совпадений
+        cur.execute(
+            f"""
+            WITH candidates AS (
+                SELECT rowid AS id, {_SEARCH_SCORE} AS score
+                FROM orders_fts
+                WHERE orders_fts MATCH ?
+                ORDER BY rowid DESC
+                LIMIT ?
+            ),
+            page AS (
+                SELECT id, score FROM candidates
+                {keyset}
+                ORDER BY score DESC, id DESC
+                LIMIT ?
+            )
+            SELECT page.id, page.score,
+                   snippet(orders_fts, -1, char(2), char(3), '…', 8) AS snippet,
+                   o.status, o.type, o.title, o.service_code
+            FROM page
+            JOIN orders_fts ON orders_fts.rowid = page.id AND orders_fts MATCH ?
+            JOIN orders o ON o.id = page.id
+            ORDER BY page.score DESC, page.id DESC
+            """,
+            params,
+        )
+        return cur.fetchall()
+
+
+# ====== ВЫГРУЗКА ЗАКАЗОВ ======
+
+def iter_orders_for_export(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    statuses: Optional[tuple] = None,
+    batch_size: int = 1000,
+):
+    """
+    Заказы (и архивные) с данными клиента в порядке id — генератором, по batch_size строк
+    из курсора. date_from включительно, date_to не включительно
+    ('YYYY-MM-DD' или 'YYYY-MM-DD HH:MM:SS'). Соединение занято, пока
+    генератор не исчерпан или не закрыт.
+    """
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append("o.created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("o.created_at < ?")
+        params.append(date_to)
+    if statuses:
+        conditions.append(f"o.status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # заказы и архив — два потока в порядке id, SQLite сливает их без сортировки
+    select = f"""
+        SELECT o.id, o.created_at, o.status, o.type, o.service_code, o.title,
+               o.description, o.budget, o.deadline, o.contact_method, o.contact_value,
+               c.tg_id, c.username, c.name
+        FROM {{table}} o
         LEFT JOIN clients c ON c.id = o.client_id
-        WHERE o.id = ?
-        """,
-        (order_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row
-
-
-def update_order_status(order_id: int, status: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
-    conn.commit()
-    conn.close()
+        {where}
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            select.format(table="orders")
+            + " UNION ALL "
+            + select.format(table="orders_archive")
+            + " ORDER BY 1",
+            params * 2,
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
 
 
 # ====== ЧЁРНЫЙ СПИСОК / БАН ======
+# проверки бана — только через ban_registry (память)
 
-def is_user_banned(tg_id: int) -> bool:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT active FROM banned_users WHERE tg_id = ?",
-        (tg_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return bool(row and row["active"] == 1)
+def ban_user(tg_id: int, reason: str):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO banned_users (tg_id, reason, active)
+            VALUES (?, ?, 1)
+            ON CONFLICT(tg_id) DO UPDATE SET reason = excluded.reason, active = 1
+            """,
+            (tg_id, reason),
+        )
 
 
-def get_ban_reason(tg_id: int) -> Optional[str]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT reason FROM banned_users WHERE tg_id = ? AND active = 1",
-        (tg_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row["reason"] if row else None
+def unban_user(tg_id: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE banned_users SET active = 0 WHERE tg_id = ?",
+            (tg_id,),
+        )
 
 
-def ban_user(tg_id: int, reason: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO banned_users (tg_id, reason, active)
-        VALUES (?, ?, 1)
-        ON CONFLICT(tg_id) DO UPDATE SET reason = excluded.reason, active = 1
-        """,
-        (tg_id, reason),
-    )
-    conn.commit()
-    conn.close()
+def load_ban_registry() -> int:
+    """Загружает активные баны в ban_registry; возвращает id последнего события ban_events."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        # id — до чтения банов: событие, записанное между запросами,
+        # просто применится ещё раз
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM ban_events")
+        last_event_id = cur.fetchone()[0]
+        cur.execute("SELECT tg_id, reason FROM banned_users WHERE active = 1")
+        ban_registry.load((row["tg_id"], row["reason"]) for row in cur)
+    return last_event_id
+
+
+def get_ban_events(after_id: int, limit: int = 1000):
+    """Изменения чёрного списка после after_id: (id, tg_id, reason, active)."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, tg_id, reason, active FROM ban_events WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        return cur.fetchall()
 
 
-def unban_user(tg_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE banned_users SET active = 0 WHERE tg_id = ?",
-        (tg_id,),
-    )
-    conn.commit()
-    conn.close()
+def prune_ban_events(older_than_days: int = 1) -> int:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM ban_events WHERE created_at < datetime('now', ?)",
+            (f"-{older_than_days} days",),
+        )
+        return cur.rowcount
 
 
 def get_banned_users():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM banned_users WHERE active = 1 ORDER BY created_at DESC"
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT * FROM banned_users WHERE active = 1 ORDER BY created_at DESC"
+        )
+        rows = cur.fetchall()
+        return rows
 
 
 # ====== ПОПЫТКИ КАПЧИ ======
-
-def get_captcha_attempts(tg_id: int) -> int:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT attempts FROM captcha_attempts WHERE tg_id = ?",
-        (tg_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row["attempts"] if row else 0
-
-
-def increment_captcha_attempts(tg_id: int) -> int:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO captcha_attempts (tg_id, attempts)
-        VALUES (?, 1)
-        ON CONFLICT(tg_id) DO UPDATE SET attempts = attempts + 1
-        """,
-        (tg_id,),
-    )
-    conn.commit()
-    cur.execute(
-        "SELECT attempts FROM captcha_attempts WHERE tg_id = ?",
-        (tg_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return row["attempts"] if row else 0
+# счётчики ведёт captcha_tracker в памяти, здесь загрузка и пакетная запись
+
+def load_captcha_attempts(since: float):
+    """
+    Счётчики с последней попыткой не раньше since (unix-время):
+    [(tg_id, attempts, last_attempt_ts)]. Более старые удаляются.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM captcha_attempts WHERE last_attempt_at < datetime(?, 'unixepoch')",
+            (since,),
+        )
+        cur.execute(
+            """
+            SELECT tg_id, attempts,
+                   CAST(strftime('%s', last_attempt_at) AS INTEGER) AS last_ts
+            FROM captcha_attempts
+            """
+        )
+        return [(row["tg_id"], row["attempts"], row["last_ts"]) for row in cur]
+
+
+def save_captcha_attempts(upserts, deletes):
+    """
+    upserts: [(tg_id, attempts, last_attempt_ts)], deletes: [(tg_id,)].
+    Всё пишется одной транзакцией.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            """
+            INSERT INTO captcha_attempts (tg_id, attempts, last_attempt_at)
+            VALUES (?, ?, datetime(?, 'unixepoch'))
+            ON CONFLICT(tg_id) DO UPDATE SET
+                attempts = excluded.attempts,
+                last_attempt_at = excluded.last_attempt_at
+            """,
+            upserts,
+        )
+        cur.executemany(
+            "DELETE FROM captcha_attempts WHERE tg_id = ?",
+            deletes,
+        )
 
 
-def reset_captcha_attempts(tg_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM captcha_attempts WHERE tg_id = ?",
-        (tg_id,),
-    )
-    conn.commit()
-    conn.close()
+def ban_for_captcha(tg_id: int, reason: str):
+    """Бан за капчу и сброс счётчика одной транзакцией."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO banned_users (tg_id, reason, active)
+            VALUES (?, ?, 1)
+            ON CONFLICT(tg_id) DO UPDATE SET reason = excluded.reason, active = 1
+            """,
+            (tg_id, reason),
+        )
+        cur.execute(
+            "DELETE FROM captcha_attempts WHERE tg_id = ?",
+            (tg_id,),
+        )
 
 
 # ====== ЗАЯВКИ НА РАЗБАН ======
 
 def add_unban_request(tg_id: int, reason: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO unban_requests (tg_id, reason, status)
-        VALUES (?, ?, 'pending')
-        """,
-        (tg_id, reason),
-    )
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO unban_requests (tg_id, reason, status)
+            VALUES (?, ?, 'pending')
+            """,
+            (tg_id, reason),
+        )
 
 
 def get_unban_requests(status: str = "pending"):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM unban_requests WHERE status = ? ORDER BY created_at DESC",
-        (status,),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT * FROM unban_requests WHERE status = ? ORDER BY created_at DESC",
+            (status,),
+        )
+        rows = cur.fetchall()
+        return rows
+
+
+def get_unban_request(request_id: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM unban_requests WHERE id = ?", (request_id,))
+        row = cur.fetchone()
+        return row
 
 
 def update_unban_request_status(request_id: int, status: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE unban_requests SET status = ? WHERE id = ?",
-        (status, request_id),
-    )
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE unban_requests SET status = ? WHERE id = ?",
+            (status, request_id),
+        )
+
+
+# ====== РАССЫЛКИ ======
+
+def count_clients() -> int:
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM clients")
+        return cur.fetchone()[0]
+
+
+def create_broadcast(text: str, admin_chat_id: int) -> int:
+    """Рассылка всем клиентам, зарегистрированным на момент вызова."""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO broadcasts (text, admin_chat_id, max_client_id, total)
+            SELECT ?, ?, COALESCE(MAX(id), 0), COUNT(*) FROM clients
+            """,
+            (text, admin_chat_id),
+        )
+        return cur.lastrowid
+
+
+def get_broadcast(broadcast_id: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,))
+        return cur.fetchone()
+
+
+def get_running_broadcasts():
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+        return cur.fetchall()
+
+
+def get_broadcast_recipients(after_client_id: int, max_client_id: int, limit: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id, tg_id FROM clients
+            WHERE id > ? AND id <= ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (after_client_id, max_client_id, limit),
+        )
+        return cur.fetchall()
+
+
+def set_broadcast_message(broadcast_id: int, message_id: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE broadcasts SET progress_message_id = ? WHERE id = ?",
+            (message_id, broadcast_id),
+        )
+
+
+def save_broadcast_progress(
+    broadcast_id: int,
+    last_client_id: int,
+    sent: int,
+    blocked: int,
+    failed: int,
+    skipped: int,
+):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE broadcasts
+            SET last_client_id = ?, sent = ?, blocked = ?, failed = ?, skipped = ?
+            WHERE id = ?
+            """,
+            (last_client_id, sent, blocked, failed, skipped, broadcast_id),
+        )
+
+
+def finish_broadcast(broadcast_id: int, status: str):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+            """,
+            (status, broadcast_id),
+        )
+
+
+# ====== OUTBOX УВЕДОМЛЕНИЙ ======
+# отправляет outbox.py; строка удаляется после доставки
+
+def add_outbox_message(chat_id: int, text: str, priority: int):
+    with get_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO outbox (chat_id, text, priority, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (chat_id, text, priority, time.time()),
+        )
+
+
+def claim_outbox(limit: int, lease: float):
+    """
+    Забирает до limit готовых к отправке сообщений: срок следующей попытки
+    сдвигается на lease секунд, попытка засчитывается. Пока срок не истёк,
+    сообщение не достанется другому процессу; процесс упал — после lease
+    сообщение отправит кто-то другой.
+    """
+    now = time.time()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE outbox
+            SET next_attempt_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE next_attempt_at <= ?
+                ORDER BY priority, id
+                LIMIT ?
+            )
+            RETURNING id, chat_id, text, priority, attempts
+            """,
+            (now + lease, now, limit),
+        )
+        return sorted(cur.fetchall(), key=lambda row: (row["priority"], row["id"]))
+
+
+def finish_outbox(delivered, retries, released):
+    """
+    delivered: [(id,)] — удалить; retries: [(next_attempt_ts, error, id)] —
+    повторить в next_attempt_ts (None — больше не пытаться); released:
+    [(id,)] — не отправлялись, вернуть в очередь без траты попытки.
+    Всё пишется одной транзакцией.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany("DELETE FROM outbox WHERE id = ?", delivered)
+        cur.executemany(
+            "UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?",
+            retries,
+        )
+        cur.executemany(
+            "UPDATE outbox SET next_attempt_at = ?, attempts = attempts - 1 WHERE id = ?",
+            [(time.time(), outbox_id) for outbox_id, in released],
+        )
+
+
+# ====== ОБСЛУЖИВАНИЕ ======
+# вызывается из maintenance.py
+
+_ARCHIVE_COLUMNS = (
+    "id, client_id, type, service_code, title, description, budget, deadline, "
+    "contact_method, contact_value, status, created_at, idempotency_key"
+)
+
+
+def archive_orders(older_than_days: int, limit: int) -> int:
+    """
+    Переносит до limit заказов в статусе done/cancelled, созданных раньше
+    older_than_days дней назад, в orders_archive одной транзакцией.
+    Возвращает число перенесённых. order_stats и order_rollups не меняются:
+    статистика остаётся за всю историю. Из поиска заказ убирает
+    trg_orders_fts_delete.
+    """
+    age = f"-{older_than_days} days"
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            INSERT INTO orders_archive ({_ARCHIVE_COLUMNS})
+            SELECT {_ARCHIVE_COLUMNS} FROM orders
+            WHERE status IN ('done', 'cancelled') AND created_at < datetime('now', ?)
+            ORDER BY created_at
+            LIMIT ?
+            """,
+            (age, limit),
+        )
+        moved = cur.rowcount
+        # удаляются те же строки: подходящие и уже лежащие в архиве
+        cur.execute(
+            """
+            DELETE FROM orders WHERE id IN (
+                SELECT o.id FROM orders o
+                JOIN orders_archive a ON a.id = o.id
+                WHERE o.status IN ('done', 'cancelled') AND o.created_at < datetime('now', ?)
+            )
+            """,
+            (age,),
+        )
+        return moved
+
+
+def incremental_vacuum(pages: int) -> int:
+    """Возвращает до pages свободных страниц файлу; результат — сколько свободных осталось."""
+    with get_connection() as conn:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def optimize_db(analysis_limit: int = 1000):
+    """
+    Статистика для планировщика запросов (ANALYZE по выборке из
+    analysis_limit строк на индекс, затем PRAGMA optimize) и сброс WAL.
+    """
+    with get_connection() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        # WAL после переноса и vacuum разрастается; без читателей обрезается до нуля
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+# ====== FSM-ХРАНИЛИЩЕ ======
+
+def get_fsm_record(chat_id: int, user_id: int):
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT state, data FROM fsm_storage WHERE chat_id = ? AND user_id = ?",
+            (chat_id, user_id),
+        )
+        return cur.fetchone()
+
+
+def save_fsm_records(upserts, deletes):
+    """
+    upserts: [(chat_id, user_id, state, data_json)], deletes: [(chat_id, user_id)].
+    Всё пишется одной транзакцией.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            """
+            INSERT INTO fsm_storage (chat_id, user_id, state, data, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                state = excluded.state,
+                data = excluded.data,
+                updated_at = excluded.updated_at
+            """,
+            upserts,
+        )
+        cur.executemany(
+            "DELETE FROM fsm_storage WHERE chat_id = ? AND user_id = ?",
+            deletes,
+        )
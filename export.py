@@ -0,0 +1,155 @@
+# export.py
+"""
+Выгрузка заказов в CSV или XLSX.
+
+Строки идут из database.iter_orders_for_export генератором и сразу
+пишутся во временный файл, поэтому память не зависит от числа заказов:
+для CSV — буфер файла, для XLSX — write-only книга openpyxl, которая
+сбрасывает строки на диск по мере записи.
+
+openpyxl — необязательная зависимость: без неё доступен только CSV.
+Вся работа синхронная и выполняется в потоке БД (async_db.export_orders).
+"""
+import csv
+import datetime
+import os
+import re
+import tempfile
+import typing
+from pathlib import Path
+
+import database
+from services import get_service_by_code
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+FORMATS = ("csv", "xlsx")
+
+# Лимит Telegram на документ, отправленный ботом
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+HEADERS = (
+    "ID", "Создан", "Статус", "Тип", "Код услуги", "Услуга / название", "Описание",
+    "Бюджет", "Сроки", "Способ связи", "Контакт",
+    "Telegram ID", "Username", "Имя",
+)
+
+# фильтры выгрузки из админки: код -> статусы (None — все)
+STATUS_FILTERS = {
+    "all": None,
+    "active": ("new", "in_progress"),
+    "new": ("new",),
+    "work": ("in_progress",),
+    "done": ("done",),
+    "cancel": ("cancelled",),
+}
+
+# код -> сколько дней назад начинается период (None — за всё время)
+PERIODS = {
+    "today": 0,
+    "7d": 7,
+    "30d": 30,
+    "all": None,
+}
+
+# Ячейка, начинающаяся с этих символов, в Excel считается формулой
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# номера телефонов вида +7 (900) 000-00-00 формулой не считаем
+_PLAIN_NUMBER = re.compile(r"[+-]?[\d\s().-]+")
+# Управляющие символы, недопустимые в XML (XLSX)
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def xlsx_available() -> bool:
+    return Workbook is not None
+
+
+def period_start(period: str) -> typing.Optional[str]:
+    """Начало периода в формате created_at (UTC, как CURRENT_TIMESTAMP)."""
+    days = PERIODS[period]
+    if days is None:
+        return None
+    today = datetime.datetime.utcnow().date()
+    return (today - datetime.timedelta(days=days)).isoformat()
+
+
+def _cell(value):
+    if not isinstance(value, str):
+        return value
+    value = _ILLEGAL_XML.sub("", value)
+    # текст клиента не должен исполняться как формула в таблице
+    if value.startswith(_FORMULA_PREFIXES) and not _PLAIN_NUMBER.fullmatch(value):
+        return "'" + value
+    return value
+
+
+def _records(rows: typing.Iterable) -> typing.Iterator[list]:
+    for row in rows:
+        record = [_cell(value) for value in row]
+        # колонка title: для готовых услуг — название из каталога
+        if row["type"] == "service" and row["service_code"]:
+            service = get_service_by_code(row["service_code"])
+            if service:
+                record[5] = service["name"]
+        yield record
+
+
+def _write_csv(path: Path, rows: typing.Iterable) -> int:
+    count = 0
+    # utf-8-sig — чтобы Excel сразу узнал кодировку
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        for record in _records(rows):
+            writer.writerow(record)
+            count += 1
+    return count
+
+
+def _write_xlsx(path: Path, rows: typing.Iterable) -> int:
+    count = 0
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Заказы")
+    ws.append(HEADERS)
+    for record in _records(rows):
+        ws.append(record)
+        count += 1
+    wb.save(path)
+    return count
+
+
+def export_orders(
+    fmt: str,
+    date_from: typing.Optional[str] = None,
+    date_to: typing.Optional[str] = None,
+    statuses: typing.Optional[tuple] = None,
+) -> typing.Tuple[Path, int]:
+    """
+    Пишет заказы во временный файл и возвращает (путь, число заказов).
+    Файл удаляет вызывающий.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Формат выгрузки должен быть одним из {FORMATS}")
+    if fmt == "xlsx" and not xlsx_available():
+        raise RuntimeError("Для выгрузки в XLSX нужен пакет openpyxl")
+
+    fd, name = tempfile.mkstemp(prefix="orders_", suffix=f".{fmt}")
+    os.close(fd)
+    path = Path(name)
+
+    rows = database.iter_orders_for_export(date_from, date_to, statuses)
+    try:
+        if fmt == "csv":
+            count = _write_csv(path, rows)
+        else:
+            count = _write_xlsx(path, rows)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    finally:
+        # вернуть соединение в пул, даже если запись оборвалась
+        rows.close()
+    return path, count
@@ -0,0 +1,190 @@
+# fsm_storage.py
+"""
+FSM-хранилище aiogram поверх SQLite (таблица fsm_storage).
+
+Состояния и данные читаются из кэша в памяти процесса; промах кэша — один
+SELECT через пул читателей. Изменения (set_state, update_data и т.д.)
+только помечают запись грязной, а фоновая задача раз в flush_interval
+секунд пишет все накопленные изменения одной транзакцией. Так частые
+state.update_data не превращаются в запись на диск на каждое сообщение,
+а незаконченные заказы и капчи переживают перезапуск бота.
+
+Кэш ограничен cache_size записями; вытесняются только уже сохранённые.
+"""
+import asyncio
+import copy
+import json
+import logging
+import typing
+from collections import OrderedDict
+
+from aiogram.dispatcher.storage import BaseStorage
+
+import async_db
+
+logger = logging.getLogger(__name__)
+
+Key = typing.Tuple[int, int]
+
+
+class _Record:
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: typing.Optional[str], data: dict):
+        self.state = state
+        self.data = data
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, flush_interval: float = 1.0, cache_size: int = 10000):
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Key, _Record]" = OrderedDict()
+        self._dirty: typing.Set[Key] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: typing.Optional[asyncio.Task] = None
+        self._closed = False
+
+    # ====== КЭШ ======
+
+    def _key(self, chat, user) -> Key:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    async def _get_record(self, chat, user) -> typing.Tuple[Key, _Record]:
+        key = self._key(chat, user)
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return key, record
+
+        row = await async_db.get_fsm_record(*key)
+
+        # пока ждали БД, запись мог загрузить другой апдейт этого пользователя
+        record = self._cache.get(key)
+        if record is None:
+            if row:
+                record = _Record(row["state"], json.loads(row["data"] or "{}"))
+            else:
+                record = _Record(None, {})
+            self._cache[key] = record
+            self._evict()
+        return key, record
+
+    def _mark_dirty(self, key: Key):
+        self._dirty.add(key)
+        if self._flusher is None and not self._closed:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    def _evict(self):
+        while len(self._cache) > self.cache_size:
+            key = next(iter(self._cache))
+            if key in self._dirty:
+                # освободится после ближайшего сброса
+                return
+            del self._cache[key]
+
+    # ====== ЗАПИСЬ В БД ======
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить FSM-состояния")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            keys, self._dirty = self._dirty, set()
+            upserts = []
+            deletes = []
+            for key in keys:
+                record = self._cache.get(key)
+                if record is None:
+                    continue
+                if record.state is None and not record.data:
+                    deletes.append(key)
+                else:
+                    upserts.append(
+                        (*key, record.state, json.dumps(record.data, ensure_ascii=False))
+                    )
+
+            try:
+                await async_db.save_fsm_records(upserts, deletes)
+            except BaseException:
+                # и при отмене (close() посреди записи): ключи вернутся
+                # и уйдут последним flush()
+                self._dirty |= keys
+                raise
+
+            self._evict()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.wait({self._flusher})
+            self._flusher = None
+        await self.flush()
+
+    async def wait_closed(self):
+        pass
+
+    # ====== ИНТЕРФЕЙС BaseStorage ======
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        _, record = await self._get_record(chat, user)
+        if record.state is None:
+            return self.resolve_state(default)
+        return record.state
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record.data)
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        key, record = await self._get_record(chat, user)
+        record.state = self.resolve_state(state)
+        self._mark_dirty(key)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record.data = copy.deepcopy(data) if data else {}
+        self._mark_dirty(key)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None,
+                          **kwargs):
+        key, record = await self._get_record(chat, user)
+        record.data.update(copy.deepcopy(data) if data else {}, **kwargs)
+        self._mark_dirty(key)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        key, record = await self._get_record(chat, user)
+        record.state = None
+        if with_data:
+            record.data = {}
+        self._mark_dirty(key)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -8,12 +10,17 @@ from aiogram.types import (
 from config import ADMIN_ID
 
 
+# Статические клавиатуры не зависят от аргументов и строятся один раз
+# (lru_cache); возвращаемые объекты общие — не изменяйте их в хендлерах.
+
+
 # ====== ГЛАВНОЕ МЕНЮ ======
 
 def get_main_menu(user_id: int) -> ReplyKeyboardMarkup:
     return get_admin_menu() if user_id == ADMIN_ID else get_client_menu()
 
 
+@lru_cache(maxsize=None)
 def get_client_menu() -> ReplyKeyboardMarkup:
     kb = ReplyKeyboardMarkup(resize_keyboard=True)
 
@@ -32,6 +39,7 @@ def get_client_menu() -> ReplyKeyboardMarkup:
     return kb
 
 
+@lru_cache(maxsize=None)
 def get_admin_menu() -> ReplyKeyboardMarkup:
     kb = ReplyKeyboardMarkup(resize_keyboard=True)
 
@@ -44,12 +52,18 @@ def get_admin_menu() -> ReplyKeyboardMarkup:
         KeyboardButton("📨 Заявки на разбан"),
     )
     kb.row(
+        KeyboardButton("📢 Рассылка"),
+        KeyboardButton("📤 Выгрузка"),
+    )
+    kb.row(
+        KeyboardButton("🔎 Поиск"),
         KeyboardButton("👁 Перейти в режим клиента"),
     )
 
     return kb
 
 
+@lru_cache(maxsize=None)
 def get_admin_client_menu() -> ReplyKeyboardMarkup:
     """
     Меню, когда админ переключился в режим клиента,
@@ -77,6 +91,7 @@ def get_admin_client_menu() -> ReplyKeyboardMarkup:
 
 # ====== СПОСОБ СВЯЗИ ======
 
+@lru_cache(maxsize=None)
 def get_contact_method_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(row_width=2)
 
@@ -93,6 +108,7 @@ def get_contact_method_kb() -> InlineKeyboardMarkup:
 
 # ====== ПОДТВЕРЖДЕНИЕ ЗАКАЗА ======
 
+@lru_cache(maxsize=None)
 def get_confirm_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(row_width=2)
 
@@ -106,6 +122,40 @@ def get_confirm_kb() -> InlineKeyboardMarkup:
 
 # ====== СПИСОК ЗАКАЗОВ (АДМИН) ======
 
+# callback_data страницы: admin_orders_page_<page>[_<a|b><id в base36>]
+# a<id> — заказы старше id (вперёд), b<id> — заказы новее id (назад)
+ORDERS_PAGE_PREFIX = "admin_orders_page_"
+
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _to_base36(n: int) -> str:
+    digits = []
+    while True:
+        n, rem = divmod(n, 36)
+        digits.append(_BASE36[rem])
+        if not n:
+            return "".join(reversed(digits))
+
+
+def orders_page_callback(page: int, direction: str = "", order_id: int = 0) -> str:
+    if not direction:
+        return f"{ORDERS_PAGE_PREFIX}{page}"
+    return f"{ORDERS_PAGE_PREFIX}{page}_{direction}{_to_base36(order_id)}"
+
+
+def parse_orders_page_callback(data: str):
+    """Возвращает (page, after_id, before_id) из callback_data страницы."""
+    page_str, _, cursor = data[len(ORDERS_PAGE_PREFIX):].partition("_")
+    page = max(1, int(page_str))
+    if not cursor:
+        return page, None, None
+    order_id = int(cursor[1:], 36)
+    if cursor[0] == "b":
+        return page, None, order_id
+    return page, order_id, None
+
+
 def get_orders_list_kb(orders, page: int, total: int, per_page: int = 3):
     kb = InlineKeyboardMarkup(row_width=1)
 
@@ -129,13 +179,15 @@ def get_orders_list_kb(orders, page: int, total: int, per_page: int = 3):
     if page > 1:
         nav.append(
             InlineKeyboardButton(
-                "⬅️ Назад", callback_data=f"admin_orders_page_{page-1}"
+                "⬅️ Назад",
+                callback_data=orders_page_callback(page - 1, "b", orders[0]["id"]),
             )
         )
     if page < pages:
         nav.append(
             InlineKeyboardButton(
-                "Вперёд ➡️", callback_data=f"admin_orders_page_{page+1}"
+                "Вперёд ➡️",
+                callback_data=orders_page_callback(page + 1, "a", orders[-1]["id"]),
             )
         )
 
@@ -147,6 +199,39 @@ def get_orders_list_kb(orders, page: int, total: int, per_page: int = 3):
     return kb
 
 
+# ====== ПОИСК (АДМИН) ======
+
+@lru_cache(maxsize=None)
+def get_search_cancel_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=1)
+    kb.add(InlineKeyboardButton("❌ Отмена", callback_data="admin_search_cancel"))
+    return kb
+
+
+def get_search_results_kb(orders, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=1)
+
+    for o in orders:
+        title = o["title"] if o["type"] == "custom" else o["service_code"]
+        kb.add(
+            InlineKeyboardButton(
+                text=f"#{o['id']} — {title} ({o['status']})",
+                callback_data=f"admin_order_{o['id']}",
+            )
+        )
+
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("⬅️ Назад", callback_data="admin_search_prev"))
+    if has_next:
+        nav.append(InlineKeyboardButton("Вперёд ➡️", callback_data="admin_search_next"))
+    if nav:
+        kb.row(*nav)
+
+    kb.add(InlineKeyboardButton("🔙 В меню", callback_data="admin_back_menu"))
+    return kb
+
+
 # ====== КАРТОЧКА ЗАКАЗА (АДМИН) ======
 def get_order_actions_kb(order_id: int):
     kb = InlineKeyboardMarkup(row_width=2)
@@ -174,7 +259,7 @@ def get_order_actions_kb(order_id: int):
         ),
     )
     kb.add(
-        InlineKeyboardButton("🔙 Назад", callback_data="admin_orders_page_1"),
+        InlineKeyboardButton("🔙 Назад", callback_data=orders_page_callback(1)),
     )
 
     return kb
@@ -194,6 +279,7 @@ def get_captcha_kb(options) -> InlineKeyboardMarkup:
 
 # ====== ЗАБАНЕННЫЙ ПОЛЬЗОВАТЕЛЬ ======
 
+@lru_cache(maxsize=None)
 def get_banned_user_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(row_width=1)
     kb.add(
@@ -205,6 +291,98 @@ def get_banned_user_kb() -> InlineKeyboardMarkup:
     return kb
 
 
+# ====== СТАТИСТИКА (АДМИН) ======
+
+@lru_cache(maxsize=None)
+def get_stats_periods_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=3)
+    kb.add(
+        InlineKeyboardButton("За день", callback_data="admin_stats_day"),
+        InlineKeyboardButton("За неделю", callback_data="admin_stats_week"),
+        InlineKeyboardButton("За месяц", callback_data="admin_stats_month"),
+    )
+    return kb
+
+
+# ====== РАССЫЛКА (АДМИН) ======
+
+@lru_cache(maxsize=None)
+def get_broadcast_cancel_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=1)
+    kb.add(
+        InlineKeyboardButton("❌ Отмена", callback_data="admin_broadcast_cancel"),
+    )
+    return kb
+
+
+@lru_cache(maxsize=None)
+def get_broadcast_confirm_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    kb.add(
+        InlineKeyboardButton("✅ Запустить", callback_data="admin_broadcast_start"),
+        InlineKeyboardButton("❌ Отмена", callback_data="admin_broadcast_cancel"),
+    )
+    return kb
+
+
+def get_broadcast_progress_kb(broadcast_id: int) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=1)
+    kb.add(
+        InlineKeyboardButton("⏹ Остановить", callback_data=f"admin_broadcast_stop_{broadcast_id}"),
+    )
+    return kb
+
+
+# ====== ВЫГРУЗКА ЗАКАЗОВ (АДМИН) ======
+# callback_data: admin_export_p_<период> -> admin_export_s_<период>_<статус>
+# -> admin_export_f_<период>_<статус>_<формат>; коды — из export.py
+
+EXPORT_PERIOD_LABELS = {
+    "today": "Сегодня",
+    "7d": "7 дней",
+    "30d": "30 дней",
+    "all": "Всё время",
+}
+
+EXPORT_STATUS_LABELS = {
+    "all": "Все",
+    "active": "Активные",
+    "new": "Новые",
+    "work": "В работе",
+    "done": "Завершённые",
+    "cancel": "Отменённые",
+}
+
+
+@lru_cache(maxsize=None)
+def get_export_periods_kb() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    kb.add(*(
+        InlineKeyboardButton(label, callback_data=f"admin_export_p_{code}")
+        for code, label in EXPORT_PERIOD_LABELS.items()
+    ))
+    return kb
+
+
+@lru_cache(maxsize=None)
+def get_export_statuses_kb(period: str) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    kb.add(*(
+        InlineKeyboardButton(label, callback_data=f"admin_export_s_{period}_{code}")
+        for code, label in EXPORT_STATUS_LABELS.items()
+    ))
+    return kb
+
+
+@lru_cache(maxsize=None)
+def get_export_formats_kb(period: str, status: str, xlsx: bool) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    kb.insert(InlineKeyboardButton("CSV", callback_data=f"admin_export_f_{period}_{status}_csv"))
+    if xlsx:
+        kb.insert(InlineKeyboardButton("XLSX", callback_data=f"admin_export_f_{period}_{status}_xlsx"))
+    return kb
+
+
 # ====== ЗАЯВКИ НА РАЗБАН (АДМИН) ======
 
 def get_unban_requests_kb(requests) -> InlineKeyboardMarkup:
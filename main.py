@@ -1,30 +1,142 @@
+import asyncio
 import logging
+import time
 
 from aiogram import Bot, Dispatcher, executor
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
-from config import TOKEN
-from database import init_db
+from config import (
+    TOKEN,
+    BOT_MODE,
+    BOT_WORKERS,
+    FSM_FLUSH_INTERVAL,
+    FSM_CACHE_SIZE,
+    CATALOG_RELOAD_INTERVAL,
+    CAPTCHA_MAX_ATTEMPTS,
+    CAPTCHA_ATTEMPT_TTL,
+    CAPTCHA_FLUSH_INTERVAL,
+    DB_SESSION_WARN_QUERIES,
+    BROADCAST_BATCH_SIZE,
+    BROADCAST_PROGRESS_INTERVAL,
+    UPDATE_CONCURRENCY,
+    UPDATE_MAX_BACKLOG,
+    UPDATE_USER_BACKLOG,
+    UPDATE_DEDUPE_TTL,
+    MAINTENANCE_INTERVAL,
+    METRICS_HOST,
+    METRICS_PORT,
+    OUTBOUND_RATE,
+    OUTBOUND_BURST,
+)
+from database import init_db, close_pool, load_ban_registry, load_captcha_attempts
+import async_db
+import outbound
+import outbox
+import maintenance as db_maintenance
+import captcha_tracker
+import broadcast
+import metrics
+import supervisor
+from fsm_storage import SQLiteStorage
+from services import watch_catalog
 
 from order_handlers import register_order_handlers, fallback
 from admin_handlers import register_admin_handlers
 
+from middleware.dedupe import DedupeMiddleware
+from middleware.scheduler import UpdateSchedulerMiddleware
 from middleware.admin_protect import AdminProtectMiddleware
+from middleware.ban_guard import BanGuardMiddleware
 from middleware.rate_limit import RateLimitMiddleware
+from middleware.db_session import DBSessionMiddleware
+from middleware.metrics import MetricsMiddleware
 from utils.error_handler import register_error_handler
+from webhook import start_webhook
 
 logging.basicConfig(level=logging.INFO)
 
 
-def main():
-    init_db()
+async def on_startup(
+    dp: Dispatcher,
+    resume_broadcasts: bool = True,
+    metrics_port: int = METRICS_PORT,
+    maintenance: bool = True,
+):
+    loop = asyncio.get_running_loop()
+    # каталог перечитывается из файла без перезапуска
+    loop.create_task(watch_catalog(CATALOG_RELOAD_INTERVAL))
+
+    # архив старых заказов, vacuum, статистика планировщика (при нескольких воркерах — в одном)
+    if maintenance:
+        loop.create_task(db_maintenance.watch(MAINTENANCE_INTERVAL))
+
+    # рассылки, прерванные перезапуском (при нескольких воркерах — в воркере админа)
+    if resume_broadcasts:
+        await broadcast.get_engine().resume()
+
+    # уведомления, не досланные до перезапуска
+    outbox.get_dispatcher().start()
+
+    if metrics_port:
+        await metrics.start_server(METRICS_HOST, metrics_port)
+
+
+async def on_shutdown(dp: Dispatcher):
+    # рассылки дописывают текущую пачку, затем досылаем очередь уведомлений
+    await broadcast.shutdown()
+    # outbox досылает текущую пачку через outbound, новые не забирает
+    await outbox.shutdown()
+    await outbound.shutdown()
+
+    # сбрасываем счётчики капчи и FSM, пока жив поток-писатель
+    await captcha_tracker.shutdown()
+
+    # executor закрывает storage только после on_shutdown
+    await dp.storage.close()
+    await metrics.stop_server()
+
+    # дожидаемся незавершённых записей в БД
+    async_db.shutdown()
+    close_pool()
 
-    bot = Bot(token=TOKEN, parse_mode="HTML")
-    dp = Dispatcher(bot, storage=MemoryStorage())
+
+def create_dispatcher(token: str = TOKEN, workers: int = 1) -> Dispatcher:
+    """
+    Бот и диспетчер с middleware и хендлерами — общие для polling, webhook
+    и воркеров супервизора. workers — на сколько процессов делится общий
+    лимит исходящих сообщений бота.
+    """
+    bot = metrics.instrument_bot(Bot(token=token, parse_mode="HTML"))
+    dp = Dispatcher(bot, storage=SQLiteStorage(FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE))
+    outbound.setup(bot, rate=OUTBOUND_RATE / workers, burst=max(1, OUTBOUND_BURST // workers))
+    outbox.setup()
+    broadcast.setup(
+        bot,
+        batch_size=BROADCAST_BATCH_SIZE,
+        progress_interval=BROADCAST_PROGRESS_INTERVAL,
+    )
+    captcha_tracker.setup(
+        max_attempts=CAPTCHA_MAX_ATTEMPTS,
+        ttl=CAPTCHA_ATTEMPT_TTL,
+        flush_interval=CAPTCHA_FLUSH_INTERVAL,
+    )
 
     # middleware
+    # повторно доставленные апдейты отбрасываются раньше всего
+    dp.middleware.setup(DedupeMiddleware(ttl=UPDATE_DEDUPE_TTL))
+    # затем: апдейты пользователя по очереди, отброс при перегрузке — до любой работы
+    dp.middleware.setup(UpdateSchedulerMiddleware(
+        concurrency=UPDATE_CONCURRENCY,
+        max_backlog=UPDATE_MAX_BACKLOG,
+        user_backlog=UPDATE_USER_BACKLOG,
+    ))
     dp.middleware.setup(AdminProtectMiddleware())
     dp.middleware.setup(RateLimitMiddleware(rate=1.5, burst=5))
+    # после лимита: ответы забаненному тоже ограничены
+    dp.middleware.setup(BanGuardMiddleware())
+    # последним: отсечённые лимитом апдейты сессию не открывают
+    dp.middleware.setup(DBSessionMiddleware(DB_SESSION_WARN_QUERIES))
+    # после DBSession: время хендлера включает коммит
+    dp.middleware.setup(MetricsMiddleware())
 
     # хендлеры
     register_order_handlers(dp)
@@ -36,7 +148,30 @@ def main():
     # глобальный обработчик ошибок
     register_error_handler(dp)
 
-    executor.start_polling(dp, skip_updates=True)
+    return dp
+
+
+def main():
+    init_db()
+
+    if BOT_WORKERS > 1:
+        if BOT_MODE == "webhook":
+            raise SystemExit("BOT_WORKERS > 1 поддерживается только в режиме polling")
+        supervisor.run(BOT_WORKERS)
+        return
+
+    load_ban_registry()
+
+    dp = create_dispatcher()
+
+    # непросроченные счётчики капчи — в память
+    tracker = captcha_tracker.get_tracker()
+    tracker.load(load_captcha_attempts(time.time() - tracker.ttl))
+
+    if BOT_MODE == "webhook":
+        start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
 
 
 if __name__ == "__main__":
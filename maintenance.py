@@ -0,0 +1,74 @@
+# maintenance.py
+"""
+Периодическое обслуживание БД.
+
+Раз в interval секунд:
+- done/cancelled заказы старше archive_after_days дней переносятся из
+  orders в orders_archive пачками по batch_size, каждая — своей короткой
+  транзакцией, так что записи хендлеров встают между пачками. Статистика
+  (order_stats, order_rollups) ведётся триггерами на вставку и смену
+  статуса и при удалении не меняется — она остаётся за всю историю;
+  выгрузка читает и архив;
+- удаляются старые записи журнала банов ban_events;
+- incremental vacuum возвращает файлу освободившиеся страницы — тоже
+  порциями по VACUUM_STEP_PAGES;
+- ANALYZE по выборке и PRAGMA optimize обновляют статистику планировщика,
+  WAL обрезается.
+
+При нескольких воркерах обслуживание идёт только в одном (см. supervisor.py).
+"""
+import asyncio
+import logging
+import time
+
+import async_db
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# журнал банов нужен воркерам только для догоняющей синхронизации
+BAN_EVENTS_KEEP_DAYS = 1
+# страниц за один шаг incremental vacuum (~4 МБ при странице 4 КБ)
+VACUUM_STEP_PAGES = 1000
+# первый проход — не сразу после старта
+START_DELAY = 60.0
+
+
+async def run_maintenance(archive_after_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE):
+    started = time.monotonic()
+
+    archived = 0
+    if archive_after_days > 0:
+        while True:
+            moved = await async_db.archive_orders(archive_after_days, batch_size)
+            archived += moved
+            if moved < batch_size:
+                break
+
+    pruned = await async_db.prune_ban_events(BAN_EVENTS_KEEP_DAYS)
+
+    free_pages = await async_db.incremental_vacuum(VACUUM_STEP_PAGES)
+    while free_pages:
+        left = await async_db.incremental_vacuum(VACUUM_STEP_PAGES)
+        if left >= free_pages:
+            # auto_vacuum выключен — страницы не возвращаются
+            break
+        free_pages = left
+
+    await async_db.optimize_db()
+
+    logger.info(
+        "Обслуживание БД за %.1f с: в архив %s заказов, удалено событий банов %s",
+        time.monotonic() - started, archived, pruned,
+    )
+
+
+async def watch(interval: float):
+    """Фоновая задача: run_maintenance раз в interval секунд."""
+    await asyncio.sleep(START_DELAY)
+    while True:
+        try:
+            await run_maintenance()
+        except Exception:
+            logger.exception("Ошибка обслуживания БД")
+        await asyncio.sleep(interval)
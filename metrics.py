@@ -0,0 +1,229 @@
+# metrics.py
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Счётчики и гистограммы — простые словари в памяти процесса: значения
+меняются только из event loop, поэтому без блокировок, а запись метрики —
+это поиск в словаре и bisect по границам корзин. Так их можно держать
+включёнными постоянно.
+
+Что собирается:
+- задержка обработки апдейта по типу и задержка каждого хендлера
+  (MetricsMiddleware), ошибки хендлеров по классу исключения;
+- апдейты, отброшенные middleware через CancelHandler (лимит, права, бан);
+- вызовы Bot API по методам: задержка и ошибки по классу (instrument_bot);
+- длина очереди outbound на момент запроса /metrics.
+
+start_server поднимает отдельный aiohttp-сервер с GET /metrics; по
+умолчанию он слушает только localhost.
+"""
+import bisect
+import logging
+import time
+import typing
+
+from aiohttp import web
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+# границы корзин задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def render(self) -> typing.Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self) -> typing.Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: typing.Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def _samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._series: typing.Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def _samples(self):
+        bounds = self.buckets + (float("inf"),)
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge(_Metric):
+    """Значение читается функцией в момент запроса /metrics."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: typing.Callable[[], float]):
+        super().__init__(name, documentation)
+        self.func = func
+
+    def _samples(self):
+        try:
+            value = self.func()
+        except Exception:
+            logger.exception("Не удалось прочитать метрику %s", self.name)
+            return
+        yield f"{self.name} {_number(value)}"
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ====== МЕТРИКИ БОТА ======
+
+UPDATE_LATENCY = Histogram(
+    "bot_update_duration_seconds",
+    "Время обработки апдейта по типу.",
+    ("type",),
+)
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds",
+    "Время работы хендлера вместе с middleware сообщения (коммит DBSession).",
+    ("handler",),
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total",
+    "Исключения хендлеров по классу.",
+    ("handler", "error"),
+)
+UPDATES_DROPPED = Counter(
+    "bot_updates_dropped_total",
+    "Апдейты, отброшенные middleware через CancelHandler.",
+    ("middleware", "type"),
+)
+API_LATENCY = Histogram(
+    "bot_api_request_duration_seconds",
+    "Время запроса к Bot API по методу.",
+    ("method",),
+)
+API_ERRORS = Counter(
+    "bot_api_errors_total",
+    "Ошибки запросов к Bot API по методу и классу исключения.",
+    ("method", "error"),
+)
+
+
+def dropped(middleware: str, update_type: str):
+    """Вызывается middleware перед raise CancelHandler()."""
+    UPDATES_DROPPED.inc(middleware, update_type)
+
+
+def instrument_bot(bot: Bot) -> Bot:
+    """Оборачивает bot.request: все вызовы Bot API — и ответы хендлеров, и outbound."""
+    request = bot.request
+
+    async def timed_request(method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await request(method, data, files, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, method)
+
+    bot.request = timed_request
+    return bot
+
+
+# ====== HTTP ======
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+_runner: typing.Optional[web.AppRunner] = None
+
+
+async def start_server(host: str, port: int):
+    global _runner
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info("Метрики: http://%s:%s/metrics", host, port)
+
+
+async def stop_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
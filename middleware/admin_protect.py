@@ -3,6 +3,7 @@ from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram import types
 
 from config import ADMIN_ID
+from metrics import dropped
 
 
 class AdminProtectMiddleware(BaseMiddleware):
@@ -14,16 +15,21 @@ class AdminProtectMiddleware(BaseMiddleware):
         if callback and callback.data and callback.data.startswith("admin_"):
             if callback.from_user.id != ADMIN_ID:
                 await callback.answer("Недостаточно прав.", show_alert=True)
+                dropped("admin_protect", "callback_query")
                 raise CancelHandler()
 
         # защищаем админские текстовые команды
         if message and message.text:
             if message.text.startswith("📥 Все заказы") or \
                message.text.startswith("📊 Статистика") or \
+               message.text.startswith("📢 Рассылка") or \
+               message.text.startswith("📤 Выгрузка") or \
+               message.text.startswith("🔎 Поиск") or \
                message.text.startswith("👁 Перейти в режим клиента") or \
                message.text.startswith("⚙️ Вернуться в админку"):
                 if message.from_user.id != ADMIN_ID:
                     await message.answer("Недостаточно прав.")
+                    dropped("admin_protect", "message")
                     raise CancelHandler()
 
 
@@ -0,0 +1,73 @@
+# middleware/ban_guard.py
+import typing
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+
+from ban_registry import lookup_ban
+from config import ADMIN_ID
+from keyboards import get_banned_user_kb
+from metrics import dropped
+from states import UnbanRequestState
+
+
+DEFAULT_BAN_REASON = "Многократное не прохождение проверки."
+
+# кнопки, доступные забаненному пользователю
+ALLOWED_CALLBACKS = ("banned_contact_admin", "banned_why")
+
+
+class BanGuardMiddleware(BaseMiddleware):
+    """
+    Единая проверка бана: один поиск в ban_registry на сообщение или
+    callback, до роутинга. Забаненному пользователю отвечаем и отменяем
+    обработку; кнопки banned_* и отправка заявки на разбан остаются доступны.
+
+    Подключается после RateLimitMiddleware: ответ о бане — тоже запрос к
+    Telegram, и флудящий забаненный пользователь упирается в тот же лимит.
+    """
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        user = message.from_user
+        reason = self._ban_reason(user)
+        if reason is None:
+            return
+
+        if await self._is_writing_unban_request(message):
+            return
+
+        await message.answer(self._ban_text(reason), reply_markup=get_banned_user_kb())
+        dropped("ban_guard", "message")
+        raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        reason = self._ban_reason(callback.from_user)
+        if reason is None or callback.data in ALLOWED_CALLBACKS:
+            return
+
+        await callback.message.answer(self._ban_text(reason), reply_markup=get_banned_user_kb())
+        await callback.answer()
+        dropped("ban_guard", "callback_query")
+        raise CancelHandler()
+
+    @staticmethod
+    def _ban_reason(user: types.User) -> typing.Optional[str]:
+        """Причина бана ("" — без причины) или None, если не забанен."""
+        if not user or user.id == ADMIN_ID:
+            return None
+        return lookup_ban(user.id)
+
+    @staticmethod
+    def _ban_text(reason: str) -> str:
+        return (
+            "🚫 Доступ к боту временно ограничен.\n\n"
+            f"Причина: <b>{reason or DEFAULT_BAN_REASON}</b>\n\n"
+            "Если вы считаете, что это ошибка, вы можете отправить заявку на разбан."
+        )
+
+    async def _is_writing_unban_request(self, message: types.Message) -> bool:
+        state = self.manager.dispatcher.current_state(
+            chat=message.chat.id, user=message.from_user.id
+        )
+        return await state.get_state() == UnbanRequestState.waiting_reason.state
@@ -0,0 +1,51 @@
+# middleware/db_session.py
+import logging
+import sys
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+
+from async_db import open_session
+
+logger = logging.getLogger(__name__)
+
+
+class DBSessionMiddleware(BaseMiddleware):
+    """
+    Открывает DBSession на время обработки сообщения или callback и кладёт
+    её в data["db"] (хендлер получает её аргументом db). После хендлера
+    транзакция коммитится, при исключении — откатывается.
+
+    Число SQL-запросов и вызовов БД за апдейт пишется в DEBUG; больше
+    warn_queries — в WARNING, чтобы видеть N+1.
+    """
+
+    def __init__(self, warn_queries: int = 20):
+        super().__init__()
+        self.warn_queries = warn_queries
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        data["db"] = open_session()
+
+    async def on_pre_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        data["db"] = open_session()
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        await self._close(data, f"message {message.message_id} от {message.from_user.id}")
+
+    async def on_post_process_callback_query(self, callback: types.CallbackQuery, results, data: dict):
+        await self._close(data, f"callback {callback.data!r} от {callback.from_user.id}")
+
+    async def _close(self, data: dict, label: str):
+        session = data.pop("db", None)
+        if session is None:
+            return
+
+        # post_process вызывается из finally: исключение хендлера ещё летит
+        failed = sys.exc_info()[0] is not None
+        await session.close(commit=not failed)
+
+        if session.queries > self.warn_queries:
+            logger.warning("%s: %d SQL-запросов (%d вызовов БД)", label, session.queries, session.calls)
+        else:
+            logger.debug("%s: %d SQL-запросов (%d вызовов БД)", label, session.queries, session.calls)
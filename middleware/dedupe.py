@@ -0,0 +1,62 @@
+# middleware/dedupe.py
+import collections
+import time
+import typing
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+
+from metrics import dropped
+from middleware.metrics import update_type
+
+
+class _RecentKeys:
+    """Ключи, виденные за последние ttl секунд; не больше max_size."""
+
+    __slots__ = ("ttl", "max_size", "seen")
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # ключ -> время; порядок вставки = порядок времени
+        self.seen: typing.OrderedDict[typing.Hashable, float] = collections.OrderedDict()
+
+    def add(self, key: typing.Hashable, now: float) -> bool:
+        """Запоминает ключ; False — ключ уже был."""
+        seen = self.seen
+        while seen:
+            if now - next(iter(seen.values())) <= self.ttl and len(seen) < self.max_size:
+                break
+            seen.popitem(last=False)
+
+        if key in seen:
+            return False
+        seen[key] = now
+        return True
+
+
+class DedupeMiddleware(BaseMiddleware):
+    """
+    Отбрасывает повторно доставленные апдейты: тот же update_id или тот же
+    id callback_query за последние ttl секунд. Telegram повторяет апдейт,
+    если webhook не ответил вовремя, а polling после перезапуска может
+    получить его ещё раз.
+
+    Подключается первым — повтор не занимает очередь планировщика. От
+    повторного нажатия кнопки (у него новый callback id) защищает ключ
+    идемпотентности заказа, см. order_handlers.new_order_key.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_size: int = 100_000):
+        super().__init__()
+        self.keys = _RecentKeys(ttl, max_size)
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        now = time.monotonic()
+        fresh = self.keys.add(("update", update.update_id), now)
+        if fresh and update.callback_query:
+            fresh = self.keys.add(("callback", update.callback_query.id), now)
+        if not fresh:
+            dropped("dedupe", update_type(update))
+            raise CancelHandler()
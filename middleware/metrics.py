@@ -0,0 +1,62 @@
+# middleware/metrics.py
+import sys
+import time
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+
+from metrics import HANDLER_ERRORS, HANDLER_LATENCY, UPDATE_LATENCY
+
+
+def update_type(update: types.Update) -> str:
+    # у апдейта заполнено одно поле кроме update_id
+    return next((key for key in update.values if key != "update_id"), "unknown")
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Задержки апдейтов по типу и хендлеров по имени (см. metrics.py).
+
+    Подключается последним: его post_process_* вызывается после остальных,
+    поэтому время хендлера включает коммит DBSession. Хендлер известен в
+    on_process_*, когда фильтры уже пройдены и выставлен current_handler.
+    """
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data["metrics_started"] = time.perf_counter()
+
+    async def on_post_process_update(self, update: types.Update, results, data: dict):
+        started = data.get("metrics_started")
+        if started is not None:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, update_type(update))
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        self._handler_started(data)
+
+    async def on_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        self._handler_started(data)
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        self._handler_finished(data)
+
+    async def on_post_process_callback_query(self, callback: types.CallbackQuery, results, data: dict):
+        self._handler_finished(data)
+
+    @staticmethod
+    def _handler_started(data: dict):
+        data["metrics_handler"] = (current_handler.get().__name__, time.perf_counter())
+
+    @staticmethod
+    def _handler_finished(data: dict):
+        handler = data.pop("metrics_handler", None)
+        if handler is None:
+            # ни один хендлер не подошёл или апдейт отброшен раньше
+            return
+        name, started = handler
+        HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+        # post_process вызывается из finally: исключение хендлера ещё летит
+        error = sys.exc_info()[0]
+        if error is not None:
+            HANDLER_ERRORS.inc(name, error.__name__)
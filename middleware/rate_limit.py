@@ -1,29 +1,105 @@
 # middleware/rate_limit.py
 import time
-from collections import defaultdict
 
+from aiogram.dispatcher.handler import CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram import types
 
+from metrics import dropped
+
+
+WARNING_TEXT = "Слишком много запросов. Попробуйте чуть позже."
+
+# раз в сколько секунд вычищать пользователей, которые давно молчат
+SWEEP_INTERVAL = 60.0
+
+ALLOWED = 0
+REJECTED = 1
+REJECTED_WARN = 2
+
+
+class _UserBucket:
+    __slots__ = ("tat", "warned_until")
+
+    def __init__(self):
+        self.tat = 0.0
+        self.warned_until = 0.0
+
+
+class Limiter:
+    """
+    GCRA (generic cell rate algorithm) — token bucket без счётчика токенов.
+
+    На пользователя хранится одно число — теоретическое время прихода
+    следующего запроса (tat). Первые burst запросов проходят сразу, дальше —
+    не чаще одного раз в rate секунд. Пользователь, у которого tat уже в
+    прошлом, ничем не отличается от нового, поэтому его можно удалить.
+    """
+
+    __slots__ = ("interval", "tolerance", "users", "next_sweep")
+
+    def __init__(self, rate: float, burst: int):
+        self.interval = rate
+        self.tolerance = rate * (burst - 1)
+        self.users = {}
+        self.next_sweep = 0.0
+
+    def hit(self, user_id: int, now: float) -> int:
+        if now >= self.next_sweep:
+            self.sweep(now)
+
+        bucket = self.users.get(user_id)
+        if bucket is None:
+            bucket = self.users[user_id] = _UserBucket()
+
+        tat = bucket.tat if bucket.tat > now else now
+        allow_at = tat - self.tolerance
+        if now < allow_at:
+            # предупреждаем один раз до конца текущей паузы
+            if now >= bucket.warned_until:
+                bucket.warned_until = allow_at
+                return REJECTED_WARN
+            return REJECTED
+
+        bucket.tat = tat + self.interval
+        return ALLOWED
+
+    def sweep(self, now: float):
+        self.users = {uid: b for uid, b in self.users.items() if b.tat > now}
+        self.next_sweep = now + SWEEP_INTERVAL
+
 
 class RateLimitMiddleware(BaseMiddleware):
-    def __init__(self, rate: float = 1.0, burst: int = 5):
+    """
+    Отдельные лимиты для сообщений и нажатий кнопок: rate — минимальный
+    интервал между запросами в секундах, burst — сколько можно сразу.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 5,
+        callback_rate: float = 0.5,
+        callback_burst: int = 10,
+    ):
         super().__init__()
-        self.rate = rate
-        self.burst = burst
-        self.users = defaultdict(list)
+        self.messages = Limiter(rate, burst)
+        self.callbacks = Limiter(callback_rate, callback_burst)
 
     async def on_pre_process_message(self, message: types.Message, data: dict):
-        now = time.time()
-        user_id = message.from_user.id
-        history = self.users[user_id]
-
-        # чистим старые записи
-        history = [t for t in history if now - t < self.rate * self.burst]
-        history.append(now)
-        self.users[user_id] = history
-
-        if len(history) > self.burst:
-            await message.answer("Слишком много запросов. Попробуйте чуть позже.")
-            from aiogram.dispatcher.handler import CancelHandler
-            raise CancelHandler()
+        verdict = self.messages.hit(message.from_user.id, time.monotonic())
+        if verdict == ALLOWED:
+            return
+        if verdict == REJECTED_WARN:
+            await message.answer(WARNING_TEXT)
+        dropped("rate_limit", "message")
+        raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        verdict = self.callbacks.hit(callback.from_user.id, time.monotonic())
+        if verdict == ALLOWED:
+            return
+        if verdict == REJECTED_WARN:
+            await callback.answer(WARNING_TEXT)
+        dropped("rate_limit", "callback_query")
+        raise CancelHandler()
@@ -0,0 +1,138 @@
+# middleware/scheduler.py
+import asyncio
+import typing
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram import types
+
+from config import ADMIN_ID
+from metrics import Gauge, dropped
+from middleware.metrics import update_type
+
+
+OVERLOAD_TEXT = "Бот сейчас перегружен. Попробуйте чуть позже."
+
+
+class _UserQueue:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        # asyncio.Lock отдаёт блокировку ожидающим по очереди (FIFO)
+        self.lock = asyncio.Lock()
+        # ждущие и выполняющийся апдейты пользователя
+        self.pending = 0
+
+
+class UpdateSchedulerMiddleware(BaseMiddleware):
+    """
+    Апдейты одного пользователя выполняются строго по очереди, разных
+    пользователей — параллельно, но не больше concurrency одновременно.
+    Так двойное нажатие confirm_yes или варианта капчи не гонится само с
+    собой: второй апдейт начинается после коммита первого и видит уже
+    сброшенное состояние FSM.
+
+    Подключается сразу после DedupeMiddleware. Очередь занимается в pre_process_update, а
+    освобождается, когда завершилась задача апдейта: post_process_update
+    не вызывается, если дальше по цепочке поднят CancelHandler. Поэтому
+    каждый апдейт должен обрабатываться в своей задаче — так и происходит
+    в process_updates (fast=True), webhook и воркерах супервизора.
+
+    Сброс нагрузки — до любой работы с БД: если ждущих апдейтов больше
+    max_backlog или у пользователя уже user_backlog необработанных, новый
+    апдейт отбрасывается; нажатию кнопки отвечаем, чтобы погасить часики.
+    Отбрасываются только новые апдейты, поэтому порядок оставшихся не
+    меняется. Апдейты админа не отбрасываются.
+    """
+
+    def __init__(self, concurrency: int = 64, max_backlog: int = 1000, user_backlog: int = 5):
+        global _scheduler
+        super().__init__()
+        self.user_backlog = user_backlog
+        self.max_backlog = max_backlog
+        self.running = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._users: typing.Dict[int, _UserQueue] = {}
+        _scheduler = self
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        user = _update_user(update)
+        # апдейты без пользователя ни с чем не упорядочиваются
+        key = user.id if user else None
+        queue = self._users.get(key)
+
+        if key != ADMIN_ID and (
+            self.waiting >= self.max_backlog
+            or (queue is not None and queue.pending >= self.user_backlog)
+        ):
+            if update.callback_query:
+                await update.callback_query.answer(OVERLOAD_TEXT)
+            dropped("scheduler", update_type(update))
+            raise CancelHandler()
+
+        if key is not None and queue is None:
+            queue = self._users[key] = _UserQueue()
+        self.waiting += 1
+        if queue is not None:
+            queue.pending += 1
+        try:
+            await self._acquire(queue)
+        except BaseException:
+            # ожидание отменено: ни очередь, ни слот не заняты
+            self.waiting -= 1
+            if queue is not None:
+                self._forget(key, queue)
+            raise
+
+        self.waiting -= 1
+        self.running += 1
+        asyncio.current_task().add_done_callback(lambda _: self._release(key, queue))
+
+    async def _acquire(self, queue: typing.Optional[_UserQueue]):
+        if queue is None:
+            await self._slots.acquire()
+            return
+        # сначала очередь пользователя: его ждущие апдейты не занимают
+        # общие слоты, пока выполняется предыдущий
+        await queue.lock.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            queue.lock.release()
+            raise
+
+    def _release(self, key: typing.Optional[int], queue: typing.Optional[_UserQueue]):
+        self.running -= 1
+        self._slots.release()
+        if queue is not None:
+            queue.lock.release()
+            self._forget(key, queue)
+
+    def _forget(self, key: int, queue: _UserQueue):
+        queue.pending -= 1
+        if not queue.pending:
+            del self._users[key]
+
+
+def _update_user(update: types.Update) -> typing.Optional[types.User]:
+    if update.message:
+        return update.message.from_user
+    if update.callback_query:
+        return update.callback_query.from_user
+    event = update.inline_query or update.my_chat_member or update.chat_member
+    return event.from_user if event else None
+
+
+_scheduler: typing.Optional[UpdateSchedulerMiddleware] = None
+
+Gauge(
+    "bot_updates_running",
+    "Апдейтов в обработке (не больше UPDATE_CONCURRENCY).",
+    lambda: _scheduler.running if _scheduler is not None else 0,
+)
+Gauge(
+    "bot_updates_waiting",
+    "Апдейтов в очереди планировщика: ждут своего пользователя или свободного слота.",
+    lambda: _scheduler.waiting if _scheduler is not None else 0,
+)
@@ -0,0 +1,474 @@
+# migrations.py
+"""
+Версионированные миграции схемы.
+
+Каждая миграция — (версия, описание, шаги). Шаг — SQL-строка или функция,
+принимающая курсор. Применённые версии записываются в schema_version;
+при старте на актуальной БД выполняется только один SELECT версии.
+
+Новые изменения схемы (колонки, индексы, триггеры) добавляются в конец
+MIGRATIONS со следующим номером версии; старые миграции не редактируются.
+Шаги должны быть идемпотентны (IF NOT EXISTS и т.п.): базы, созданные
+до появления миграций, проходят их заново без ошибок.
+"""
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# периоды свёрток order_rollups: имя -> формат strftime для корзины
+ROLLUP_PERIODS = (
+    ("day", "%Y-%m-%d"),
+    ("week", "%Y-W%W"),
+    ("month", "%Y-%m"),
+)
+
+
+def _rollup_upserts(row: str, dimension: str, key: str, delta: int) -> str:
+    """SQL для триггера: +delta к свёрткам всех периодов по дате создания заказа."""
+    return "".join(
+        f"""
+        INSERT INTO order_rollups (period, bucket, dimension, key, count)
+        VALUES ('{period}', strftime('{fmt}', {row}.created_at), '{dimension}', {key}, {delta})
+        ON CONFLICT(period, bucket, dimension, key) DO UPDATE SET count = count + ({delta});
+        """
+        for period, fmt in ROLLUP_PERIODS
+    )
+
+
+def _rollup_backfill(dimension: str, key: str) -> list:
+    return [
+        f"""
+        INSERT INTO order_rollups (period, bucket, dimension, key, count)
+        SELECT '{period}', strftime('{fmt}', created_at), '{dimension}', {key}, COUNT(*)
+        FROM orders
+        WHERE created_at IS NOT NULL
+        GROUP BY 2, 4
+        """
+        for period, fmt in ROLLUP_PERIODS
+    ]
+
+
+def _add_column(table: str, column: str, declaration: str):
+    """Шаг миграции: ALTER TABLE ADD COLUMN, если колонки ещё нет."""
+    def step(cur: sqlite3.Cursor):
+        columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return step
+
+
+MIGRATIONS = [
+    (
+        1,
+        "Базовая схема",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_id INTEGER UNIQUE,
+                username TEXT,
+                name TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER,
+                type TEXT,
+                service_code TEXT,
+                title TEXT,
+                description TEXT,
+                budget TEXT,
+                deadline TEXT,
+                contact_method TEXT,
+                contact_value TEXT,
+                status TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (client_id) REFERENCES clients(id)
+            )
+            """,
+            # ====== ЧЁРНЫЙ СПИСОК ======
+            """
+            CREATE TABLE IF NOT EXISTS banned_users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_id INTEGER UNIQUE,
+                reason TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                active INTEGER DEFAULT 1
+            )
+            """,
+            # ====== ПОПЫТКИ КАПЧИ ======
+            """
+            CREATE TABLE IF NOT EXISTS captcha_attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_id INTEGER UNIQUE,
+                attempts INTEGER DEFAULT 0,
+                last_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            # ====== ЗАЯВКИ НА РАЗБАН ======
+            """
+            CREATE TABLE IF NOT EXISTS unban_requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_id INTEGER,
+                reason TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "Индексы для частых фильтров",
+        [
+            # активные заказы для админского списка (см. get_orders_page)
+            """
+            CREATE INDEX IF NOT EXISTS idx_orders_active
+            ON orders(id) WHERE status IN ('new', 'in_progress')
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_client_id ON orders(client_id)",
+            """
+            CREATE INDEX IF NOT EXISTS idx_unban_requests_status_created
+            ON unban_requests(status, created_at)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_banned_users_active_created
+            ON banned_users(active, created_at)
+            """,
+        ],
+    ),
+    (
+        3,
+        "FSM-хранилище",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                state TEXT,
+                data TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, user_id)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+    (
+        4,
+        "Счётчики и свёртки статистики заказов",
+        [
+            # заказы по текущему статусу за всю историю
+            """
+            CREATE TABLE IF NOT EXISTS order_stats (
+                status TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """,
+            # заказы, созданные в корзине периода: по текущему статусу и по услуге
+            """
+            CREATE TABLE IF NOT EXISTS order_rollups (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                key TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, bucket, dimension, key)
+            ) WITHOUT ROWID
+            """,
+            "DELETE FROM order_stats",
+            """
+            INSERT INTO order_stats (status, count)
+            SELECT COALESCE(status, ''), COUNT(*) FROM orders GROUP BY 1
+            """,
+            "DELETE FROM order_rollups",
+            *_rollup_backfill("status", "COALESCE(status, '')"),
+            *_rollup_backfill("service", "COALESCE(service_code, 'custom')"),
+            # удаление заказа (архивация) счётчики не трогает: история остаётся в статистике
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_stats_insert
+            AFTER INSERT ON orders
+            BEGIN
+                INSERT INTO order_stats (status, count)
+                VALUES (COALESCE(NEW.status, ''), 1)
+                ON CONFLICT(status) DO UPDATE SET count = count + 1;
+                {_rollup_upserts("NEW", "status", "COALESCE(NEW.status, '')", 1)}
+                {_rollup_upserts("NEW", "service", "COALESCE(NEW.service_code, 'custom')", 1)}
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_orders_stats_status
+            AFTER UPDATE OF status ON orders
+            WHEN OLD.status IS NOT NEW.status
+            BEGIN
+                UPDATE order_stats SET count = count - 1
+                WHERE status = COALESCE(OLD.status, '');
+                INSERT INTO order_stats (status, count)
+                VALUES (COALESCE(NEW.status, ''), 1)
+                ON CONFLICT(status) DO UPDATE SET count = count + 1;
+                {_rollup_upserts("OLD", "status", "COALESCE(OLD.status, '')", -1)}
+                {_rollup_upserts("NEW", "status", "COALESCE(NEW.status, '')", 1)}
+            END
+            """,
+        ],
+    ),
+    (
+        5,
+        "Рассылки с сохранением прогресса",
+        [
+            # last_client_id — курсор по clients.id: всё до него уже обработано;
+            # max_client_id — последний получатель на момент запуска
+            """
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                admin_chat_id INTEGER NOT NULL,
+                progress_message_id INTEGER,
+                last_client_id INTEGER NOT NULL DEFAULT 0,
+                max_client_id INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                finished_at DATETIME
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_broadcasts_running ON broadcasts(id) WHERE status = 'running'",
+        ],
+    ),
+    (
+        6,
+        "Полнотекстовый поиск по заказам и клиентам",
+        [
+            # rowid = orders.id; данные клиента продублированы в строку заказа,
+            # чтобы ранжировать одним MATCH без JOIN. Префиксы до 6 символов
+            # индексируются: без этого "слово"* перебирает все термины с таким
+            # началом, и запрос стоит сотни миллисекунд
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+                title,
+                description,
+                contact_value,
+                client_name,
+                client_username,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3 4 5 6'
+            )
+            """,
+            "DELETE FROM orders_fts",
+            """
+            INSERT INTO orders_fts (rowid, title, description, contact_value, client_name, client_username)
+            SELECT o.id, o.title, o.description, o.contact_value, c.name, c.username
+            FROM orders o
+            LEFT JOIN clients c ON c.id = o.client_id
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_orders_fts_insert
+            AFTER INSERT ON orders
+            BEGIN
+                INSERT INTO orders_fts (rowid, title, description, contact_value, client_name, client_username)
+                SELECT NEW.id, NEW.title, NEW.description, NEW.contact_value, c.name, c.username
+                FROM (SELECT NEW.client_id AS client_id) n
+                LEFT JOIN clients c ON c.id = n.client_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_orders_fts_update
+            AFTER UPDATE OF title, description, contact_value, client_id ON orders
+            BEGIN
+                UPDATE orders_fts SET
+                    title = NEW.title,
+                    description = NEW.description,
+                    contact_value = NEW.contact_value,
+                    client_name = (SELECT name FROM clients WHERE id = NEW.client_id),
+                    client_username = (SELECT username FROM clients WHERE id = NEW.client_id)
+                WHERE rowid = NEW.id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_orders_fts_delete
+            AFTER DELETE ON orders
+            BEGIN
+                DELETE FROM orders_fts WHERE rowid = OLD.id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_clients_fts_update
+            AFTER UPDATE OF name, username ON clients
+            BEGIN
+                UPDATE orders_fts SET client_name = NEW.name, client_username = NEW.username
+                WHERE rowid IN (SELECT id FROM orders WHERE client_id = NEW.id);
+            END
+            """,
+        ],
+    ),
+    (
+        7,
+        "Журнал изменений чёрного списка",
+        [
+            # по журналу воркеры (supervisor.py) подтягивают баны друг друга
+            """
+            CREATE TABLE IF NOT EXISTS ban_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_id INTEGER NOT NULL,
+                reason TEXT,
+                active INTEGER NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_ban_events_insert
+            AFTER INSERT ON banned_users
+            BEGIN
+                INSERT INTO ban_events (tg_id, reason, active)
+                VALUES (NEW.tg_id, NEW.reason, NEW.active);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_ban_events_update
+            AFTER UPDATE OF reason, active ON banned_users
+            BEGIN
+                INSERT INTO ban_events (tg_id, reason, active)
+                VALUES (NEW.tg_id, NEW.reason, NEW.active);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_ban_events_delete
+            AFTER DELETE ON banned_users
+            BEGIN
+                INSERT INTO ban_events (tg_id, reason, active)
+                VALUES (OLD.tg_id, NULL, 0);
+            END
+            """,
+        ],
+    ),
+    (
+        8,
+        "Ключ идемпотентности заказа",
+        [
+            # ключ выдаётся на один проход FSM оформления заказа (order_handlers):
+            # повторное подтверждение находит уже созданный заказ
+            _add_column("orders", "idempotency_key", "TEXT"),
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key
+            ON orders(idempotency_key) WHERE idempotency_key IS NOT NULL
+            """,
+        ],
+    ),
+    (
+        9,
+        "Outbox уведомлений",
+        [
+            # пишется в одной транзакции с заказом или сменой статуса, отправляет
+            # outbox.py. next_attempt_at — unix-время; NULL — попытки исчерпаны
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL,
+                last_error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_due
+            ON outbox(next_attempt_at) WHERE next_attempt_at IS NOT NULL
+            """,
+        ],
+    ),
+    (
+        10,
+        "Архив завершённых заказов",
+        [
+            # сюда maintenance.py переносит старые done/cancelled заказы; у orders
+            # нет триггера статистики на удаление, поэтому счётчики не меняются
+            """
+            CREATE TABLE IF NOT EXISTS orders_archive (
+                id INTEGER PRIMARY KEY,
+                client_id INTEGER,
+                type TEXT,
+                service_code TEXT,
+                title TEXT,
+                description TEXT,
+                budget TEXT,
+                deadline TEXT,
+                contact_method TEXT,
+                contact_value TEXT,
+                status TEXT,
+                created_at DATETIME,
+                idempotency_key TEXT,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            # кандидаты в архив — из индекса, без прохода по активным заказам
+            """
+            CREATE INDEX IF NOT EXISTS idx_orders_closed_created
+            ON orders(created_at) WHERE status IN ('done', 'cancelled')
+            """,
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        # таблицы ещё нет — чистая или созданная до миграций база
+        return 0
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции, каждую в своей транзакции. Возвращает версию схемы."""
+    version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    for number, description, steps in MIGRATIONS:
+        if number <= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            if get_schema_version(conn) >= number:
+                conn.rollback()
+                continue
+
+            cur = conn.cursor()
+            for step in steps:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            cur.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (number, description),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        logger.info("Применена миграция %s: %s", number, description)
+        version = number
+
+    return version
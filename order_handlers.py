@@ -20,24 +20,25 @@ from states import (
     UnbanRequestState,
 )
 from services import (
-    SERVICES,
+    get_service_by_code,
     get_services_list_text,
     get_services_inline_keyboard,
 )
-from database import (
+from async_db import (
+    DBSession,
     get_or_create_client,
     add_order,
-    is_user_banned,
-    ban_user,
-    get_captcha_attempts,
-    increment_captcha_attempts,
-    reset_captcha_attempts,
     add_unban_request,
-    get_ban_reason,
+    get_order_id_by_key,
 )
+from ban_registry import get_ban_reason
+from captcha_tracker import get_tracker
 from config import ADMIN_ID
+from outbound import PRIORITY_ALERT
+import outbox
 
 import random
+import uuid
 
 
 CONTACT_PROMPTS = {
@@ -84,42 +85,6 @@ CAPTCHA_QUESTIONS = [
 ]
 
 
-def get_service_by_code(code: str):
-    for s in SERVICES:
-        if s["code"] == code:
-            return s
-    return None
-
-
-# ====== ВСПОМОГАТЕЛЬНОЕ: ПРОВЕРКА БАНА ======
-
-async def check_ban_and_block(message: types.Message):
-    if is_user_banned(message.from_user.id):
-        reason = get_ban_reason(message.from_user.id) or "Многократное не прохождение проверки."
-        await message.answer(
-            "🚫 Доступ к боту временно ограничен.\n\n"
-            f"Причина: <b>{reason}</b>\n\n"
-            "Если вы считаете, что это ошибка, вы можете отправить заявку на разбан.",
-            reply_markup=get_banned_user_kb(),
-        )
-        return True
-    return False
-
-
-async def check_ban_and_block_callback(callback: types.CallbackQuery):
-    if is_user_banned(callback.from_user.id):
-        reason = get_ban_reason(callback.from_user.id) or "Многократное не прохождение проверки."
-        await callback.message.answer(
-            "🚫 Доступ к боту временно ограничен.\n\n"
-            f"Причина: <b>{reason}</b>\n\n"
-            "Если вы считаете, что это ошибка, вы можете отправить заявку на разбан.",
-            reply_markup=get_banned_user_kb(),
-        )
-        await callback.answer()
-        return True
-    return False
-
-
 # ====== КАПЧА ======
 
 def build_captcha():
@@ -203,10 +168,7 @@ async def show_custom_confirm_after_captcha(callback: types.CallbackQuery, state
     )
 
 
-async def captcha_answer(callback: types.CallbackQuery, state: FSMContext):
-    if await check_ban_and_block_callback(callback):
-        return
-
+async def captcha_answer(callback: types.CallbackQuery, state: FSMContext, db: DBSession):
     data = await state.get_data()
     correct_index = data.get("captcha_correct")
     stage = data.get("captcha_stage")
@@ -216,7 +178,7 @@ async def captcha_answer(callback: types.CallbackQuery, state: FSMContext):
 
     if chosen == correct_index:
         # Успех
-        reset_captcha_attempts(callback.from_user.id)
+        get_tracker().reset(callback.from_user.id)
 
         if stage == "start":
             # завершаем только стартовую капчу
@@ -242,14 +204,16 @@ async def captcha_answer(callback: types.CallbackQuery, state: FSMContext):
         return
 
     # Ошибка
-    attempts = increment_captcha_attempts(callback.from_user.id)
-    remaining = max(0, 5 - attempts)
+    tracker = get_tracker()
+    attempts = await tracker.fail(callback.from_user.id)
+    remaining = max(0, tracker.max_attempts - attempts)
 
-    if attempts >= 5:
-        ban_user(callback.from_user.id, "Не прошёл капчу 5 раз.")
+    if attempts >= tracker.max_attempts:
+        # бан уже записан трекером вместе со сбросом счётчика
+        await db.commit()
         await state.finish()
         await callback.message.answer(
-            "🚫 Вы не прошли проверку 5 раз.\n"
+            f"🚫 Вы не прошли проверку {tracker.max_attempts} раз.\n"
             "Доступ к боту временно ограничен.",
             reply_markup=get_banned_user_kb(),
         )
@@ -259,7 +223,7 @@ async def captcha_answer(callback: types.CallbackQuery, state: FSMContext):
     # предупреждение
     await callback.message.answer(
         f"Ответ неверный 😔\n"
-        f"Попыток: <b>{attempts}</b> из 5.\n"
+        f"Попыток: <b>{attempts}</b> из {tracker.max_attempts}.\n"
         f"Осталось: <b>{remaining}</b>.\n"
         "Попробуем ещё раз!",
     )
@@ -274,6 +238,27 @@ async def captcha_answer(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+# ====== КЛЮЧ ИДЕМПОТЕНТНОСТИ ======
+
+def new_order_key() -> str:
+    """
+    Ключ одного оформления заказа: выдаётся в начале FSM и уходит в
+    orders.idempotency_key. Повторное "Подтвердить" (медленный ответ,
+    ошибка после коммита) находит уже созданный заказ по ключу.
+    """
+    return uuid.uuid4().hex
+
+
+async def order_submitted(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.edit_text("🔥 Заказ отправлен! Мы свяжемся с вами.")
+    await callback.message.answer(
+        "Выберите действие:", reply_markup=get_client_menu()
+    )
+
+    await state.finish()
+    await callback.answer()
+
+
 # ====== /start ======
 
 async def cmd_start(message: types.Message, state: FSMContext):
@@ -286,9 +271,6 @@ async def cmd_start(message: types.Message, state: FSMContext):
         )
         return
 
-    if await check_ban_and_block(message):
-        return
-
     # запускаем капчу
     await start_captcha(message, state)
 
@@ -296,14 +278,10 @@ async def cmd_start(message: types.Message, state: FSMContext):
 # ====== БАЗОВЫЕ ХЕНДЛЕРЫ ======
 
 async def show_services(message: types.Message):
-    if await check_ban_and_block(message):
-        return
     await message.answer(get_services_list_text())
 
 
 async def about_us(message: types.Message):
-    if await check_ban_and_block(message):
-        return
     await message.answer(
         "<b>Кузнечная Мастерская Амбидекстора</b>\n\n"
         "🔥 Художественная ковка\n"
@@ -314,8 +292,6 @@ async def about_us(message: types.Message):
 
 
 async def contacts(message: types.Message):
-    if await check_ban_and_block(message):
-        return
     await message.answer(
         "<b>Контакты:</b>\n"
         "Email: ognenukovcheg@gmail.com\n"
@@ -326,8 +302,6 @@ async def contacts(message: types.Message):
 # ====== ЗАКАЗ ГОТОВОЙ УСЛУГИ ======
 
 async def make_order(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
     await message.answer(
         "Выберите услугу:",
         reply_markup=get_services_inline_keyboard(),
@@ -335,9 +309,6 @@ async def make_order(message: types.Message, state: FSMContext):
 
 
 async def choose_service(callback: types.CallbackQuery, state: FSMContext):
-    if await check_ban_and_block_callback(callback):
-        return
-
     code = callback.data.replace("service_", "")
     service = get_service_by_code(code)
 
@@ -345,7 +316,7 @@ async def choose_service(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer("Услуга не найдена", show_alert=True)
         return
 
-    await state.update_data(service_code=code)
+    await state.update_data(service_code=code, order_key=new_order_key())
 
     await OrderExistingServiceState.description.set()
     await callback.message.answer(
@@ -357,9 +328,6 @@ async def choose_service(callback: types.CallbackQuery, state: FSMContext):
 
 
 async def order_description(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     desc = sanitize_text(message.text)
     await state.update_data(description=desc)
 
@@ -368,9 +336,6 @@ async def order_description(message: types.Message, state: FSMContext):
 
 
 async def contact_method(callback: types.CallbackQuery, state: FSMContext):
-    if await check_ban_and_block_callback(callback):
-        return
-
     method = callback.data.replace("contact_", "")
     await state.update_data(contact_method=method)
 
@@ -380,9 +345,6 @@ async def contact_method(callback: types.CallbackQuery, state: FSMContext):
 
 
 async def contact_value(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     value = sanitize_text(message.text)
     await state.update_data(contact_value=value)
 
@@ -393,9 +355,6 @@ async def contact_value(message: types.Message, state: FSMContext):
 # ====== ИМЯ ДЛЯ ГОТОВОЙ УСЛУГИ ======
 
 async def order_user_name(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     name = sanitize_text(message.text)
     await state.update_data(user_name=name)
 
@@ -414,10 +373,7 @@ async def order_user_name(message: types.Message, state: FSMContext):
     )
 
 
-async def confirm_order(callback: types.CallbackQuery, state: FSMContext):
-    if await check_ban_and_block_callback(callback):
-        return
-
+async def confirm_order(callback: types.CallbackQuery, state: FSMContext, db: DBSession):
     choice = callback.data.replace("confirm_", "")
 
     if choice == "no":
@@ -432,13 +388,18 @@ async def confirm_order(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     service = get_service_by_code(data["service_code"])
 
-    client_id = get_or_create_client(
+    # заказ этого оформления уже создан: без записи и без уведомления админа
+    if await get_order_id_by_key(data.get("order_key")) is not None:
+        await order_submitted(callback, state)
+        return
+
+    client_id = await get_or_create_client(
         tg_id=callback.from_user.id,
         username=callback.from_user.username,
         name=data.get("user_name"),
     )
 
-    order_id = add_order(
+    order_id = await add_order(
         client_id=client_id,
         type_="service",
         service_code=data["service_code"],
@@ -448,6 +409,7 @@ async def confirm_order(callback: types.CallbackQuery, state: FSMContext):
         deadline=None,
         contact_method=data["contact_method"],
         contact_value=data["contact_value"],
+        idempotency_key=data.get("order_key"),
     )
 
     username = callback.from_user.username
@@ -461,31 +423,22 @@ async def confirm_order(callback: types.CallbackQuery, state: FSMContext):
         f"Описание: {data['description']}\n"
         f"Контакт: {data['contact_value']}"
     )
-    await callback.bot.send_message(ADMIN_ID, order_text)
+    # клиент, заказ и уведомление админа — одной транзакцией
+    await outbox.add(ADMIN_ID, order_text, priority=PRIORITY_ALERT)
+    await db.commit()
 
-    await callback.message.edit_text("🔥 Заказ отправлен! Мы свяжемся с вами.")
-    await callback.message.answer(
-        "Выберите действие:", reply_markup=get_client_menu()
-    )
-
-    await state.finish()
-    await callback.answer()
+    await order_submitted(callback, state)
 
 
 # ====== КАСТОМНЫЙ ЗАКАЗ ======
 
 async def custom_order(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
+    await state.update_data(order_key=new_order_key())
     await CustomOrderState.title.set()
     await message.answer("Введите название заказа:")
 
 
 async def custom_title(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     title = sanitize_text(message.text)
     await state.update_data(title=title)
 
@@ -494,9 +447,6 @@ async def custom_title(message: types.Message, state: FSMContext):
 
 
 async def custom_desc(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     desc = sanitize_text(message.text)
     await state.update_data(description=desc)
 
@@ -505,9 +455,6 @@ async def custom_desc(message: types.Message, state: FSMContext):
 
 
 async def custom_budget(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     budget = sanitize_text(message.text)
     await state.update_data(budget=budget)
 
@@ -516,9 +463,6 @@ async def custom_budget(message: types.Message, state: FSMContext):
 
 
 async def custom_deadline(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     deadline = sanitize_text(message.text)
     await state.update_data(deadline=deadline)
 
@@ -527,9 +471,6 @@ async def custom_deadline(message: types.Message, state: FSMContext):
 
 
 async def custom_contact_method(callback: types.CallbackQuery, state: FSMContext):
-    if await check_ban_and_block_callback(callback):
-        return
-
     method = callback.data.replace("contact_", "")
     await state.update_data(contact_method=method)
 
@@ -539,9 +480,6 @@ async def custom_contact_method(callback: types.CallbackQuery, state: FSMContext
 
 
 async def custom_contact_value(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     value = sanitize_text(message.text)
     await state.update_data(contact_value=value)
 
@@ -552,9 +490,6 @@ async def custom_contact_value(message: types.Message, state: FSMContext):
 # ====== ИМЯ ДЛЯ КАСТОМНОГО ЗАКАЗА ======
 
 async def custom_user_name(message: types.Message, state: FSMContext):
-    if await check_ban_and_block(message):
-        return
-
     name = sanitize_text(message.text)
     await state.update_data(user_name=name)
 
@@ -574,10 +509,7 @@ async def custom_user_name(message: types.Message, state: FSMContext):
     )
 
 
-async def confirm_custom(callback: types.CallbackQuery, state: FSMContext):
-    if await check_ban_and_block_callback(callback):
-        return
-
+async def confirm_custom(callback: types.CallbackQuery, state: FSMContext, db: DBSession):
     choice = callback.data.replace("confirm_", "")
 
     if choice == "no":
@@ -591,13 +523,18 @@ async def confirm_custom(callback: types.CallbackQuery, state: FSMContext):
 
     data = await state.get_data()
 
-    client_id = get_or_create_client(
+    # заказ этого оформления уже создан: без записи и без уведомления админа
+    if await get_order_id_by_key(data.get("order_key")) is not None:
+        await order_submitted(callback, state)
+        return
+
+    client_id = await get_or_create_client(
         tg_id=callback.from_user.id,
         username=callback.from_user.username,
         name=data.get("user_name"),
     )
 
-    order_id = add_order(
+    order_id = await add_order(
         client_id=client_id,
         type_="custom",
         service_code=None,
@@ -607,6 +544,7 @@ async def confirm_custom(callback: types.CallbackQuery, state: FSMContext):
         deadline=data["deadline"],
         contact_method=data["contact_method"],
         contact_value=data["contact_value"],
+        idempotency_key=data.get("order_key"),
     )
 
     username = callback.from_user.username
@@ -622,15 +560,11 @@ async def confirm_custom(callback: types.CallbackQuery, state: FSMContext):
         f"Сроки: {data['deadline']}\n"
         f"Контакт: {data['contact_value']}"
     )
-    await callback.bot.send_message(ADMIN_ID, order_text)
-
-    await callback.message.edit_text("🔥 Заказ отправлен! Мы свяжемся с вами.")
-    await callback.message.answer(
-        "Выберите действие:", reply_markup=get_client_menu()
-    )
+    # клиент, заказ и уведомление админа — одной транзакцией
+    await outbox.add(ADMIN_ID, order_text, priority=PRIORITY_ALERT)
+    await db.commit()
 
-    await state.finish()
-    await callback.answer()
+    await order_submitted(callback, state)
 
 
 # ====== ЗАБАНЕННЫЙ ПОЛЬЗОВАТЕЛЬ: КНОПКИ ======
@@ -653,9 +587,10 @@ async def banned_why(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-async def unban_request_reason(message: types.Message, state: FSMContext):
+async def unban_request_reason(message: types.Message, state: FSMContext, db: DBSession):
     reason = sanitize_text(message.text)
-    add_unban_request(message.from_user.id, reason)
+    await add_unban_request(message.from_user.id, reason)
+    await db.commit()
     await state.finish()
 
     await message.answer(
@@ -670,9 +605,6 @@ async def fallback(message: types.Message):
     if message.from_user.id == ADMIN_ID:
         return
 
-    if await check_ban_and_block(message):
-        return
-
     await message.answer(
         "Команда не распознана. Воспользуйтесь меню ниже.",
         reply_markup=get_main_menu(message.from_user.id),
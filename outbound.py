@@ -0,0 +1,301 @@
+# outbound.py
+"""
+Очередь исходящих сообщений с учётом лимитов Telegram.
+
+Уведомления (новый заказ — админу, смена статуса и разбан — клиенту)
+не отправляются прямо из хендлера: их пишет в БД outbox.py и пачками
+передаёт сюда. enqueue_message кладёт сообщение в очередь и сразу
+возвращает Future, а фоновый воркер отправляет его:
+
+- глобальный token bucket (rate сообщений в секунду, запас burst);
+- не чаще одного сообщения в chat_interval секунд в один чат;
+- приоритеты: PRIORITY_ALERT (админские уведомления) раньше
+  PRIORITY_NORMAL, а PRIORITY_BULK (рассылки) — в последнюю очередь;
+- RetryAfter: чат откладывается на указанное Telegram время, общий
+  bucket обнуляется; сетевые ошибки повторяются с экспоненциальной
+  задержкой, заблокировавшие бота и удалённые чаты не повторяются;
+- повторы обоих видов считаются в max_attempts, а сообщение с deadline
+  (monotonic-время) не ждёт дольше него: Future завершается ошибкой, и
+  повтор остаётся вызывающему (outbox — до истечения своей аренды).
+
+Упавший воркер логируется и перезапускается.
+
+Ответы пользователю в рамках его же апдейта (message.answer, edit_text)
+идут напрямую — лимит rate оставляет для них запас.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import typing
+
+from aiogram import Bot
+from aiogram.utils.exceptions import (
+    ChatNotFound,
+    NetworkError,
+    RestartingTelegram,
+    RetryAfter,
+    Unauthorized,
+)
+
+from config import (
+    OUTBOUND_RATE,
+    OUTBOUND_BURST,
+    OUTBOUND_CHAT_INTERVAL,
+    OUTBOUND_CONCURRENCY,
+    OUTBOUND_MAX_ATTEMPTS,
+)
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ALERT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# сколько чатов помнить до очистки устаревших отметок времени
+CHAT_PACING_LIMIT = 10000
+# пауза перед перезапуском упавшего воркера
+WORKER_RESTART_DELAY = 1.0
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "text", "kwargs", "future", "attempts", "deadline")
+
+    def __init__(self, priority, seq, chat_id, text, kwargs, future, deadline):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+        self.deadline = deadline
+
+
+def _consume_exception(future: asyncio.Future):
+    # ошибка уже залогирована; не даём asyncio ругаться на непрочитанное исключение
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundScheduler:
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = OUTBOUND_RATE,
+        burst: int = OUTBOUND_BURST,
+        chat_interval: float = OUTBOUND_CHAT_INTERVAL,
+        concurrency: int = OUTBOUND_CONCURRENCY,
+        max_attempts: int = OUTBOUND_MAX_ATTEMPTS,
+    ):
+        self.bot = bot
+        self.rate = rate
+        self.burst = burst
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+
+        self._ready = []    # (priority, seq, job)
+        self._delayed = []  # (ready_at, priority, seq, job)
+        self._seq = itertools.count()
+        self._chat_next: typing.Dict[int, float] = {}
+
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._inflight: typing.Set[asyncio.Task] = set()
+        self._worker: typing.Optional[asyncio.Task] = None
+
+    # ====== ПОСТАНОВКА В ОЧЕРЕДЬ ======
+
+    def send_message(
+        self,
+        chat_id: int,
+        text: str,
+        priority: int = PRIORITY_NORMAL,
+        deadline: typing.Optional[float] = None,
+        **kwargs,
+    ) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(_consume_exception)
+
+        job = _Job(priority, next(self._seq), chat_id, text, kwargs, future, deadline)
+        heapq.heappush(self._ready, (job.priority, job.seq, job))
+
+        if self._worker is None:
+            self._worker = loop.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    def pending(self) -> int:
+        return len(self._ready) + len(self._delayed) + len(self._inflight)
+
+    # ====== ВОРКЕР ======
+
+    def _take_token(self, now: float) -> float:
+        """Списывает токен; если токенов нет — возвращает, сколько ждать."""
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def _defer(self, job: _Job, ready_at: float):
+        heapq.heappush(self._delayed, (ready_at, job.priority, job.seq, job))
+
+    def _retry(self, job: _Job, ready_at: float, error: Exception):
+        """Откладывает повтор до ready_at или завершает job ошибкой."""
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            logger.error("Сообщение в чат %s не отправлено после %s попыток: %s", job.chat_id, job.attempts, error)
+            job.future.set_exception(error)
+        elif job.deadline is not None and ready_at > job.deadline:
+            logger.warning("Сообщение в чат %s не успевает к сроку: %s", job.chat_id, error)
+            job.future.set_exception(error)
+        else:
+            self._defer(job, ready_at)
+            self._wakeup.set()
+
+    def _promote(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, priority, seq, job = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (priority, seq, job))
+
+    def _prune_pacing(self, now: float):
+        if len(self._chat_next) > CHAT_PACING_LIMIT:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+    async def _run(self):
+        while True:
+            try:
+                await self._loop()
+            except Exception:
+                logger.exception("Воркер outbound упал, перезапуск через %s с", WORKER_RESTART_DELAY)
+                await asyncio.sleep(WORKER_RESTART_DELAY)
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            self._promote(now)
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, job = self._ready[0]
+            ready_at = self._chat_next.get(job.chat_id, 0.0)
+            if job.deadline is not None and max(ready_at, now) >= job.deadline:
+                heapq.heappop(self._ready)
+                job.future.set_exception(asyncio.TimeoutError("сообщение не успевает к сроку"))
+                continue
+
+            if ready_at > now:
+                heapq.heappop(self._ready)
+                self._defer(job, ready_at)
+                continue
+
+            wait = self._take_token(now)
+            if wait:
+                # пока ждём токен, может прийти сообщение приоритетнее
+                await asyncio.sleep(wait)
+                continue
+
+            heapq.heappop(self._ready)
+            self._chat_next[job.chat_id] = now + self.chat_interval
+            self._prune_pacing(now)
+
+            await self._slots.acquire()
+            task = asyncio.get_running_loop().create_task(self._send(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, job: _Job):
+        try:
+            result = await self.bot.send_message(job.chat_id, job.text, **job.kwargs)
+        except RetryAfter as e:
+            ready_at = time.monotonic() + e.timeout
+            self._chat_next[job.chat_id] = ready_at
+            self._tokens = 0.0
+            logger.warning("Flood control: чат %s, повтор через %s с", job.chat_id, e.timeout)
+            self._retry(job, ready_at, e)
+        except (Unauthorized, ChatNotFound) as e:
+            # бот заблокирован / чат удалён — повторять бессмысленно
+            logger.info("Сообщение в чат %s не доставлено: %s", job.chat_id, e)
+            job.future.set_exception(e)
+        except (NetworkError, RestartingTelegram) as e:
+            self._retry(job, time.monotonic() + 2 ** (job.attempts + 1), e)
+        except Exception as e:
+            logger.exception("Ошибка отправки сообщения в чат %s", job.chat_id)
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    # ====== ОСТАНОВКА ======
+
+    async def close(self, timeout: float = 10.0):
+        """Ждёт, пока очередь опустеет (не дольше timeout), затем останавливает воркер."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+        left = [job for *_, job in self._ready + self._delayed]
+        if left:
+            logger.warning("Не отправлено сообщений при остановке: %s", len(left))
+        for job in left:
+            job.future.cancel()
+        self._ready.clear()
+        self._delayed.clear()
+
+
+_scheduler: typing.Optional[OutboundScheduler] = None
+
+
+def setup(bot: Bot, **kwargs) -> OutboundScheduler:
+    global _scheduler
+    _scheduler = OutboundScheduler(bot, **kwargs)
+    return _scheduler
+
+
+def get_scheduler() -> OutboundScheduler:
+    if _scheduler is None:
+        raise RuntimeError("outbound.setup() не вызван")
+    return _scheduler
+
+
+def enqueue_message(
+    chat_id: int,
+    text: str,
+    priority: int = PRIORITY_NORMAL,
+    deadline: typing.Optional[float] = None,
+    **kwargs,
+) -> asyncio.Future:
+    """Ставит сообщение в очередь и сразу возвращается; ждать Future не обязательно."""
+    return get_scheduler().send_message(chat_id, text, priority=priority, deadline=deadline, **kwargs)
+
+
+async def shutdown(timeout: float = 10.0):
+    if _scheduler is not None:
+        await _scheduler.close(timeout)
+
+
+Gauge(
+    "bot_outbound_pending",
+    "Сообщений в очереди outbound, включая отложенные и отправляемые.",
+    lambda: _scheduler.pending() if _scheduler is not None else 0,
+)
@@ -0,0 +1,167 @@
+# outbox.py
+"""
+Transactional outbox для уведомлений о заказах и статусах.
+
+Хендлер не отправляет уведомление сам: add() пишет его в таблицу outbox
+в той же транзакции DBSession, что и заказ или смену статуса. Откатилась
+транзакция — нет и уведомления; закоммитилась — уведомление уже в БД и
+переживёт перезапуск. Задержка хендлера не зависит от Telegram.
+
+Фоновый OutboxDispatcher забирает готовые сообщения пачками по
+batch_size (claim_outbox: срок следующей попытки сдвигается на lease —
+другой воркер супервизора их не возьмёт), кладёт пачку в outbound и ждёт
+результатов. Итог пачки пишется одной транзакцией: доставленные и
+недоставляемые (бот заблокирован, чат удалён) удаляются, остальные
+повторяются с экспоненциальной задержкой; после max_attempts попыток
+сообщение остаётся в outbox с next_attempt_at = NULL и ошибкой в
+last_error. Доставка — не реже одного раза: упавший посреди пачки
+процесс отправит её повторно после lease.
+
+Dispatcher просыпается после коммита транзакции с новым сообщением
+(DBSession.after_commit) и на всякий случай раз в poll_interval секунд.
+"""
+import asyncio
+import logging
+import time
+import typing
+
+from aiogram.utils.exceptions import ChatNotFound, Unauthorized
+
+import async_db
+from config import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_LEASE,
+    OUTBOX_MAX_ATTEMPTS,
+)
+import outbound
+from outbound import enqueue_message, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# задержка повтора: retry_delay * 2^(попытка-1), но не больше
+MAX_RETRY_DELAY = 600.0
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        lease: float = OUTBOX_LEASE,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        retry_delay: float = 5.0,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self):
+        if self._task is None and not self._closing:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    async def _run(self):
+        while not self._closing:
+            # до запроса: сообщение, закоммиченное во время запроса, снова разбудит
+            self._wakeup.clear()
+            try:
+                rows = await async_db.claim_outbox(self.batch_size, self.lease)
+            except Exception:
+                logger.exception("Не удалось забрать сообщения из outbox")
+                rows = []
+
+            if rows:
+                await self._deliver(rows)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, rows):
+        # outbound сдаётся задолго до конца аренды: иначе пачку заберёт
+        # другой воркер и отправит ещё раз
+        deadline = time.monotonic() + self.lease / 2
+        futures = [
+            enqueue_message(row["chat_id"], row["text"], priority=row["priority"], deadline=deadline)
+            for row in rows
+        ]
+        await asyncio.wait(futures)
+
+        delivered, retries, released = [], [], []
+        now = time.time()
+        for row, future in zip(rows, futures):
+            if future.cancelled():
+                # outbound остановлен раньше, чем дошла очередь
+                released.append((row["id"],))
+                continue
+            error = future.exception()
+            if error is None or isinstance(error, (Unauthorized, ChatNotFound)):
+                delivered.append((row["id"],))
+            elif row["attempts"] >= self.max_attempts:
+                logger.error("Уведомление %s в чат %s не отправлено: %s", row["id"], row["chat_id"], error)
+                retries.append((None, repr(error), row["id"]))
+            else:
+                delay = min(self.retry_delay * 2 ** (row["attempts"] - 1), MAX_RETRY_DELAY)
+                retries.append((now + delay, repr(error), row["id"]))
+
+        try:
+            await async_db.finish_outbox(delivered, retries, released)
+        except Exception:
+            # после lease пачка уйдёт повторно
+            logger.exception("Не удалось записать итог пачки outbox")
+
+    async def close(self, timeout: float = 10.0):
+        """Новые пачки не забираются; текущая досылается не дольше timeout."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        _, pending = await asyncio.wait({self._task}, timeout=timeout)
+        if pending:
+            # не дождались: outbound отменит неотправленное, и пачка запишет
+            # итог — отменённые вернутся в outbox, отправленные не повторятся
+            await outbound.shutdown(0)
+            await self._task
+        self._task = None
+
+
+_dispatcher: typing.Optional[OutboxDispatcher] = None
+
+
+def setup(**kwargs) -> OutboxDispatcher:
+    global _dispatcher
+    _dispatcher = OutboxDispatcher(**kwargs)
+    return _dispatcher
+
+
+def get_dispatcher() -> OutboxDispatcher:
+    if _dispatcher is None:
+        raise RuntimeError("outbox.setup() не вызван")
+    return _dispatcher
+
+
+async def add(chat_id: int, text: str, priority: int = PRIORITY_NORMAL):
+    """
+    Записывает уведомление в outbox. Внутри DBSession — в её транзакции,
+    отправка начнётся после коммита; вне сессии запись коммитится сразу.
+    """
+    dispatcher = get_dispatcher()
+    await async_db.add_outbox_message(chat_id, text, priority)
+    async_db.after_commit(dispatcher.wake)
+
+
+async def shutdown(timeout: float = 10.0):
+    if _dispatcher is not None:
+        await _dispatcher.close(timeout)
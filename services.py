@@ -1,91 +1,159 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-# Список услуг (расширенный)
-SERVICES = [
-    {
-        "code": "beam_decor",
-        "name": "Металлическая балка с декоративным усилением",
-        "price": "от 15 000 ₽",
-        "description": "Металлическая балка с ромбовидными накладками и клёпкой в индустриальном стиле лофт. Подходит для перекрытий, декоративных балок и опорных элементов.",
-    },
-    {
-        "code": "turtle_frame",
-        "name": "Металлическая каркасная скульптура «Черепаха»",
-        "price": "от 15 000 ₽",
-        "description": "Объёмная каркасная скульптура черепахи из металлического прутка. Лёгкая, прочная и эффектная фигура для участка, парка или арт‑пространства.",
-    },
-    {
-        "code": "turtle_stone",
-        "name": "Кованая садовая фигура «Черепаха» с каменной набивкой",
-        "price": "от 12 000 ₽",
-        "description": "Металлический каркас черепахи, заполненный натуральным камнем. Устойчивая садовая фигура, идеально вписывающаяся в ландшафт.",
-    },
-    {
-        "code": "knife_author",
-        "name": "Авторский нож с деревянной рукоятью и ножнами",
-        "price": "от 20 000 ₽",
-        "description": "Ручной работы нож с полированным клинком, рукоятью из массива и деревянными ножнами. Подходит для коллекции, подарка и практического использования.",
-    },
-    {
-        "code": "dagger_decor",
-        "name": "Кованый декоративный кинжал ручной работы",
-        "price": "от 30 000 ₽",
-        "description": "Декоративный кинжал с выраженным рёберным профилем и кожаной рукоятью. Статусное изделие для коллекции и интерьерного декора.",
-    },
-    {
-        "code": "stairs_spiral",
-        "name": "Кованая винтовая лестница с художественными элементами",
-        "price": "от 180 000 ₽",
-        "description": "Премиальная винтовая лестница с ручной художественной ковкой. Становится центральным объектом интерьера и подчёркивает статус владельца.",
-    },
-    {
-        "code": "roses_gold_stump",
-        "name": "Кованая композиция «Золотые розы на пне»",
-        "price": "от 30 000 ₽",
-        "description": "Скульптурная композиция с коваными розами и основанием в виде пня. Золотая патина создаёт эффект дорогой, статусной работы.",
-    },
-    {
-        "code": "roses_black",
-        "name": "Кованая композиция «Чёрные розы»",
-        "price": "от 18 000 ₽",
-        "description": "Авторская композиция с коваными розами в чёрном цвете и декоративной лентой. Стильный акцент для интерьера и входной группы.",
-    },
-    {
-        "code": "roses_bouquet",
-        "name": "Кованая композиция «Букет роз»",
-        "price": "от 25 000 ₽",
-        "description": "Кованый букет роз с проработанными лепестками и патиной. Подходит как премиальный подарок и элемент интерьерного декора.",
-    },
-    {
-        "code": "canopy_polycarbonate",
-        "name": "Кованый козырёк с поликарбонатом под ключ",
-        "price": "от 14 000 ₽",
-        "description": "Козырёк с коваными кронштейнами и поликарбонатной крышей. Защищает от осадков и украшает фасад дома или коммерческого объекта.",
-    },
-    {
-        "code": "canopy_umbrella",
-        "name": "Кованый декоративный козырёк‑зонтик",
-        "price": "от 18 000 ₽",
-        "description": "Козырёк в форме зонта с художественной ковкой. Работает как защита и как арт‑объект для фасада, террасы или входной группы.",
-    },
-    {
-        "code": "fence_forest",
-        "name": "Кованый декоративный забор «Лесная коллекция»",
-        "price": "от 35 000 ₽",
-        "description": "Декоративный забор с коваными завитками и розами. Используется как ограждение и элемент ландшафтного дизайна премиум‑уровня.",
-    },
-    {
-        "code": "bench_forest",
-        "name": "Скамейка с художественной ковкой «Лесные мотивы»",
-        "price": "от 28 000 ₽",
-        "description": "Скамейка с кованым основанием в виде переплетённых ветвей и деревянными ламелями. Подходит для участков, парков и эко‑пространств.",
-    },
-]
+from config import CATALOG_PATH
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ("code", "name", "price", "description")
+
+# callback_data кнопки — "service_<code>", а Telegram ограничивает её 64 байтами
+MAX_CODE_BYTES = 64 - len("service_")
+
+
+# ====== КАТАЛОГ ======
+
+class Catalog:
+    """
+    Неизменяемый снимок каталога: услуги в порядке показа и индекс
+    code -> услуга. При перезагрузке строится новый снимок и подменяется
+    целиком, поэтому хендлеры никогда не видят наполовину обновлённый список.
+    """
+
+    __slots__ = ("services", "by_code")
+
+    def __init__(self, services):
+        self.services: Tuple[Mapping, ...] = tuple(MappingProxyType(dict(s)) for s in services)
+        self.by_code: Mapping[str, Mapping] = MappingProxyType({s["code"]: s for s in self.services})
+
+
+def validate_services(raw) -> list:
+    if not isinstance(raw, list):
+        raise ValueError("каталог должен быть списком услуг")
+
+    seen = set()
+    for n, item in enumerate(raw, 1):
+        if not isinstance(item, dict):
+            raise ValueError(f"услуга №{n} должна быть объектом, а не {type(item).__name__}")
+        missing = [f for f in REQUIRED_FIELDS if not item.get(f)]
+        if missing:
+            raise ValueError(f"у услуги {item.get('code')!r} нет полей: {', '.join(missing)}")
+        wrong = [f for f in REQUIRED_FIELDS if not isinstance(item[f], str)]
+        if wrong:
+            raise ValueError(f"у услуги {item['code']!r} поля не строки: {', '.join(wrong)}")
+        code = item["code"]
+        if code in seen:
+            raise ValueError(f"повторяется код услуги {code!r}")
+        if len(code.encode()) > MAX_CODE_BYTES:
+            raise ValueError(f"код услуги {code!r} длиннее {MAX_CODE_BYTES} байт")
+        seen.add(code)
+    return raw
+
+
+def read_catalog_file(path: Path = CATALOG_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return validate_services(json.load(f))
+
+
+def _file_stamp(path: Path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+_catalog = Catalog(read_catalog_file())
+_catalog_stamp = _file_stamp(CATALOG_PATH)  # (mtime_ns, size) загруженного файла
+
+
+def get_services() -> Tuple[Mapping, ...]:
+    return _catalog.services
 
 
+def get_service_by_code(code: str) -> Optional[Mapping]:
+    return _catalog.by_code.get(code)
+
+
+def reload_catalog(path: Path = CATALOG_PATH) -> bool:
+    """
+    Перечитывает файл каталога, если он изменился. Битый файл не применяется —
+    остаётся предыдущий каталог. Возвращает True, если каталог заменён.
+    """
+    global _catalog_stamp
+    try:
+        stamp = _file_stamp(path)
+        if stamp == _catalog_stamp:
+            return False
+        services = read_catalog_file(path)
+    except (OSError, ValueError) as e:
+        logger.error("Каталог %s не загружен: %s", path, e)
+        return False
+
+    set_services(services)
+    _catalog_stamp = stamp
+    logger.info("Каталог загружен: %s услуг", len(services))
+    return True
+
+
+async def watch_catalog(interval: float, path: Path = CATALOG_PATH):
+    """Фоновая задача: раз в interval секунд проверяет файл каталога."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, reload_catalog, path)
+        except Exception:
+            # непредвиденная ошибка не должна останавливать слежение
+            logger.exception("Ошибка перезагрузки каталога %s", path)
+        await asyncio.sleep(interval)
+
+
+# ====== КЭШ ОТРИСОВКИ ======
+# Текст каталога и клавиатура услуг строятся один раз на версию каталога.
+# Версия растёт при каждой замене каталога через set_services().
+
+_catalog_version = 0
+_render_cache = {}  # имя -> (версия каталога, результат)
+
+
+def catalog_version() -> int:
+    return _catalog_version
+
+
+def set_services(services):
+    global _catalog, _catalog_version
+    _catalog = Catalog(services)
+    _catalog_version += 1
+
+
+def cached_render(build):
+    """Кэширует результат build() до следующей смены версии каталога."""
+    name = build.__name__
+
+    def wrapper():
+        # версия — до build(): каталог могут подменить из потока watch_catalog,
+        # и результат по старому каталогу не должен попасть под новую версию
+        version = _catalog_version
+        entry = _render_cache.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        value = build()
+        _render_cache[name] = (version, value)
+        return value
+
+    wrapper.__name__ = name
+    wrapper.build = build
+    return wrapper
+
+
+@cached_render
 def get_services_list_text() -> str:
     lines = ["<b>Наши услуги:</b>\n"]
-    for s in SERVICES:
+    for s in get_services():
         lines.append(
             f"🔹 <b>{s['name']}</b>\n"
             f"💰 Цена: <i>{s['price']}</i>\n"
@@ -94,9 +162,10 @@ def get_services_list_text() -> str:
     return "\n".join(lines)
 
 
+@cached_render
 def get_services_inline_keyboard() -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(row_width=1)
-    for s in SERVICES:
+    for s in get_services():
         kb.add(
             InlineKeyboardButton(
                 text=f"{s['name']} ({s['price']})",
@@ -104,5 +173,3 @@ def get_services_inline_keyboard() -> InlineKeyboardMarkup:
             )
         )
     return kb
-
-
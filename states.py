@@ -33,3 +33,12 @@ class CaptchaState(StatesGroup):
 
 class UnbanRequestState(StatesGroup):
     waiting_reason = State()
+
+
+class BroadcastState(StatesGroup):
+    text = State()
+    confirm = State()
+
+
+class SearchState(StatesGroup):
+    query = State()
@@ -0,0 +1,306 @@
+# supervisor.py
+"""
+Несколько процессов-воркеров за одним супервизором (BOT_WORKERS > 1).
+
+Супервизор один забирает апдейты через getUpdates и раскладывает их по
+воркерам: ключ — from_user.id, воркер выбирается по кольцу согласованного
+хеширования (HashRing). Поэтому все апдейты пользователя идут в один и тот
+же процесс, а при смене числа воркеров переезжает только ~1/N
+пользователей. Апдейты передаются в stdin воркера строками JSON; упавший
+воркер перезапускается, и недоставленные ему апдейты уходят новому.
+
+Воркер — обычный Dispatcher из main.create_dispatcher. Общее состояние:
+- FSM — в SQLite (fsm_storage.py); кэш в памяти воркера не расходится с
+  другими, потому что пользователь закреплён за одним воркером;
+- лимиты RateLimitMiddleware и счётчики капчи — тоже по пользователю,
+  поэтому остаются в памяти своего воркера;
+- чёрный список пишется в banned_users, а журнал ban_events раз в
+  BAN_SYNC_INTERVAL секунд доносит чужие баны и разбаны до ban_registry
+  каждого воркера;
+- общий лимит исходящих сообщений делится между воркерами поровну.
+
+Рассылки продолжает после перезапуска воркер, за которым закреплён
+ADMIN_ID: там же работают хендлеры рассылки. Он же обслуживает БД
+(maintenance.py). Метрики воркер i отдаёт на METRICS_PORT + i.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import signal
+import subprocess
+import sys
+import time
+import typing
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.utils.exceptions import NetworkError, RetryAfter, TelegramAPIError
+
+import async_db
+import ban_registry
+from config import ADMIN_ID, BAN_SYNC_INTERVAL, METRICS_PORT, TOKEN
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent
+
+# точек на кольце на одного воркера: больше — ровнее распределение
+VNODES = 64
+POLL_TIMEOUT = 20
+# апдейтов в очереди одного воркера, пока он перезапускается
+QUEUE_SIZE = 10000
+RESTART_DELAY = 1.0
+
+
+# ====== РАЗБИЕНИЕ ПО ПОЛЬЗОВАТЕЛЯМ ======
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Кольцо согласованного хеширования: ключ -> номер воркера 0..nodes-1."""
+
+    def __init__(self, nodes: int, vnodes: int = VNODES):
+        points = sorted((_hash(f"{node}:{v}"), node) for node in range(nodes) for v in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: int) -> int:
+        index = bisect.bisect(self._points, _hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+def routing_key(update: dict) -> int:
+    """from_user.id апдейта; для апдейтов без пользователя — чат или update_id."""
+    for kind, body in update.items():
+        if kind == "update_id" or not isinstance(body, dict):
+            continue
+        user = body.get("from") or body.get("user")
+        if user:
+            return user["id"]
+        chat = body.get("chat") or (body.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+# ====== СУПЕРВИЗОР ======
+
+def worker_command(index: int, count: int) -> typing.List[str]:
+    # рабочий каталог наследуется: относительный DB_PATH тот же, что у супервизора
+    code = f"import sys; sys.path.insert(0, {str(ROOT)!r}); import supervisor; supervisor.worker_main()"
+    return [sys.executable, "-c", code, str(index), str(count)]
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        self.process: typing.Optional[asyncio.subprocess.Process] = None
+        self.changed = asyncio.Condition()
+
+
+class Supervisor:
+    def __init__(self, workers: int, command: typing.Callable[[int, int], list] = worker_command):
+        self.ring = HashRing(workers)
+        self.command = command
+        self.workers = [_Worker(index) for index in range(workers)]
+        self._tasks: typing.List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            await self._spawn(worker)
+            self._tasks.append(loop.create_task(self._feed(worker)))
+            self._tasks.append(loop.create_task(self._watch(worker)))
+
+    async def route(self, update: dict):
+        """Ставит апдейт в очередь его воркера; ждёт, если очередь полна."""
+        worker = self.workers[self.ring.node_for(routing_key(update))]
+        await worker.queue.put(json.dumps(update, ensure_ascii=False).encode() + b"\n")
+
+    async def poll(self, bot: Bot, stop: asyncio.Event):
+        """getUpdates до stop; апдейты, накопившиеся до старта, пропускаются."""
+        await bot.delete_webhook(drop_pending_updates=True)
+        offset = None
+        while not stop.is_set():
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+            except RetryAfter as e:
+                await asyncio.sleep(e.timeout)
+                continue
+            except (NetworkError, TelegramAPIError) as e:
+                logger.warning("getUpdates: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.route(update.to_python())
+
+    async def stop(self, timeout: float = 30.0):
+        """Досылает очереди, закрывает stdin воркеров и ждёт их завершения."""
+        self._stopping = True
+        for worker in self.workers:
+            await worker.queue.put(None)
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for worker in self.workers:
+            if worker.process is not None and worker.process.returncode is None:
+                logger.warning("Воркер %s не завершился за %s с", worker.index, timeout)
+                worker.process.kill()
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    async def _spawn(self, worker: _Worker):
+        process = await asyncio.create_subprocess_exec(
+            *self.command(worker.index, len(self.workers)),
+            stdin=subprocess.PIPE,
+        )
+        async with worker.changed:
+            worker.process = process
+            worker.changed.notify_all()
+
+    async def _watch(self, worker: _Worker):
+        """Перезапускает воркер, если он завершился не по stop()."""
+        while True:
+            process = worker.process
+            code = await process.wait()
+            if self._stopping:
+                return
+            logger.error("Воркер %s завершился с кодом %s, перезапуск", worker.index, code)
+            await asyncio.sleep(RESTART_DELAY)
+            await self._spawn(worker)
+
+    async def _feed(self, worker: _Worker):
+        line = None
+        while True:
+            if line is None:
+                line = await worker.queue.get()
+            if line is None:
+                break
+            process = worker.process
+            try:
+                process.stdin.write(line)
+                await process.stdin.drain()
+                line = None
+            except (BrokenPipeError, ConnectionResetError):
+                # строка уйдёт перезапущенному воркеру
+                async with worker.changed:
+                    await worker.changed.wait_for(lambda: worker.process is not process)
+
+        process = worker.process
+        process.stdin.close()
+        await process.wait()
+
+
+async def _run_supervisor(workers: int):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    supervisor = Supervisor(workers)
+    await supervisor.start()
+    logger.info("Запущено воркеров: %s", workers)
+
+    bot = Bot(token=TOKEN)
+    polling = loop.create_task(supervisor.poll(bot, stop))
+    await stop.wait()
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+
+    await supervisor.stop()
+    session = await bot.get_session()
+    await session.close()
+
+
+def run(workers: int):
+    asyncio.run(_run_supervisor(workers))
+
+
+# ====== ВОРКЕР ======
+
+async def _sync_bans(last_event_id: int):
+    """
+    Применяет к ban_registry баны и разбаны, записанные другими воркерами.
+    Старые события удаляет maintenance.py.
+    """
+    while True:
+        await asyncio.sleep(BAN_SYNC_INTERVAL)
+        try:
+            for row in await async_db.get_ban_events(last_event_id):
+                last_event_id = row["id"]
+                if row["active"]:
+                    ban_registry.ban(row["tg_id"], row["reason"])
+                else:
+                    ban_registry.unban(row["tg_id"])
+        except Exception:
+            logger.exception("Не удалось синхронизировать чёрный список")
+
+
+async def serve(dp: Dispatcher, stream: asyncio.StreamReader):
+    """Обрабатывает апдейты из stream (строки JSON) до EOF, затем ждёт начатые."""
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        update = types.Update(**json.loads(line))
+        task = loop.create_task(dp.process_updates([update]))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def run_worker(index: int, count: int, prepare: typing.Callable[[Dispatcher], None] = None):
+    # main импортируется здесь: он сам импортирует supervisor
+    import main as bot_main
+    from captcha_tracker import get_tracker
+    from database import load_ban_registry, load_captcha_attempts
+
+    last_event_id = load_ban_registry()
+    dp = bot_main.create_dispatcher(workers=count)
+    if prepare is not None:
+        prepare(dp)
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+
+    tracker = get_tracker()
+    tracker.load(load_captcha_attempts(time.time() - tracker.ttl))
+
+    loop = asyncio.get_running_loop()
+    primary = HashRing(count).node_for(ADMIN_ID) == index
+    await bot_main.on_startup(
+        dp,
+        resume_broadcasts=primary,
+        maintenance=primary,
+        metrics_port=METRICS_PORT + index if METRICS_PORT else 0,
+    )
+    syncing = loop.create_task(_sync_bans(last_event_id))
+
+    stream = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(stream), sys.stdin)
+    # SIGTERM — как EOF: дообработать начатое и выйти
+    loop.add_signal_handler(signal.SIGTERM, stream.feed_eof)
+
+    try:
+        await serve(dp, stream)
+    finally:
+        syncing.cancel()
+        await bot_main.on_shutdown(dp)
+        session = await dp.bot.get_session()
+        await session.close()
+
+
+def worker_main():
+    # Ctrl+C получает вся группа процессов: воркер завершается по EOF от супервизора
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    index, count = int(sys.argv[1]), int(sys.argv[2])
+    asyncio.run(run_worker(index, count))
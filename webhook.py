@@ -0,0 +1,78 @@
+# webhook.py
+"""
+Режим webhook: aiohttp-сервер принимает апдейты от Telegram и передаёт их
+в тот же Dispatcher, что и polling (см. main.create_dispatcher).
+
+Каждый запрос проверяется по заголовку X-Telegram-Bot-Api-Secret-Token —
+Telegram присылает его, если секрет передан в setWebhook. Несколько
+экземпляров бота можно поставить за балансировщик: при остановке webhook
+не удаляется, чтобы остальные экземпляры продолжали получать апдейты.
+"""
+import hmac
+import logging
+import re
+
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler, BOT_DISPATCHER_KEY
+from aiogram.utils.executor import Executor
+
+from config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+SECRET_KEY = "WEBHOOK_SECRET"
+
+SECRET_RE = re.compile(r"^[A-Za-z0-9_-]{1,256}$")
+
+
+class SecretTokenRequestHandler(WebhookRequestHandler):
+    async def post(self):
+        expected = self.request.app[SECRET_KEY].encode()
+        received = self.request.headers.get(SECRET_HEADER, "").encode()
+        if not hmac.compare_digest(received, expected):
+            raise web.HTTPUnauthorized()
+        return await super().post()
+
+
+def build_app(dp: Dispatcher, secret: str, path: str = WEBHOOK_PATH) -> web.Application:
+    if not SECRET_RE.match(secret or ""):
+        raise ValueError("WEBHOOK_SECRET: 1–256 символов A-Z, a-z, 0-9, _ и -")
+
+    app = web.Application()
+    app[SECRET_KEY] = secret
+    app[BOT_DISPATCHER_KEY] = dp
+    app.router.add_route("*", path, SecretTokenRequestHandler, name="webhook_handler")
+    return app
+
+
+async def register_webhook(dp: Dispatcher):
+    if not WEBHOOK_HOST:
+        logger.warning("WEBHOOK_HOST не задан — webhook в Telegram не регистрируется")
+        return
+
+    url = WEBHOOK_HOST.rstrip("/") + WEBHOOK_PATH
+    await dp.bot.set_webhook(url, secret_token=WEBHOOK_SECRET)
+    logger.info("Webhook установлен: %s", url)
+
+
+def start_webhook(dp: Dispatcher, on_startup=None, on_shutdown=None):
+    app = build_app(dp, WEBHOOK_SECRET)
+
+    runner = Executor(dp)
+    runner.on_startup(register_webhook, polling=False)
+    if on_startup is not None:
+        runner.on_startup(on_startup, polling=False)
+    if on_shutdown is not None:
+        runner.on_shutdown(on_shutdown, polling=False)
+
+    # маршрут уже добавлен в build_app, поэтому путь не передаём
+    runner.set_webhook(web_app=app)
+    runner.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT)